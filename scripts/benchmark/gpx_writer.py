@@ -0,0 +1,100 @@
+"""
+Measures the throughput of GPX writing
+
+    python gpx_writer.py [--points N [N ...]] [--repeat R]
+
+Compares the former `Track.to_gpx`, that built the whole document in
+memory, with `Track.write_gpx` streaming to a file, for segments stored
+as lists of points and as columnar arrays. Results are printed as JSON.
+"""
+import os
+import json
+import time
+import tempfile
+import argparse
+
+from synthetic import synthetic_track
+
+def legacy_to_gpx(track):
+    """ Former implementation of `Track.to_gpx`, kept as a reference """
+    gpx_segments = []
+    for segment in track.segments:
+        gpx_points = []
+        for point in segment.points:
+            time_text = ''
+            if point.time:
+                iso_time = point.time.isoformat().split('.')[0]
+                time_text = '<time>%s</time>' % iso_time
+            gpx_points.append(
+                u'<trkpt lat="%f" lon="%f">%s</trkpt>' % (point.lat, point.lon, time_text)
+            )
+        points = u'\n\t\t\t'.join(gpx_points)
+        gpx_segments.append(u'\t\t<trkseg>\n\t\t\t%s\n\t\t</trkseg>' % points)
+    segments = u'\t\n'.join(gpx_segments)
+    content = [
+        u'<?xml version="1.0" encoding="UTF-8"?>',
+        u'<gpx xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns="http://www.topografix.com/GPX/1/0" xsi:schemaLocation="http://www.topografix.com/GPX/1/0 http://www.topografix.com/GPX/1/0/gpx.xsd" version="1.0" creator="GatherMySteps">',
+        u'\t<trk>',
+        segments,
+        u'\t</trk>',
+        u'</gpx>'
+    ]
+    return u'\n'.join(content)
+
+def best_time(function, repeat):
+    """ Fastest of a number of runs, in seconds """
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+    return min(times)
+
+def measure(n_points, repeat):
+    """ Measures each writer over a track
+
+    Args:
+        n_points (int): number of points of the track
+        repeat (int): runs of each writer, the fastest is kept
+    Returns:
+        :obj:`dict`: points/s of each writer
+    """
+    path = tempfile.mktemp(suffix='.gpx')
+    tracks = {
+        'points': synthetic_track(n_points),
+        'columnar': synthetic_track(n_points, columnar=True)
+    }
+
+    def legacy(track):
+        """ Former to_gpx, written to a file """
+        with open(path, 'w') as gpx_file:
+            gpx_file.write(legacy_to_gpx(track).encode('utf-8'))
+
+    def streaming(track):
+        """ write_gpx, to a file """
+        with open(path, 'w') as gpx_file:
+            track.write_gpx(gpx_file)
+
+    result = {'points': n_points}
+    try:
+        for storage, track in tracks.items():
+            for name, writer in [('to_gpx_legacy', legacy), ('write_gpx', streaming)]:
+                seconds = best_time(lambda: writer(track), repeat)
+                result['%s_%s' % (name, storage)] = n_points / seconds
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    return result
+
+def main():
+    """ Entry point """
+    parser = argparse.ArgumentParser(description='Points/s of the GPX writers')
+    parser.add_argument('--points', type=int, nargs='+', default=[10000, 100000],
+                        help='number of points of each track')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each writer')
+    args = parser.parse_args()
+    results = [measure(n_points, args.repeat) for n_points in args.points]
+    print json.dumps(results, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
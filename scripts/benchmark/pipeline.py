@@ -0,0 +1,195 @@
+"""
+Times each stage of the `Track.to_trip` pipeline, over synthetic tracks
+
+    python pipeline.py [--points N [N ...]] [--rate S] [--noise M]
+                       [--columnar] [--repeat R] [--output FILE]
+
+For every track length, a synthetic track (see `synthetic.py`) is written
+to GPX and read back, and then goes through `Track.to_trip`, whose stages
+are measured by an `instrumentation.StageRecorder`. Each run happens in a
+fresh process, so that the peak memory reported belongs to that run alone.
+Results are written as JSON, with sorted keys, so that they can be diffed
+between releases.
+"""
+import os
+import json
+import shutil
+import tempfile
+import platform
+import argparse
+import resource
+from multiprocessing import Pool
+
+import numpy
+import tracktotrip
+from tracktotrip import Track
+from tracktotrip.smooth import INVERSE_STRATEGY
+from tracktotrip.instrumentation import StageRecorder, StageMeasure, TimedCall
+
+from synthetic import synthetic_track
+
+# stages measured by the benchmark, that aren't part of `Track.to_trip`
+IO_STAGES = ('to_gpx', 'from_gpx')
+
+def peak_memory():
+    """ Peak resident memory of this process, in KB """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def n_points(track):
+    """ Number of points of a track """
+    return sum(len(segment.points) for segment in track.segments)
+
+def timed(name, stage, track, recorder):
+    """ Runs a stage that isn't part of `Track.to_trip`, such as reading the
+        track, measuring it as `Track.to_trip` measures its stages
+
+    Args:
+        name (str): stage name
+        stage (function): receives and returns a track
+        track (:obj:`Track`)
+        recorder (:obj:`StageRecorder`): receives the measure of the stage
+    Returns:
+        :obj:`Track`: the resulting track
+    """
+    points_in = n_points(track)
+    segments_in = len(track.segments)
+    result, wall, cpu = TimedCall(stage)(track)
+    recorder.on_track(StageMeasure(
+        name, track.name, None, wall, cpu,
+        points_in, n_points(result), segments_in, len(result.segments)
+    ))
+    return result
+
+def stage_json(measure):
+    """ Converts a stage measure to json, with its throughput
+
+    Args:
+        measure (:obj:`StageMeasure`)
+    Returns:
+        :obj:`dict`
+    """
+    result = measure.to_json()
+    result['points_per_second'] = measure.points_in / measure.wall if measure.wall > 0 else None
+    return result
+
+def run(config):
+    """ Benchmarks one track length
+
+    Args:
+        config ((int, :obj:`argparse.Namespace`)): number of points and arguments
+    Returns:
+        :obj:`dict`
+    """
+    size, args = config
+    track = synthetic_track(size, rate=args.rate, noise=args.noise, seed=args.seed)
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, track.name)
+    recorder = StageRecorder()
+
+    try:
+        def write(track):
+            """ Writes the track to a GPX file """
+            with open(path, 'w') as gpx_file:
+                gpx_file.write(track.to_gpx().encode('utf-8'))
+            return track
+
+        def read(_):
+            """ Reads the track back """
+            track = Track.from_gpx(path)[0]
+            if args.columnar:
+                for segment in track.segments:
+                    segment.to_columnar()
+            return track
+
+        track = timed('to_gpx', write, track, recorder)
+        track = timed('from_gpx', read, track, recorder)
+    finally:
+        shutil.rmtree(directory)
+
+    track.to_trip(
+        True, INVERSE_STRATEGY, args.smooth_noise,
+        True, args.seg_eps, args.seg_min_time,
+        True, args.simplify_max_dist_error, args.simplify_max_speed_error,
+        instrumentation=recorder
+    )
+
+    pipeline = [measure for measure in recorder.tracks if measure.stage not in IO_STAGES]
+    wall = sum(measure.wall for measure in pipeline)
+
+    return {
+        'points': size,
+        'stages': [stage_json(measure) for measure in recorder.tracks],
+        'totals': recorder.totals(),
+        'to_trip': {
+            'wall': wall,
+            'cpu': sum(measure.cpu for measure in pipeline),
+            'points_per_second': size / wall if wall > 0 else None
+        },
+        'peak_memory_kb': peak_memory()
+    }
+
+def benchmark(args):
+    """ Benchmarks every track length, repeatedly
+
+    Args:
+        args (:obj:`argparse.Namespace`)
+    Returns:
+        :obj:`dict`
+    """
+    pool = Pool(1, maxtasksperchild=1)
+    runs = []
+    try:
+        for size in args.points:
+            for repeat in range(args.repeat):
+                result = pool.apply(run, ((size, args),))
+                result['repeat'] = repeat
+                runs.append(result)
+    finally:
+        pool.close()
+        pool.join()
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': numpy.__version__,
+            'platform': platform.platform(),
+            'tracktotrip': os.path.dirname(tracktotrip.__file__)
+        },
+        'parameters': dict(
+            (key, value) for key, value in vars(args).items() if key != 'output'
+        ),
+        'runs': runs
+    }
+
+def main():
+    """ Entry point """
+    parser = argparse.ArgumentParser(description='Times each stage of Track.to_trip')
+    parser.add_argument('--points', type=int, nargs='+', default=[3600, 14400, 86400],
+                        help='number of points of each track')
+    parser.add_argument('--rate', type=float, default=1.0, help='seconds between samples')
+    parser.add_argument('--noise', type=float, default=5.0, help='position noise, in meters')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--columnar', action='store_true', help='use columnar segments')
+    parser.add_argument('--repeat', type=int, default=1, help='runs of each track length')
+    parser.add_argument('--smooth-noise', type=float, default=1000)
+    parser.add_argument('--seg-eps', type=float, default=0.15)
+    parser.add_argument('--seg-min-time', type=float, default=80)
+    parser.add_argument('--simplify-max-dist-error', type=float, default=2.0)
+    parser.add_argument('--simplify-max-speed-error', type=float, default=1.0)
+    parser.add_argument('--output', default='pipeline.json', help='JSON output file')
+    args = parser.parse_args()
+
+    result = benchmark(args)
+    with open(args.output, 'w') as output:
+        json.dump(result, output, indent=2, sort_keys=True)
+
+    for run_result in result['runs']:
+        print '%7d points: %8.3fs, %10.1f points/s, %d KB' % (
+            run_result['points'],
+            run_result['to_trip']['wall'],
+            run_result['to_trip']['points_per_second'] or 0,
+            run_result['peak_memory_kb']
+        )
+
+if __name__ == '__main__':
+    main()
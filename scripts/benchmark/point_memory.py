@@ -0,0 +1,102 @@
+"""
+Measures the memory used by each point, for the different point storages
+
+    python point_memory.py [--points N]
+
+Compares the former `Point` layout (per instance `__dict__` and a
+`datetime`), the compact `Point` and the columnar `PointArray`.
+"""
+import sys
+import json
+import argparse
+from datetime import datetime, timedelta
+
+from tracktotrip import Point
+from tracktotrip.columnar import PointArray
+
+class DictPoint(object):
+    """ Former layout of `Point`, kept as a reference """
+    #pylint: disable=too-few-public-methods,invalid-name
+    def __init__(self, lat, lon, time):
+        self.lon = lon
+        self.lat = lat
+        self.time = time
+        self.dt = .0
+        self.dx = .0
+        self.acc = .0
+        self.vel = .0
+
+def computed(point, i):
+    """ Sets metrics to distinct values, as compute_metrics does """
+    point.dt = 1.0 + i
+    point.dx = 2.0 + i
+    point.vel = 3.0 + i
+    point.acc = 4.0 + i
+    return point
+
+def deep_size(obj, seen):
+    """ Size of an object and of the objects it refers to, counted once
+
+    Args:
+        obj: Object to measure
+        seen (set): Ids of the objects already measured
+    Returns:
+        int: bytes
+    """
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+
+    if hasattr(obj, '__dict__'):
+        size += deep_size(obj.__dict__, seen)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_size(key, seen) + deep_size(value, seen)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            size += deep_size(value, seen)
+    for name in getattr(type(obj), '__slots__', ()):
+        if hasattr(obj, name):
+            size += deep_size(getattr(obj, name), seen)
+    return size
+
+def measure(n_points):
+    """ Measures the bytes per point of each storage
+
+    Args:
+        n_points (int)
+    Returns:
+        :obj:`dict`
+    """
+    start = datetime(2016, 7, 15)
+    samples = [
+        (38.7 + i * 1e-5, -9.1 - i * 1e-5, start + timedelta(seconds=i))
+        for i in range(n_points)
+    ]
+
+    dict_points = [computed(DictPoint(*sample), i) for i, sample in enumerate(samples)]
+    points = [computed(Point(*sample), i) for i, sample in enumerate(samples)]
+    array = PointArray.from_points(points)
+
+    # shared constants, such as the attribute names, are not counted
+    names = set(id(name) for name in ('lat', 'lon', 'time', 'dt', 'dx', 'acc', 'vel'))
+    array_size = sys.getsizeof(array) + sum(
+        column.nbytes for column in array.__dict__.values()
+    )
+    return {
+        'points': n_points,
+        'dict_point': deep_size(dict_points, set(names)) / float(n_points),
+        'slots_point': deep_size(points, set(names)) / float(n_points),
+        'point_array': array_size / float(n_points)
+    }
+
+def main():
+    """ Entry point """
+    parser = argparse.ArgumentParser(description='Bytes per point of each point storage')
+    parser.add_argument('--points', type=int, default=86400, help='number of points')
+    args = parser.parse_args()
+    print json.dumps(measure(args.points), indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
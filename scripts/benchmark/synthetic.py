@@ -0,0 +1,72 @@
+"""
+Synthetic track generators, for benchmarking
+
+Tracks alternate between moving, with a slowly changing heading, and
+staying still, so that every stage of `Track.to_trip` has work to do.
+Every other stay isn't recorded, as when a device is turned off.
+Gaussian noise is added to every sample. Generation is seeded, so the
+same arguments always give the same track.
+"""
+from datetime import datetime
+import numpy as np
+
+from tracktotrip import Track, Segment
+from tracktotrip.point import ONE_DEGREE, to_timestamp
+
+START = datetime(2016, 7, 15, 8, 0, 0)
+
+#pylint: disable=too-many-arguments,too-many-locals
+def synthetic_arrays(n_points, rate=1.0, noise=5.0, speed=10.0,
+                     stay_every=1800, stay_duration=600, seed=0):
+    """ Creates the coordinates and times of a synthetic track
+
+    Args:
+        n_points (int): number of samples
+        rate (float, optional): seconds between two samples. Defaults to 1
+        noise (float, optional): standard deviation of the position noise, in
+            meters. Defaults to 5
+        speed (float, optional): speed while moving, in m/s. Defaults to 10
+        stay_every (float, optional): seconds moving before each stay.
+            Defaults to 1800
+        stay_duration (float, optional): seconds of each stay. Defaults to 600
+        seed (int, optional): random seed. Defaults to 0
+    Returns:
+        (:obj:`numpy.ndarray`, :obj:`numpy.ndarray`, :obj:`numpy.ndarray`):
+            latitudes, longitudes and seconds since epoch
+    """
+    rand = np.random.RandomState(seed)
+    # every other stay isn't recorded, leaving a time gap, so twice the
+    # samples are generated before dropping them
+    size = 2 * n_points
+    elapsed = np.arange(size) * float(rate)
+    moving = np.mod(elapsed, stay_every + stay_duration) < stay_every
+    recorded = moving | (np.floor_divide(elapsed, stay_every + stay_duration) % 2 == 0)
+
+    heading = np.cumsum(rand.normal(0, 0.05, size))
+    step = np.where(moving, speed * rate, 0.)
+    north = np.cumsum(step * np.cos(heading))[recorded][:n_points]
+    east = np.cumsum(step * np.sin(heading))[recorded][:n_points]
+    timestamps = to_timestamp(START) + elapsed[recorded][:n_points]
+
+    lats = 38.7 + (north + rand.normal(0, noise, n_points)) / ONE_DEGREE
+    lons = -9.1 + (east + rand.normal(0, noise, n_points)) / \
+        (ONE_DEGREE * np.cos(lats / 180. * np.pi))
+    return lats, lons, timestamps
+
+def synthetic_track(n_points, columnar=False, **kwargs):
+    """ Creates a synthetic track, with one segment
+
+    See `synthetic_arrays`
+
+    Args:
+        n_points (int): number of samples
+        columnar (bool, optional): True to store the points in columnar arrays.
+            Defaults to False
+        **kwargs: see `synthetic_arrays`
+    Returns:
+        :obj:`Track`
+    """
+    segment = Segment.from_arrays(*synthetic_arrays(n_points, **kwargs))
+    if not columnar:
+        segment.to_points()
+    return Track('synthetic_%d.gpx' % n_points, [segment])
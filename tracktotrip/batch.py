@@ -0,0 +1,160 @@
+"""
+Batch processing of tracks
+
+Runs `Track.to_trip` over many tracks, or GPX files, using a pool of
+processes. Points travel between processes as one float64 array per
+segment, instead of pickled `Point` objects.
+"""
+import traceback
+from multiprocessing import Pool
+
+import numpy as np
+
+from .track import Track
+from .segment import Segment
+from .columnar import PointArray, COLUMNS
+
+# columns sent to the workers, the metrics are computed there
+INPUT_COLUMNS = ('lat', 'lon', 'timestamp')
+
+def pack_track(track, columns=COLUMNS):
+    """ Converts a track to a compact, picklable, form
+
+    Args:
+        track (:obj:`Track`)
+        columns (:obj:`tuple` of str, optional): point attributes to keep,
+            see `columnar.COLUMNS`. Defaults to every attribute. If the
+            metrics are kept, outdated ones are computed first
+    Returns:
+        (str, :obj:`list` of :obj:`numpy.ndarray`, :obj:`list`, :obj:`list`):
+            name of the track, for each segment an array with a row per
+            column, the track meta information and, for each segment, its
+            transportation modes, and start and end locations
+    """
+    metrics = set(columns) == set(COLUMNS)
+    segments = []
+    annotations = []
+    for segment in track.segments:
+        if metrics:
+            segment.compute_metrics()
+        points = PointArray.from_points(segment.points)
+        segments.append(np.vstack([getattr(points, name) for name in columns]))
+        annotations.append(
+            (segment.transportation_modes, segment.location_from, segment.location_to)
+        )
+    return track.name, segments, track.meta, annotations
+
+def unpack_track(packed, columns=COLUMNS, columnar=False):
+    """ Creates a track from its compact form
+
+    See `pack_track`
+
+    Args:
+        packed ((str, :obj:`list` of :obj:`numpy.ndarray`, :obj:`list`, :obj:`list`))
+        columns (:obj:`tuple` of str, optional): point attributes packed.
+            Defaults to every attribute. If the metrics were packed, they
+            aren't computed again, see `Segment.validate_metrics`
+        columnar (bool, optional): True to keep the points in columnar
+            arrays. Defaults to False
+    Returns:
+        :obj:`Track`
+    """
+    name, arrays, meta, annotations = packed
+    segments = []
+    for array, (modes, location_from, location_to) in zip(arrays, annotations):
+        points = PointArray(**dict(zip(columns, array)))
+        segment = Segment(points)
+        if set(columns) == set(COLUMNS):
+            segment.validate_metrics()
+        if not columnar:
+            segment.to_points()
+        segment.transportation_modes = modes
+        segment.location_from = location_from
+        segment.location_to = location_to
+        segments.append(segment)
+    track = Track(name, segments)
+    track.meta = meta
+    return track
+
+class BatchResult(object):
+    """ Result of processing one of the sources of a batch
+
+    Attributes:
+        index (int): position of the source in the batch
+        source (str): file path, or track name, of the source
+        tracks (:obj:`list` of :obj:`Track`): processed tracks. A GPX file
+            may hold more than one track. None if processing failed
+        error (str): Error message and traceback, None if processing succeeded
+    """
+    def __init__(self, index, source, tracks=None, error=None):
+        self.index = index
+        self.source = source
+        self.tracks = tracks
+        self.error = error
+
+    @property
+    def ok(self): #pylint: disable=invalid-name
+        """ bool: True if the source was processed """
+        return self.error is None
+
+def to_trip_job(job):
+    """ Processes one source, in a worker process
+
+    Args:
+        job ((int, str or tuple, :obj:`dict`)): position of the source, the
+            source, as a file path or a packed track, and `Track.to_trip`
+            keyword arguments
+    Returns:
+        (int, str, :obj:`list`, str): position, source name, packed tracks
+            and error
+    """
+    index, source, params = job
+    name = source if isinstance(source, basestring) else source[0]
+    try:
+        if isinstance(source, basestring):
+            tracks = Track.from_gpx(source)
+        else:
+            tracks = [unpack_track(source, INPUT_COLUMNS)]
+
+        packed = [pack_track(track.to_trip(**params)) for track in tracks]
+        return index, name, packed, None
+    except Exception: #pylint: disable=broad-except
+        return index, name, None, traceback.format_exc()
+
+def to_trip_batch(sources, params, processes=None, chunksize=1, columnar=False):
+    """ Transforms many tracks into trips, in parallel
+
+    Sources are processed by a pool of processes, and results are yielded
+    as soon as they're ready, so not in the order of the sources. A
+    source that fails doesn't stop the others, its result holds the error.
+
+    Args:
+        sources (:obj:`list` of str or :obj:`Track`): GPX file paths, or tracks
+        params (:obj:`dict`): keyword arguments of `Track.to_trip`
+        processes (int, optional): number of worker processes. Defaults to
+            None, the number of CPUs
+        chunksize (int, optional): number of sources sent to a worker at once.
+            Defaults to 1
+        columnar (bool, optional): True to return tracks with columnar
+            segments. Defaults to False
+    Returns:
+        :obj:`generator` of :obj:`BatchResult`
+    """
+    def jobs():
+        """ Jobs sent to the workers """
+        for index, source in enumerate(sources):
+            if isinstance(source, Track):
+                source = pack_track(source, INPUT_COLUMNS)
+            yield index, source, params
+
+    pool = Pool(processes)
+    try:
+        for index, name, packed, error in pool.imap_unordered(to_trip_job, jobs(), chunksize):
+            tracks = None
+            if packed is not None:
+                tracks = [unpack_track(track, columnar=columnar) for track in packed]
+            yield BatchResult(index, name, tracks, error)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
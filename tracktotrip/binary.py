@@ -0,0 +1,153 @@
+"""
+Binary track format
+
+A track is stored in a single file, made of:
+    - a preamble: magic bytes, format version and header length
+    - a JSON header: track name and meta, columns stored, and for each
+      segment its offset and length, transportation modes and locations
+    - the columns: one little endian float64 array per column, with the
+      points of every segment, aligned to 8 bytes
+
+Columns are memory mapped when loading, so opening a file takes the same
+time regardless of its size, and only the pages of the points used are
+read from disk.
+"""
+import json
+import struct
+
+import numpy as np
+
+from .segment import Segment
+from .location import Location
+from .columnar import PointArray, COLUMNS
+
+BINARY_EXTENSION = '.ttb'
+MAGIC = b'TTTB'
+VERSION = 1
+PREAMBLE = struct.Struct('<4sIQ')
+# columns always stored, the rest are the metrics
+POSITION_COLUMNS = ('lat', 'lon', 'timestamp')
+
+def data_offset(header_length):
+    """ Offset of the columns, after the preamble and header, aligned to 8 bytes
+
+    Args:
+        header_length (int): header length, in bytes
+    Returns:
+        int
+    """
+    end = PREAMBLE.size + header_length
+    return end + (-end % 8)
+
+def write_segments(file_path, name, meta, segments, metrics=True):
+    """ Writes a track, given its segments, in binary format
+
+    Args:
+        file_path (str): path of the file to write
+        name (str): track name
+        meta (:obj:`list`): track meta information, JSON serializable
+        segments (:obj:`list` of :obj:`Segment`)
+        metrics (bool, optional): True to also store the metrics of the
+            points, see `Segment.compute_metrics`. Outdated metrics are
+            computed first. Defaults to True
+    """
+    columns = COLUMNS if metrics else POSITION_COLUMNS
+    if metrics:
+        for segment in segments:
+            segment.compute_metrics()
+    arrays = [PointArray.from_points(segment.points) for segment in segments]
+
+    offset = 0
+    segments_header = []
+    for segment, points in zip(segments, arrays):
+        segments_header.append({
+            'offset': offset,
+            'length': len(points),
+            'transportationModes': segment.transportation_modes,
+            'locationFrom': segment.location_from.to_json()
+                            if segment.location_from is not None else None,
+            'locationTo': segment.location_to.to_json()
+                          if segment.location_to is not None else None
+        })
+        offset = offset + len(points)
+
+    header = json.dumps({
+        'name': name,
+        'meta': meta,
+        'columns': list(columns),
+        'points': offset,
+        'segments': segments_header
+    }).encode('utf-8')
+
+    with open(file_path, 'wb') as output:
+        output.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        output.write(header)
+        output.write(b'\0' * (data_offset(len(header)) - PREAMBLE.size - len(header)))
+        for column in columns:
+            for points in arrays:
+                output.write(getattr(points, column).astype('<f8').tobytes())
+
+def read_header(file_path):
+    """ Reads the header of a binary track
+
+    Args:
+        file_path (str): path of the file to read
+    Returns:
+        (:obj:`dict`, int): header and offset of the columns
+    """
+    with open(file_path, 'rb') as source:
+        magic, version, header_length = PREAMBLE.unpack(source.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError('%s is not a binary track' % file_path)
+        if version > VERSION:
+            raise ValueError('%s has an unsupported version: %d' % (file_path, version))
+        header = json.loads(source.read(header_length).decode('utf-8'))
+    return header, data_offset(header_length)
+
+def read_segments(file_path, columnar=True):
+    """ Reads a track, stored in binary format
+
+    The columns are memory mapped copy-on-write: changes to the points
+    are kept in memory, and never written to the file.
+
+    Args:
+        file_path (str): path of the file to read
+        columnar (bool, optional): True to keep the points in the memory
+            mapped columns, False to read them into a list of `Point`.
+            Defaults to True
+    Returns:
+        (str, :obj:`list`, :obj:`list` of :obj:`Segment`): track name, meta
+            and segments
+    """
+    header, offset = read_header(file_path)
+    columns = header['columns']
+    if header['points'] > 0:
+        data = np.memmap(
+            file_path, dtype='<f8', mode='c', offset=offset,
+            shape=(len(columns), header['points'])
+        )
+    else:
+        data = np.zeros((len(columns), 0))
+
+    segments = []
+    for segment_header in header['segments']:
+        start = segment_header['offset']
+        end = start + segment_header['length']
+        points = PointArray(**dict(
+            (column, data[i, start:end]) for i, column in enumerate(columns)
+        ))
+
+        segment = Segment(points)
+        if set(columns) == set(COLUMNS):
+            segment.validate_metrics()
+        if not columnar:
+            segment.to_points()
+
+        segment.transportation_modes = segment_header['transportationModes']
+        if segment_header['locationFrom'] is not None:
+            segment.location_from = Location.from_json(segment_header['locationFrom'])
+        if segment_header['locationTo'] is not None:
+            segment.location_to = Location.from_json(segment_header['locationTo'])
+        segments.append(segment)
+
+    return header['name'], header['meta'], segments
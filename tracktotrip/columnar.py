@@ -0,0 +1,180 @@
+"""
+Columnar point storage
+
+Points are kept in contiguous float64 arrays, one per attribute, instead of
+a list of `Point` objects. `Point`-like views are created on demand, so code
+written against `segment.points[i]` keeps working, while pipeline stages can
+operate over whole arrays.
+"""
+import numpy as np
+from .point import Point
+
+COLUMNS = ('lat', 'lon', 'timestamp', 'dt', 'dx', 'vel', 'acc')
+
+def _column_property(name):
+    """ Creates a property that reads and writes a column of the backing array
+
+    Args:
+        name (str): Column name
+    Returns:
+        property
+    """
+    def getter(self):
+        return float(getattr(self.array, name)[self.index])
+
+    def setter(self, value):
+        getattr(self.array, name)[self.index] = np.nan if value is None else value
+
+    return property(getter, setter)
+
+class PointView(Point):
+    """ View over one row of a `PointArray`
+
+    Behaves like a `Point`, reading and writing directly from the
+    columns of the array it belongs to. Unknown times are stored as NaN.
+
+    Attributes:
+        array (:obj:`PointArray`): Backing array
+        index (int): Row of the backing array
+    """
+    __slots__ = ('array', 'index')
+
+    #pylint: disable=super-init-not-called
+    def __init__(self, array, index):
+        self.array = array
+        self.index = index
+
+    lat = _column_property('lat')
+    lon = _column_property('lon')
+    timestamp = _column_property('timestamp')
+    dt = _column_property('dt') #pylint: disable=invalid-name
+    dx = _column_property('dx') #pylint: disable=invalid-name
+    vel = _column_property('vel')
+    acc = _column_property('acc')
+
+    def __reduce__(self):
+        return (PointView, (self.array, self.index))
+
+    def __eq__(self, other):
+        if isinstance(other, PointView):
+            return self.array is other.array and self.index == other.index
+        return self is other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((id(self.array), self.index))
+
+class PointArray(object):
+    """ Columnar, NumPy backed, sequence of points
+
+    Supports the read-only list operations used over `Segment.points`:
+    `len`, iteration, indexing (returning a `PointView`), slicing (returning
+    a new `PointArray`) and item assignment from any `Point`.
+
+    Attributes:
+        lat (:obj:`numpy.ndarray`): latitudes
+        lon (:obj:`numpy.ndarray`): longitudes
+        timestamp (:obj:`numpy.ndarray`): seconds since epoch, NaN if unknown
+        dt (:obj:`numpy.ndarray`): time differences, see `Point.compute_metrics`
+        dx (:obj:`numpy.ndarray`): distances, see `Point.compute_metrics`
+        vel (:obj:`numpy.ndarray`): velocities, see `Point.compute_metrics`
+        acc (:obj:`numpy.ndarray`): accelerations, see `Point.compute_metrics`
+    """
+    #pylint: disable=too-many-arguments,invalid-name
+    def __init__(self, lat, lon, timestamp, dt=None, dx=None, vel=None, acc=None):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.timestamp = np.asarray(timestamp, dtype=np.float64)
+
+        size = len(self.lat)
+        self.dt = np.zeros(size) if dt is None else np.asarray(dt, dtype=np.float64)
+        self.dx = np.zeros(size) if dx is None else np.asarray(dx, dtype=np.float64)
+        self.vel = np.zeros(size) if vel is None else np.asarray(vel, dtype=np.float64)
+        self.acc = np.zeros(size) if acc is None else np.asarray(acc, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.lat)
+
+    def __iter__(self):
+        for i in range(len(self.lat)):
+            yield PointView(self, i)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.take(np.arange(len(self.lat))[key])
+
+        size = len(self.lat)
+        if key < 0:
+            key = key + size
+        if key < 0 or key >= size:
+            raise IndexError('point index out of range')
+        return PointView(self, key)
+
+    def __setitem__(self, key, point):
+        for name in COLUMNS:
+            value = getattr(point, name)
+            getattr(self, name)[key] = np.nan if value is None else value
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def take(self, indexes):
+        """ Creates a new array with the rows at the given indexes
+
+        Args:
+            indexes (:obj:`list` of int or :obj:`numpy.ndarray`): Indexes,
+                or boolean mask, of the rows to take
+        Returns:
+            :obj:`PointArray`
+        """
+        indexes = np.asarray(indexes)
+        if indexes.dtype != np.bool_:
+            indexes = indexes.astype(np.intp)
+        return PointArray(*[getattr(self, name)[indexes] for name in COLUMNS])
+
+    def to_points(self):
+        """ Converts to a list of detached points
+
+        Returns:
+            :obj:`list` of :obj:`Point`
+        """
+        points = []
+        for i in range(len(self.lat)):
+            timestamp = float(self.timestamp[i])
+            point = Point(
+                float(self.lat[i]),
+                float(self.lon[i]),
+                None if timestamp != timestamp else timestamp
+            )
+            point.dt = float(self.dt[i])
+            point.dx = float(self.dx[i])
+            point.vel = float(self.vel[i])
+            point.acc = float(self.acc[i])
+            points.append(point)
+        return points
+
+    @staticmethod
+    def from_points(points):
+        """ Creates a columnar array from a sequence of points
+
+        Args:
+            points (:obj:`list` of :obj:`Point`)
+        Returns:
+            :obj:`PointArray`
+        """
+        if isinstance(points, PointArray):
+            return points
+        return PointArray(
+            [point.lat for point in points],
+            [point.lon for point in points],
+            [point.timestamp for point in points],
+            [point.dt for point in points],
+            [point.dx for point in points],
+            [point.vel for point in points],
+            [point.acc for point in points]
+        )
@@ -5,13 +5,15 @@ There are two distinct types:
     - topology based, such as douglas ramer peucker
     - time based, which are represented by td_sp, td_tr and the combination of both, spt
 """
-import sys
 from math import sqrt
-from .point import Point
+import numpy as np
+from .columnar import PointArray
+from .metrics import distances
 
-# All of the compression methods require recursion.
-# Tracks with a huge number of points the default recursion limit (1000) could be a problem
-sys.setrecursionlimit(10000)
+DRP_STRATEGY = 'drp'
+SPT_STRATEGY = 'spt'
+TD_SP_STRATEGY = 'td_sp'
+TD_TR_STRATEGY = 'td_tr'
 
 I_3600 = 1 / 3600.0
 
@@ -72,111 +74,382 @@ def point_line_distance(point, start, end):
         else:
             return un_dist / n_dist
 
+def coordinates(points):
+    """ Latitude and longitude arrays of a set of points
+
+    Args:
+        points (:obj:`list` of :obj:`Point` or :obj:`PointArray`)
+    Returns:
+        (:obj:`numpy.ndarray`, :obj:`numpy.ndarray`): latitudes and longitudes
+    """
+    if isinstance(points, PointArray):
+        return points.lat, points.lon
+    lats = np.array([point.lat for point in points], dtype=np.float64)
+    lons = np.array([point.lon for point in points], dtype=np.float64)
+    return lats, lons
+
+def drp_indexes(lats, lons, epsilon):
+    """ Douglas ramer peucker, over arrays
+
+    Iterative version of the algorithm, working over index ranges. The
+    distances of each range's points to its line are computed at once,
+    see `point_line_distance`
+
+    Args:
+        lats (:obj:`numpy.ndarray`): latitudes
+        lons (:obj:`numpy.ndarray`): longitudes
+        epsilon (float): drp threshold
+    Returns:
+        :obj:`numpy.ndarray` of int: indexes of the points to keep
+    """
+    size = len(lats)
+    keep = np.zeros(size, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    ranges = [(0, size - 1)]
+    while len(ranges) > 0:
+        start, end = ranges.pop()
+        if end - start < 2:
+            continue
+
+        start_lat = lats[start]
+        start_lon = lons[start]
+        d_lat = lats[end] - start_lat
+        d_lon = lons[end] - start_lon
+        n_dist = sqrt(d_lat**2 + d_lon**2)
+        if n_dist == 0:
+            continue
+
+        inner = slice(start + 1, end)
+        dists = np.abs(
+            d_lat*(start_lon - lons[inner]) - (start_lat - lats[inner])*d_lon
+        ) / n_dist
+
+        index = np.argmax(dists)
+        if dists[index] > epsilon:
+            index = start + 1 + index
+            keep[index] = True
+            ranges.append((index, end))
+            ranges.append((start, index))
+
+    return np.flatnonzero(keep)
+
 def drp(points, epsilon):
     """ Douglas ramer peucker
 
     Based on https://en.wikipedia.org/wiki/Ramer%E2%80%93Douglas%E2%80%93Peucker_algorithm
 
+    See `drp_indexes`
+
     Args:
-        points (:obj:`list` of :obj:`Point`)
+        points (:obj:`list` of :obj:`Point` or :obj:`PointArray`)
         epsilon (float): drp threshold
     Returns:
         :obj:`list` of :obj:`Point`
     """
-    dmax = 0.0
-    index = 0
+    if len(points) < 3:
+        return [points[0], points[-1]]
 
-    for i in range(1, len(points)-1):
-        dist = point_line_distance(points[i], points[0], points[-1])
-        if dist > dmax:
-            index = i
-            dmax = dist
+    lats, lons = coordinates(points)
+    return [points[i] for i in drp_indexes(lats, lons, epsilon)]
 
-    if dmax > epsilon:
-        return drp(points[:index+1], epsilon)[:-1] + drp(points[index:], epsilon)
-    else:
-        return [points[0], points[-1]]
+def coordinates_and_times(points):
+    """ Latitude, longitude and timestamp arrays of a set of points
+
+    Args:
+        points (:obj:`list` of :obj:`Point` or :obj:`PointArray`)
+    Returns:
+        (:obj:`numpy.ndarray`, :obj:`numpy.ndarray`, :obj:`numpy.ndarray`):
+            latitudes, longitudes and timestamps
+    """
+    lats, lons = coordinates(points)
+    if isinstance(points, PointArray):
+        return lats, lons, points.timestamp
+    timestamps = np.array([point.timestamp for point in points], dtype=np.float64)
+    return lats, lons, timestamps
+
+def speeds(lats, lons, timestamps):
+    """ Speed between each pair of consecutive points
+
+    Simultaneous points are considered to be 0.000000001 seconds apart
+
+    Args:
+        lats (:obj:`numpy.ndarray`): latitudes
+        lons (:obj:`numpy.ndarray`): longitudes
+        timestamps (:obj:`numpy.ndarray`): seconds since epoch
+    Returns:
+        :obj:`numpy.ndarray`: the ith value is the speed between the ith
+            and the (i+1)th point
+    """
+    delta_t = np.abs(timestamps[1:] - timestamps[:-1])
+    delta_t[delta_t == 0] = 0.000000001
+    return distances(lats[1:], lons[1:], lats[:-1], lons[:-1]) / delta_t
+
+def speed_errors(lats, lons, timestamps, max_speed_error):
+    """ Checks which points have a speed change bigger than allowed
+
+    Args:
+        lats (:obj:`numpy.ndarray`): latitudes
+        lons (:obj:`numpy.ndarray`): longitudes
+        timestamps (:obj:`numpy.ndarray`): seconds since epoch
+        max_speed_error (float): max speed error, in km/h
+    Returns:
+        :obj:`numpy.ndarray` of bool: True if the speed before and after
+            the point differ more than allowed. The first and last points
+            are always False
+    """
+    errors = np.zeros(len(lats), dtype=bool)
+    if len(lats) > 2:
+        speed = speeds(lats, lons, timestamps)
+        errors[1:-1] = np.abs(speed[1:] - speed[:-1]) > max_speed_error
+    return errors
+
+def top_down_indexes(size, find_split):
+    """ Top-down compression, over index ranges
+
+    Splits ranges of points in two, starting with the whole trajectory,
+    until ranges have no point worth keeping. A range is split before the
+    point found, which becomes the start of the second range.
+
+    Args:
+        size (int): number of points
+        find_split (function): receives the start and end (inclusive) of a
+            range, with at least three points, and returns the index of
+            the point to split at, or None to keep just the range's ends
+    Returns:
+        :obj:`numpy.ndarray` of int: indexes of the points to keep
+    """
+    kept = []
+    ranges = [(0, size - 1)]
+    while len(ranges) > 0:
+        start, end = ranges.pop()
+        if end - start < 2:
+            kept.extend(range(start, end + 1))
+            continue
+
+        index = find_split(start, end)
+        if index is None:
+            kept.append(start)
+            kept.append(end)
+        else:
+            ranges.append((index, end))
+            ranges.append((start, index - 1))
+    return np.array(kept, dtype=np.intp)
+
+def td_sp_indexes(lats, lons, timestamps, speed_threshold):
+    """ Top-Down Speed-Based Trajectory Compression Algorithm, over arrays
+
+    See `td_sp`
+
+    Args:
+        lats (:obj:`numpy.ndarray`): latitudes
+        lons (:obj:`numpy.ndarray`): longitudes
+        timestamps (:obj:`numpy.ndarray`): seconds since epoch
+        speed_threshold (float): max speed error, in km/h
+    Returns:
+        :obj:`numpy.ndarray` of int: indexes of the points to keep
+    """
+    # speed changes don't depend on the range, so they're computed once
+    changes = np.zeros(len(lats))
+    if len(lats) > 2:
+        speed = speeds(lats, lons, timestamps)
+        changes[1:-1] = np.abs(speed[1:] - speed[:-1])
+
+    def find_split(start, end):
+        """ Point with the biggest speed change """
+        index = start + 1 + np.argmax(changes[start + 1:end])
+        if changes[index] > speed_threshold and changes[index] > 0:
+            return index
+        return None
+
+    return top_down_indexes(len(lats), find_split)
 
 def td_sp(points, speed_threshold):
     """ Top-Down Speed-Based Trajectory Compression Algorithm
 
     Detailed in https://www.itc.nl/library/Papers_2003/peer_ref_conf/meratnia_new.pdf
 
+    See `td_sp_indexes`
+
     Args:
-        points (:obj:`list` of :obj:`Point`): trajectory or part of it
+        points (:obj:`list` of :obj:`Point` or :obj:`PointArray`): trajectory
         speed_threshold (float): max speed error, in km/h
     Returns:
         :obj:`list` of :obj:`Point`, compressed trajectory
     """
     if len(points) <= 2:
         return points
-    else:
-        max_speed_threshold = 0
-        found_index = 0
-        for i in range(1, len(points)-1):
-            dt1 = time_dist(points[i], points[i-1])
-            if dt1 == 0:
-                dt1 = 0.000000001
-            vim = loc_dist(points[i], points[i-1]) / dt1
-            dt2 = time_dist(points[i+1], points[i])
-            if dt2 == 0:
-                dt2 = 0.000000001
-            vi_ = loc_dist(points[i+1], points[i]) / dt2
-            if abs(vi_ - vim) > max_speed_threshold:
-                max_speed_threshold = abs(vi_ - vim)
-                found_index = i
-        if max_speed_threshold > speed_threshold:
-            one = td_sp(points[:found_index], speed_threshold)
-            two = td_sp(points[found_index:], speed_threshold)
-            one.extend(two)
-            return one
+
+    lats, lons, timestamps = coordinates_and_times(points)
+    return [points[i] for i in td_sp_indexes(lats, lons, timestamps, speed_threshold)]
+
+def td_tr_indexes(lats, lons, timestamps, dist_threshold):
+    """ Top-Down Time-Ratio Trajectory Compression Algorithm, over arrays
+
+    See `td_tr`
+
+    Args:
+        lats (:obj:`numpy.ndarray`): latitudes
+        lons (:obj:`numpy.ndarray`): longitudes
+        timestamps (:obj:`numpy.ndarray`): seconds since epoch
+        dist_threshold (float): max distance error, in meters
+    Returns:
+        :obj:`numpy.ndarray` of int: indexes of the points to keep
+    """
+    def find_split(start, end):
+        """ Point farthest from its time synchronized position """
+        inner = slice(start + 1, end)
+        delta_e = abs(timestamps[end] - timestamps[start]) * I_3600
+        if delta_e == 0:
+            di_de = np.zeros(end - start - 1)
         else:
-            return [points[0], points[-1]]
+            di_de = np.abs(timestamps[inner] - timestamps[start]) * I_3600 / delta_e
+
+        dists = distances(
+            lats[inner], lons[inner],
+            lats[start] + (lats[end] - lats[start]) * di_de,
+            lons[start] + (lons[end] - lons[start]) * di_de
+        )
+        index = np.argmax(dists)
+        if dists[index] > dist_threshold and dists[index] > 0:
+            return start + 1 + index
+        return None
+
+    return top_down_indexes(len(lats), find_split)
 
 def td_tr(points, dist_threshold):
     """ Top-Down Time-Ratio Trajectory Compression Algorithm
 
     Detailed in https://www.itc.nl/library/Papers_2003/peer_ref_conf/meratnia_new.pdf
 
+    See `td_tr_indexes`
+
     Args:
-        points (:obj:`list` of :obj:`Point`): trajectory or part of it
+        points (:obj:`list` of :obj:`Point` or :obj:`PointArray`): trajectory
         dist_threshold (float): max distance error, in meters
     Returns:
         :obj:`list` of :obj:`Point`, compressed trajectory
     """
     if len(points) <= 2:
         return points
-    else:
-        max_dist_threshold = 0
-        found_index = 0
-        delta_e = time_dist(points[-1], points[0]) * I_3600
-        d_lat = points[-1].lat - points[0].lat
-        d_lon = points[-1].lon - points[0].lon
-
-        for i in range(1, len(points)-1):
-            delta_i = time_dist(points[i], points[0]) * I_3600
-
-            di_de = delta_i / delta_e
-            point = Point(
-                points[0].lat + d_lat * di_de,
-                points[0].lon + d_lon * di_de,
-                None
-            )
 
-            dist = loc_dist(points[i], point)
-            if dist > max_dist_threshold:
-                max_dist_threshold = dist
-                found_index = i
+    lats, lons, timestamps = coordinates_and_times(points)
+    return [points[i] for i in td_tr_indexes(lats, lons, timestamps, dist_threshold)]
+
+# Max number of distances computed at once, when looking for an error
+SPT_BLOCK_SIZE = 1 << 16
+# Half of the number of window ends first checked at once
+SPT_FIRST_ENDS = 2
+# Max number of points between two kept points
+SPT_MAX_WINDOW = 512
 
-        if max_dist_threshold > dist_threshold:
-            one = td_tr(points[:found_index], dist_threshold)
-            two = td_tr(points[found_index:], dist_threshold)
-            one.extend(two)
-            return one
+#pylint: disable=too-many-arguments,too-many-locals
+def spt_first_error(lats, lons, timestamps, bad_speed, max_dist_error, first_end, last_end):
+    """ Finds the first error of an opening window, anchored at the first point
+
+    For each window end, from `first_end` to `last_end`, checks if any point
+    inside the window is too far from its time synchronized position, or
+    has a speed error. All ends are checked at once.
+
+    Args:
+        lats (:obj:`numpy.ndarray`): latitudes
+        lons (:obj:`numpy.ndarray`): longitudes
+        timestamps (:obj:`numpy.ndarray`): seconds since epoch
+        bad_speed (:obj:`numpy.ndarray` of bool): speed errors, see `speed_errors`
+        max_dist_error (float): max distance error, in meters
+        first_end (int): first window end to check, at least 2
+        last_end (int): last window end to check
+    Returns:
+        (int, int): end of the window and index of the first point with an
+            error, or None if there are no errors
+    """
+    ends = np.arange(first_end, last_end + 1)
+    inner = slice(1, last_end)
+
+    delta_e = np.abs(timestamps[ends] - timestamps[0]) * I_3600
+    delta_i = np.abs(timestamps[inner] - timestamps[0]) * I_3600
+    safe_e = np.where(delta_e != 0, delta_e, 1.)
+    di_de = np.where(
+        (delta_e != 0)[:, np.newaxis],
+        delta_i[np.newaxis, :] / safe_e[:, np.newaxis],
+        0.
+    )
+
+    sync_lat = lats[0] + (lats[ends] - lats[0])[:, np.newaxis] * di_de
+    sync_lon = lons[0] + (lons[ends] - lons[0])[:, np.newaxis] * di_de
+    errors = distances(
+        lats[inner][np.newaxis, :], lons[inner][np.newaxis, :], sync_lat, sync_lon
+    ) > max_dist_error
+    errors |= bad_speed[inner][np.newaxis, :]
+    # only the points before the end of each window count
+    errors &= np.arange(1, last_end)[np.newaxis, :] < ends[:, np.newaxis]
+
+    with_errors = errors.any(axis=1)
+    if not with_errors.any():
+        return None
+    row = np.argmax(with_errors)
+    return ends[row], np.argmax(errors[row]) + 1
+
+def spt_indexes(lats, lons, timestamps, max_dist_error, max_speed_error,
+                max_window=SPT_MAX_WINDOW):
+    """ A combination of both `td_sp` and `td_tr`, over arrays
+
+    See `spt`
+
+    Args:
+        lats (:obj:`numpy.ndarray`): latitudes
+        lons (:obj:`numpy.ndarray`): longitudes
+        timestamps (:obj:`numpy.ndarray`): seconds since epoch
+        max_dist_error (float): max distance error, in meters
+        max_speed_error (float): max speed error, in km/h
+        max_window (int, optional): Max number of points spanned by two
+            consecutive kept points. None for no limit. Defaults to SPT_MAX_WINDOW
+    Returns:
+        :obj:`numpy.ndarray` of int: indexes of the points to keep
+    """
+    size = len(lats)
+    bad_speed = speed_errors(lats, lons, timestamps, max_speed_error)
+
+    kept = []
+    anchor = 0
+    while size - anchor > 2:
+        window_end = size - 1
+        if max_window is not None:
+            window_end = min(window_end, anchor + max(max_window, 3) - 1)
+
+        kept.append(anchor)
+        if bad_speed[anchor + 1]:
+            # the smallest window already has an error
+            anchor = anchor + 1
+            continue
+
+        found = None
+        first_end = anchor + 2
+        n_ends = SPT_FIRST_ENDS
+        while found is None and first_end <= window_end:
+            # windows are usually short, so the number of ends checked at
+            # once starts small and doubles, limited by the size of the window
+            n_ends = min(2 * n_ends, max(1, SPT_BLOCK_SIZE // (first_end - anchor)))
+            last_end = min(window_end, first_end + n_ends - 1)
+            window = slice(anchor, last_end + 1)
+            found = spt_first_error(
+                lats[window], lons[window], timestamps[window], bad_speed[window],
+                max_dist_error, first_end - anchor, last_end - anchor
+            )
+            first_end = last_end + 1
+
+        if found is not None:
+            anchor = anchor + found[1]
+        elif window_end == size - 1:
+            anchor = size - 1
+            break
         else:
-            return [points[0], points[-1]]
+            anchor = window_end
+
+    kept.extend(range(anchor, size))
+    return np.array(kept, dtype=np.intp)
 
-def spt(points, max_dist_error, max_speed_error):
+def spt(points, max_dist_error, max_speed_error, max_window=SPT_MAX_WINDOW):
     """ A combination of both `td_sp` and `td_tr`
 
     Detailed in,
@@ -186,51 +459,132 @@ def spt(points, max_dist_error, max_speed_error):
         International Conference on Extending Database Technology,
         Heraklion, Crete, Greece, March 14-18, 2004
 
+    Starting at a kept point, an opening window grows until one of the
+    points inside it is too far from its time synchronized position in the
+    window's line, or changes speed more than allowed. That point is then
+    kept and becomes the start of the next window. Windows are limited to
+    `max_window` points, which bounds the running time per point.
+
+    See `spt_indexes`
+
     Args:
-        points (:obj:`list` of :obj:`Point`)
+        points (:obj:`list` of :obj:`Point` or :obj:`PointArray`)
         max_dist_error (float): max distance error, in meters
         max_speed_error (float): max speed error, in km/h
+        max_window (int, optional): Max number of points spanned by two
+            consecutive kept points. None for no limit. Defaults to SPT_MAX_WINDOW
     Returns:
         :obj:`list` of :obj:`Point`
     """
     if len(points) <= 2:
         return points
-    else:
-        is_error = False
-        e = 1
-        while e < len(points) and not is_error:
-            i = 1
-            while i < e and not is_error:
-                delta_e = time_dist(points[e], points[0]) * I_3600
-                delta_i = time_dist(points[i], points[0]) * I_3600
-
-                di_de = 0
-                if delta_e != 0:
-                    di_de = delta_i / delta_e
-                d_lat = points[e].lat - points[0].lat
-                d_lon = points[e].lon - points[0].lon
-                point = Point(
-                    points[0].lat + d_lat * di_de,
-                    points[0].lon + d_lon * di_de,
-                    None
-                )
-
-                dt1 = time_dist(points[i], points[i-1])
-                if dt1 == 0:
-                    dt1 = 0.000000001
-                dt2 = time_dist(points[i+1], points[i])
-                if dt2 == 0:
-                    dt2 = 0.000000001
-
-                v_i_1 = loc_dist(points[i], points[i-1]) / dt1
-                v_i = loc_dist(points[i+1], points[i]) / dt2
-
-                if loc_dist(points[i], point) > max_dist_error or abs(v_i - v_i_1) > max_speed_error:
-                    is_error = True
-                else:
-                    i = i + 1
-            if is_error:
-                return [points[0]] + spt(points[i:len(points)], max_dist_error, max_speed_error)
-            e = e + 1
-        if not is_error:
-            return [points[0], points[len(points)-1]]
+
+    lats, lons, timestamps = coordinates_and_times(points)
+    indexes = spt_indexes(
+        lats, lons, timestamps, max_dist_error, max_speed_error, max_window
+    )
+    return [points[i] for i in indexes]
+
+class OnlineSPT(object):
+    """ Incremental version of `spt`, for streams of points
+
+    Points are pushed one at a time, and kept points are returned as soon
+    as they are final. Only the current opening window is held in memory.
+    Once the stream is flushed, the points returned are the same as the
+    ones returned by `spt` over the whole stream.
+
+    Attributes:
+        max_dist_error (float): max distance error, in meters
+        max_speed_error (float): max speed error, in km/h
+        max_window (int): Max number of points spanned by two consecutive
+            kept points. None for no limit
+    """
+    def __init__(self, max_dist_error, max_speed_error, max_window=SPT_MAX_WINDOW):
+        self.max_dist_error = max_dist_error
+        self.max_speed_error = max_speed_error
+        self.max_window = None if max_window is None else max(max_window, 3)
+
+        # opening window, starting at the last kept point
+        self.points = []
+        self.lats = []
+        self.lons = []
+        self.timestamps = []
+        self.bad_speed = []
+        # speed between the last two points of the window
+        self.last_speed = None
+
+    def __len__(self):
+        return len(self.points)
+
+    def push(self, point):
+        """ Adds a point to the end of the stream
+
+        Args:
+            point (:obj:`Point`)
+        Returns:
+            :obj:`list` of :obj:`Point`: points that are now known to be kept
+        """
+        if len(self.points) > 0:
+            speed = float(distances(
+                point.lat, point.lon, self.lats[-1], self.lons[-1]
+            )) / (abs(point.timestamp - self.timestamps[-1]) or 0.000000001)
+            if self.last_speed is not None:
+                self.bad_speed[-1] = abs(speed - self.last_speed) > self.max_speed_error
+            self.last_speed = speed
+
+        self.points.append(point)
+        self.lats.append(point.lat)
+        self.lons.append(point.lon)
+        self.timestamps.append(point.timestamp)
+        self.bad_speed.append(False)
+
+        if len(self.points) == 1:
+            return [point]
+
+        kept = []
+        last_end = len(self.points) - 1
+        first_end = last_end
+        while last_end >= 2:
+            found = spt_first_error(
+                np.array(self.lats), np.array(self.lons),
+                np.array(self.timestamps, dtype=np.float64), np.array(self.bad_speed),
+                self.max_dist_error, max(first_end, 2), last_end
+            )
+            if found is None:
+                if self.max_window is None or last_end < self.max_window - 1:
+                    break
+                # the window is full, its end starts the next one
+                index = last_end
+            else:
+                index = found[1]
+
+            self._start_at(index)
+            kept.append(self.points[0])
+            # the remaining ends were only checked against the former start
+            last_end = len(self.points) - 1
+            first_end = 2
+        return kept
+
+    def _start_at(self, index):
+        """ Starts the opening window at one of its points
+
+        Args:
+            index (int): Index, in the window, of its new start
+        """
+        del self.points[:index]
+        del self.lats[:index]
+        del self.lons[:index]
+        del self.timestamps[:index]
+        del self.bad_speed[:index]
+        if len(self.points) < 2:
+            self.last_speed = None
+
+    def flush(self):
+        """ Ends the stream
+
+        Returns:
+            :obj:`list` of :obj:`Point`: remaining kept points
+        """
+        kept = self.points[-1:] if len(self.points) > 1 else []
+        self._start_at(len(self.points))
+        return kept
@@ -0,0 +1,260 @@
+"""
+Streaming GPX reader
+
+Reads track points straight into segments, or columnar arrays, as the
+file is parsed, without building a GPX object tree. Elements are dropped
+as soon as they are read, so memory holds little more than the points.
+Only tracks are read, as in `Track.from_gpx`.
+"""
+import calendar
+from array import array
+from datetime import datetime
+
+try:
+    from xml.etree.cElementTree import iterparse
+except ImportError:
+    from xml.etree.ElementTree import iterparse
+
+import numpy as np
+
+from .point import Point
+from .segment import Segment
+from .columnar import PointArray
+
+# seconds since epoch of the start of each day seen
+_DAYS = {}
+
+def day_timestamp(text):
+    """ Seconds since epoch of the start of a day
+
+    Args:
+        text (str): date, formated as YYYY-MM-DD
+    Returns:
+        int
+    """
+    timestamp = _DAYS.get(text)
+    if timestamp is None:
+        timestamp = calendar.timegm(datetime.strptime(text, '%Y-%m-%d').timetuple())
+        _DAYS[text] = timestamp
+    return timestamp
+
+def parse_time(text):
+    """ Converts an ISO 8601 time to seconds since epoch
+
+    Handles times as written in GPX files, such as 2016-07-15T08:00:00Z,
+    with optional fractions of seconds and UTC offsets. Times without an
+    offset are considered to be UTC.
+
+    Args:
+        text (str): time
+    Returns:
+        float: seconds since epoch
+    """
+    text = text.strip()
+    try:
+        timestamp = day_timestamp(text[:10]) + \
+            int(text[11:13]) * 3600 + int(text[14:16]) * 60 + int(text[17:19])
+
+        zone = 19
+        if text[19:20] == '.':
+            zone = 20
+            while zone < len(text) and text[zone].isdigit():
+                zone = zone + 1
+            timestamp = timestamp + float(text[19:zone])
+
+        offset = text[zone:].replace(':', '')
+        if offset and offset != 'Z':
+            sign = -1 if offset[0] == '-' else 1
+            timestamp = timestamp - sign * (int(offset[1:3]) * 3600 + int(offset[3:5] or 0) * 60)
+    except (ValueError, IndexError):
+        raise ValueError('Invalid time: %s' % text)
+    return float(timestamp)
+
+def local_name(tag):
+    """ Tag name without its namespace """
+    return tag[tag.rfind('}') + 1:]
+
+def make_segment(lats, lons, timestamps, columnar):
+    """ Creates a segment from coordinate and time arrays
+
+    Args:
+        lats (:obj:`array.array`)
+        lons (:obj:`array.array`)
+        timestamps (:obj:`array.array`): NaN for unknown times
+        columnar (bool): True to keep the points in columnar arrays
+    Returns:
+        :obj:`Segment`
+    """
+    if columnar:
+        return Segment(PointArray(
+            np.frombuffer(lats, dtype=np.float64).copy(),
+            np.frombuffer(lons, dtype=np.float64).copy(),
+            np.frombuffer(timestamps, dtype=np.float64).copy()
+        ))
+    return Segment([
+        Point(lat, lon, None if timestamp != timestamp else timestamp)
+        for lat, lon, timestamp in zip(lats, lons, timestamps)
+    ])
+
+#pylint: disable=too-many-branches
+def parse_tracks(source, columnar):
+    """ Parses the tracks of a GPX file, one segment at a time
+
+    Args:
+        source (str or file): file path, or file object, of the GPX file
+        columnar (bool): True to create columnar segments
+    Yields:
+        (int, :obj:`Segment`): index of the track and one of its segments.
+            The segment is None at the end of each track
+    """
+    track = -1
+    parents = []
+    in_point = False
+    time = None
+    lats = lons = timestamps = None
+
+    for event, elem in iterparse(source, events=('start', 'end')):
+        tag = local_name(elem.tag)
+        if event == 'start':
+            parents.append(elem)
+            if tag == 'trkpt':
+                in_point = True
+                time = None
+            elif tag == 'trkseg':
+                lats = array('d')
+                lons = array('d')
+                timestamps = array('d')
+            elif tag == 'trk':
+                track = track + 1
+            continue
+
+        parents.pop()
+        if tag == 'time':
+            if in_point:
+                time = elem.text
+        elif tag == 'trkpt':
+            in_point = False
+            lats.append(float(elem.get('lat')))
+            lons.append(float(elem.get('lon')))
+            timestamps.append(parse_time(time) if time else np.nan)
+        elif tag == 'trkseg':
+            yield track, make_segment(lats, lons, timestamps, columnar)
+            lats = lons = timestamps = None
+        elif tag == 'trk':
+            yield track, None
+
+        if tag in ('trkpt', 'trkseg', 'trk') and len(parents) > 0:
+            # parsed elements aren't needed anymore
+            parents[-1].remove(elem)
+
+def iter_segments(source, columnar=False):
+    """ Reads the segments of a GPX file, one at a time
+
+    Args:
+        source (str or file): file path, or file object, of the GPX file
+        columnar (bool, optional): True to create columnar segments, see
+            `Segment.to_columnar`. Defaults to False
+    Yields:
+        (int, :obj:`Segment`): index of the track the segment belongs to,
+            and the segment
+    """
+    for track, segment in parse_tracks(source, columnar):
+        if segment is not None:
+            yield track, segment
+
+def read_segments(source, columnar=False):
+    """ Reads the segments of each track of a GPX file
+
+    See `iter_segments`
+
+    Args:
+        source (str or file): file path, or file object, of the GPX file
+        columnar (bool, optional): True to create columnar segments.
+            Defaults to False
+    Returns:
+        :obj:`list` of :obj:`list` of :obj:`Segment`: segments of each track
+    """
+    tracks = [[]]
+    for _, segment in parse_tracks(source, columnar):
+        if segment is None:
+            tracks.append([])
+        else:
+            tracks[-1].append(segment)
+    return tracks[:-1]
+
+GPX_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<gpx xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns="http://www.topografix.com/GPX/1/0" xsi:schemaLocation="http://www.topografix.com/GPX/1/0 http://www.topografix.com/GPX/1/0/gpx.xsd" version="1.0" creator="GatherMySteps">\n'
+    '\t<trk>\n'
+)
+GPX_FOOTER = '\n\t</trk>\n</gpx>'
+# number of points formated before writing them
+WRITE_CHUNK_SIZE = 4096
+
+def format_times(timestamps):
+    """ Formats times as in a GPX file, without fractions of seconds
+
+    Args:
+        timestamps (:obj:`numpy.ndarray`): seconds since epoch, NaN if unknown
+    Returns:
+        :obj:`list` of str: such as 2016-07-15T08:00:00, or None for
+            unknown times
+    """
+    known = timestamps == timestamps
+    # rounded to microseconds first, as datetimes are
+    seconds = np.floor(np.round(np.where(known, timestamps, 0) * 1e6) / 1e6)
+    texts = np.datetime_as_string(seconds.astype('datetime64[s]')).tolist()
+    if not known.all():
+        texts = [text if is_known else None for text, is_known in zip(texts, known)]
+    return texts
+
+def point_columns(points):
+    """ Latitudes, longitudes and formated times of a set of points
+
+    Args:
+        points (:obj:`list` of :obj:`Point` or :obj:`PointArray`)
+    Returns:
+        (:obj:`list`, :obj:`list`, :obj:`list`): unknown times are None, see
+            `format_times`
+    """
+    if isinstance(points, PointArray):
+        return points.lat.tolist(), points.lon.tolist(), format_times(points.timestamp)
+    timestamps = np.array([
+        np.nan if point.timestamp is None else point.timestamp for point in points
+    ], dtype=np.float64)
+    return (
+        [point.lat for point in points],
+        [point.lon for point in points],
+        format_times(timestamps)
+    )
+
+def write_gpx(fileobj, segments, chunk_size=WRITE_CHUNK_SIZE):
+    """ Writes segments to a GPX file, as a single track
+
+    Points are written in chunks, so the document is never fully in
+    memory. The output is the same as `Track.to_gpx`
+
+    Args:
+        fileobj (file): file-like object to write to
+        segments (:obj:`list` of :obj:`Segment`)
+        chunk_size (int, optional): number of points written at once.
+            Defaults to WRITE_CHUNK_SIZE
+    """
+    fileobj.write(GPX_HEADER)
+    for i, segment in enumerate(segments):
+        fileobj.write('\t\n\t\t<trkseg>\n\t\t\t' if i > 0 else '\t\t<trkseg>\n\t\t\t')
+
+        lats, lons, times = point_columns(segment.points)
+        for start in range(0, len(lats), chunk_size):
+            end = start + chunk_size
+            chunk = [
+                '<trkpt lat="%f" lon="%f"><time>%s</time></trkpt>' % (lat, lon, time)
+                if time is not None else '<trkpt lat="%f" lon="%f"></trkpt>' % (lat, lon)
+                for lat, lon, time in zip(lats[start:end], lons[start:end], times[start:end])
+            ]
+            if start > 0:
+                fileobj.write('\n\t\t\t')
+            fileobj.write('\n\t\t\t'.join(chunk))
+
+        fileobj.write('\n\t\t</trkseg>')
+    fileobj.write(GPX_FOOTER)
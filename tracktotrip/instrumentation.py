@@ -0,0 +1,197 @@
+"""
+Instrumentation of track processing stages
+
+`Track` methods, such as `Track.to_trip`, accept an optional
+`Instrumentation` object, that receives a `StageMeasure` for every
+segment processed and one for the whole track, for each stage.
+When no instrumentation is given nothing is measured.
+"""
+import os
+import time
+
+def cpu_time():
+    """ CPU time used by the process, user and system, in seconds
+
+    Returns:
+        float
+    """
+    times = os.times()
+    return times[0] + times[1]
+
+class StageMeasure(object):
+    """ Measures of a stage, over a segment or a whole track
+
+    Attributes:
+        stage (str): stage name, such as 'smooth' or 'simplify'
+        track (str): name of the track
+        segment (int): index of the segment in the track, before the stage.
+            None if the measure is of the whole track
+        wall (float): elapsed time, in seconds
+        cpu (float): CPU time, in seconds. Includes other threads of the
+            process, when segments are processed by a thread pool
+        points_in (int): number of points before the stage
+        points_out (int): number of points after the stage
+        segments_in (int): number of segments before the stage
+        segments_out (int): number of segments after the stage
+    """
+    __slots__ = (
+        'stage', 'track', 'segment', 'wall', 'cpu',
+        'points_in', 'points_out', 'segments_in', 'segments_out'
+    )
+
+    #pylint: disable=too-many-arguments
+    def __init__(self, stage, track, segment, wall, cpu,
+                 points_in, points_out, segments_in, segments_out):
+        self.stage = stage
+        self.track = track
+        self.segment = segment
+        self.wall = wall
+        self.cpu = cpu
+        self.points_in = points_in
+        self.points_out = points_out
+        self.segments_in = segments_in
+        self.segments_out = segments_out
+
+    def to_json(self):
+        """ Converts to json
+
+        Returns:
+            :obj:`dict`
+        """
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+class Instrumentation(object):
+    """ Receives the measures of processing stages
+
+    Does nothing with them, override `on_segment` and `on_track` to use them
+    """
+    def on_segment(self, measure):
+        """ Called after a stage processes a segment
+
+        Args:
+            measure (:obj:`StageMeasure`)
+        """
+        pass
+
+    def on_track(self, measure):
+        """ Called after a stage processes every segment of a track
+
+        Args:
+            measure (:obj:`StageMeasure`)
+        """
+        pass
+
+class StageRecorder(Instrumentation):
+    """ Keeps every measure received
+
+    Attributes:
+        segments (:obj:`list` of :obj:`StageMeasure`): segment measures
+        tracks (:obj:`list` of :obj:`StageMeasure`): track measures
+    """
+    def __init__(self):
+        self.segments = []
+        self.tracks = []
+
+    def on_segment(self, measure):
+        self.segments.append(measure)
+
+    def on_track(self, measure):
+        self.tracks.append(measure)
+
+    def totals(self):
+        """ Sums the track measures of each stage
+
+        Returns:
+            :obj:`dict`: for each stage, a dict with the total wall and cpu
+                times and the number of times the stage ran
+        """
+        result = {}
+        for measure in self.tracks:
+            total = result.setdefault(measure.stage, {'wall': 0., 'cpu': 0., 'runs': 0})
+            total['wall'] += measure.wall
+            total['cpu'] += measure.cpu
+            total['runs'] += 1
+        return result
+
+def count_points(segments):
+    """ Number of points of a list of segments
+
+    Args:
+        segments (:obj:`list` of :obj:`Segment`)
+    Returns:
+        int
+    """
+    return sum(len(segment.points) for segment in segments)
+
+class TimedCall(object):
+    """ Wraps a function, measuring its calls
+
+    Picklable if the function is, so that it can be sent to other processes
+
+    Attributes:
+        function (function): function to call
+    """
+    def __init__(self, function):
+        self.function = function
+
+    def __call__(self, *args):
+        """ Calls the function
+
+        Returns:
+            (:obj:`object`, float, float): result of the function, elapsed
+                time and CPU time, in seconds
+        """
+        wall = time.time()
+        cpu = cpu_time()
+        result = self.function(*args)
+        return result, time.time() - wall, cpu_time() - cpu
+
+def as_list(output):
+    """ Result of a stage as a list of segments """
+    return output if isinstance(output, list) else [output]
+
+#pylint: disable=too-many-arguments,too-many-locals
+def map_segments(stage, track_name, segments, function, instrumentation=None, executor=None):
+    """ Applies a stage to each segment
+
+    Args:
+        stage (str): stage name
+        track_name (str): name of the track the segments belong to
+        segments (:obj:`list` of :obj:`Segment`)
+        function (function): receives a segment and returns the resulting
+            segment, or a list of segments
+        instrumentation (:obj:`Instrumentation`, optional): receives the
+            measures of the stage. Defaults to None, to measure nothing
+        executor (optional): Runs the function over the segments concurrently,
+            through its `map` method, such as a `multiprocessing.Pool`.
+            Results are kept in the order of the segments. Smoothing and
+            simplification spend most of their time holding the GIL, in the
+            kalman filter and in small NumPy operations, so they only run
+            concurrently in a pool of processes. Defaults to None, to run
+            them one after the other
+    Returns:
+        :obj:`list` of :obj:`Segment`
+    """
+    mapper = map if executor is None else executor.map
+    result = []
+    if instrumentation is None:
+        for output in mapper(function, segments):
+            result.extend(as_list(output))
+        return result
+
+    points_in = [len(segment.points) for segment in segments]
+    track_wall = time.time()
+    track_cpu = cpu_time()
+    for i, (output, wall, cpu) in enumerate(mapper(TimedCall(function), segments)):
+        output = as_list(output)
+        result.extend(output)
+        instrumentation.on_segment(StageMeasure(
+            stage, track_name, i, wall, cpu,
+            points_in[i], count_points(output), 1, len(output)
+        ))
+
+    instrumentation.on_track(StageMeasure(
+        stage, track_name, None, time.time() - track_wall, cpu_time() - track_cpu,
+        sum(points_in), count_points(result), len(segments), len(result)
+    ))
+    return result
@@ -1,8 +1,229 @@
 """
 Learns trips
 """
+import math
 import numpy as np
-from .similarity import segment_similarity
+from rtree import index
+from .similarity import thresholded_segment_similarity
+
+# similarity from which two trips are the same
+SIMILARITY_THRESHOLD = 0.7
+# margin, in degrees, added to the bounds of canonical trips
+DEFAULT_SLACK = 0.001
+# size, in degrees, of the cells the endpoints of canonical trips are in
+DEFAULT_CELL_SIZE = 0.01
+
+class CanonicalIndex(object):
+    """ Index of canonical trips, that finds the ones that may be the same
+        trip as another, before their similarity is computed
+
+    A canonical trip is a candidate if its bounds, see `Segment.bounds`,
+    intersect the ones of the trip, both with a slack. Trips whose bounds
+    don't intersect have no edges close to each other, so their similarity
+    is 0, as long as the slack covers the distance threshold of the
+    similarity, see `candidates`
+
+    If `endpoints` is True, a canonical trip must also start and end in cells
+    close to the ones where the trip starts and ends, in either direction.
+    Cells are close if they're within the slack of each other, and at least
+    if they're neighbours. This prunes more, but drops canonical trips that
+    only contain the trip, or that are contained by it, even if they're
+    similar
+
+    Attributes:
+        slack (float): Margin added to the bounds, and between endpoint
+            cells, in degrees
+        cell_size (float): Size of the endpoint cells, in degrees
+        endpoints (bool): True to also match the endpoint cells. Defaults
+            to False
+        queries (int): number of calls to `candidates`
+        considered (int): number of canonical trips indexed, over all queries
+        matched (int): number of candidates given, over all queries
+    """
+    def __init__(self, slack=DEFAULT_SLACK, cell_size=DEFAULT_CELL_SIZE, endpoints=False):
+        self.slack = slack
+        self.cell_size = cell_size
+        self.endpoints = endpoints
+        self.queries = 0
+        self.considered = 0
+        self.matched = 0
+        self._tree = index.Index()
+        self._trips = {}
+        self._keys = {}
+        self._next_key = 0
+        self._starts = {}
+        self._ends = {}
+
+    def __len__(self):
+        return len(self._trips)
+
+    def cell(self, point):
+        """ Cell of a point
+
+        Args:
+            point (:obj:`Point`)
+        Returns:
+            (int, int)
+        """
+        return (
+            int(math.floor(point.lat / self.cell_size)),
+            int(math.floor(point.lon / self.cell_size))
+        )
+
+    def near_cells(self, point):
+        """ Cells close to the one of a point
+
+        Args:
+            point (:obj:`Point`)
+        Returns:
+            :obj:`list` of (int, int)
+        """
+        reach = max(int(math.ceil(self.slack / self.cell_size)), 1)
+        lat, lon = self.cell(point)
+        return [
+            (lat + i, lon + j)
+            for i in range(-reach, reach + 1)
+            for j in range(-reach, reach + 1)
+        ]
+
+    def bounds(self, trip, slack=None):
+        """ Bounds of a trip, with the slack
+
+        Args:
+            trip (:obj:`Segment`)
+            slack (float, optional): Margin, in degrees. Defaults to the slack
+                of the index
+        Returns:
+            (float, float, float, float): min lat, min lon, max lat and max lon
+        """
+        if slack is None:
+            slack = self.slack
+        return trip.bounds(slack, upper_index=len(trip.points))
+
+    def insert(self, trip_id, trip):
+        """ Adds a canonical trip, or replaces the one with the same id
+
+        Args:
+            trip_id: Id of the canonical trip
+            trip (:obj:`Segment`)
+        Returns:
+            :obj:`CanonicalIndex`: self
+        """
+        self.remove(trip_id)
+        if len(trip.points) == 0:
+            return self
+
+        key = self._next_key
+        self._next_key += 1
+        bounds = self.bounds(trip)
+        start = self.cell(trip.points[0])
+        end = self.cell(trip.points[-1])
+
+        self._tree.insert(key, bounds)
+        self._trips[trip_id] = (key, trip, bounds, (start, end))
+        self._keys[key] = trip_id
+        self._starts.setdefault(start, set()).add(key)
+        self._ends.setdefault(end, set()).add(key)
+        return self
+
+    def update(self, trip_id, trip):
+        """ Updates a canonical trip whose points changed, see `insert`
+
+        Args:
+            trip_id: Id of the canonical trip
+            trip (:obj:`Segment`)
+        Returns:
+            :obj:`CanonicalIndex`: self
+        """
+        return self.insert(trip_id, trip)
+
+    def remove(self, trip_id):
+        """ Removes a canonical trip, if it's indexed
+
+        Args:
+            trip_id: Id of the canonical trip
+        Returns:
+            :obj:`CanonicalIndex`: self
+        """
+        if trip_id not in self._trips:
+            return self
+
+        key, _, bounds, (start, end) = self._trips.pop(trip_id)
+        del self._keys[key]
+        self._tree.delete(key, bounds)
+        for cells, cell in [(self._starts, start), (self._ends, end)]:
+            cells[cell].discard(key)
+            if len(cells[cell]) == 0:
+                del cells[cell]
+        return self
+
+    def near_endpoint(self, cells, point):
+        """ Keys of the canonical trips with an endpoint close to a point
+
+        Args:
+            cells (:obj:`dict`): keys by cell, of the starts or of the ends
+            point (:obj:`Point`)
+        Returns:
+            :obj:`set` of int
+        """
+        keys = set()
+        for cell in self.near_cells(point):
+            keys.update(cells.get(cell, ()))
+        return keys
+
+    def candidates(self, trip, distance_thr=0):
+        """ Canonical trips that may be the same trip
+
+        Args:
+            trip (:obj:`Segment`)
+            distance_thr (float, optional): Distance threshold of the
+                similarity, see `segment_similarity`. The bounds of the trip
+                are widened so that no canonical trip with edges within it
+                is dropped, even if it's bigger than the slack. Defaults to 0
+        Returns:
+            :obj:`list` of (trip id, :obj:`Segment`): in insertion order
+        """
+        self.queries += 1
+        self.considered += len(self._trips)
+        if len(trip.points) == 0:
+            return []
+
+        # edges are close if their boxes, widened by distance_thr, intersect
+        slack = max(self.slack, 2 * distance_thr - self.slack)
+        keys = set(self._tree.intersection(self.bounds(trip, slack)))
+        if self.endpoints and len(keys) > 0:
+            start, end = trip.points[0], trip.points[-1]
+            same_way = self.near_endpoint(self._starts, start) & \
+                self.near_endpoint(self._ends, end)
+            other_way = self.near_endpoint(self._starts, end) & \
+                self.near_endpoint(self._ends, start)
+            keys &= same_way | other_way
+
+        self.matched += len(keys)
+        return [(self._keys[key], self._trips[self._keys[key]][1]) for key in sorted(keys)]
+
+    @property
+    def prune_ratio(self):
+        """ float: ratio of the canonical trips that weren't candidates, over
+            all queries """
+        if self.considered == 0:
+            return 0.
+        return 1. - self.matched / float(self.considered)
+
+    def stats(self):
+        """ Counters of the index
+
+        Returns:
+            :obj:`dict`: with the size, queries, considered and matched trips,
+                and the prune ratio
+        """
+        return {
+            'size': len(self),
+            'queries': self.queries,
+            'considered': self.considered,
+            'matched': self.matched,
+            'pruneRatio': self.prune_ratio
+        }
 
 def complete_trip(canonical_trips, from_point, to_point, distance_thr):
     """ Completes a trip based on set of canonical trips
@@ -48,44 +269,64 @@ def learn_trip(current, current_id, canonical_trips, insert_canonical, update_ca
     Args:
         current (:obj:`Track`): current trip
         current_id (int): current trip (db) id
-        canonical_trips (:obj:`list` of :obj:`Track`): list of canonical trips
+        canonical_trips (:obj:`list` of :obj:`Track` or :obj:`CanonicalIndex`):
+            list of canonical trips, or an index of them. With an index only
+            the candidates are compared, and the index is kept up to date
         insert_canonical: Function to insert a new canonical trip, with the
-            signature: (:obj:`Track`, int) -> void
+            signature: (:obj:`Track`, int) -> void. If it returns an id, it's
+            the one used to index the trip, otherwise current_id is used
         update_canonical: Function to update an existing canonical trip, with
             the signature: (int, :obj:`Track`, int) -> void
     """
+    canonical_index = None
+    if isinstance(canonical_trips, CanonicalIndex):
+        canonical_index = canonical_trips
+        canonical_trips = canonical_index.candidates(current, distance_thr)
 
-    if len(canonical_trips) == 0:
+    def insert():
+        """ Inserts the current trip as a new canonical trip """
         current.simplify(eps, 0, 0, topology_only=True)
         print("inserting trip %d" % len(current.points))
-        insert_canonical(current, current_id)
-    else:
-        canonical_trips_a = [
-            (trip_id, trip, segment_similarity(trip, current,  T=distance_thr))
-            for trip_id, trip in canonical_trips
-            ]
-        canonical_trips_b = [
-            (trip_id, trip, segment_similarity(current, trip, T=distance_thr))
-            for trip_id, trip in canonical_trips
-            ]
+        trip_id = insert_canonical(current, current_id)
+        if canonical_index is not None:
+            canonical_index.insert(current_id if trip_id is None else trip_id, current)
+
+    def similarity_to(trip):
+        """ Similarity with the current trip, in both directions. Hopeless
+            trips aren't scored in full, and get an upper bound of their
+            similarity, below the threshold. Trips that reach it get their
+            similarity """
+        return [
+            thresholded_segment_similarity(
+                one, other, SIMILARITY_THRESHOLD, T=distance_thr, accept_early=False
+            )[1][1]
+            for one, other in [(trip, current), (current, trip)]
+        ]
 
-        canonical_trips = []
-        for i in range(len(canonical_trips_a)):
-            ct_a = canonical_trips_a[i]
-            ct_b = canonical_trips_b[i]
-            canonical_trips.append(ct_a if ct_a[2][0] > ct_b[2][0] else ct_b)
+    canonical_trips = [
+        (trip_id, trip, similarity_to(trip)) for trip_id, trip in canonical_trips
+    ]
+    canonical_trips = [
+        (trip_id, trip, max(similarities)) for trip_id, trip, similarities in canonical_trips
+        if max(similarities) >= SIMILARITY_THRESHOLD
+    ]
 
-        canonical_trips = list(reversed(sorted(canonical_trips, key=lambda t: t[2][0])))
+    if len(canonical_trips) == 0:
+        insert()
+    else:
+        canonical_trips = list(reversed(sorted(canonical_trips, key=lambda t: t[2])))
 
-        trip_id, trip, (similarity, _) = canonical_trips[0]
+        trip_id, trip, similarity = canonical_trips[0]
 
         print "similarity = %f" % similarity
 
-        if similarity >= 0.7:
+        if similarity >= SIMILARITY_THRESHOLD:
             # Same trip, fit all segments
             trip.merge_and_fit(current)#, diffs)
             trip.simplify(eps, 0, 0, topology_only=True)
             update_canonical(trip_id, trip, current_id)
+            if canonical_index is not None:
+                canonical_index.update(trip_id, trip)
             print("updating trip %d" % len(current.points))
 
         # elif similarity >= 0.3:
@@ -102,6 +343,4 @@ def learn_trip(current, current_id, canonical_trips, insert_canonical, update_ca
 
         else:
             # Insert new canonical representation
-            current.simplify(eps, 0, 0, topology_only=True)
-            print("inserting trip %d" % len(current.points))
-            insert_canonical(current, current_id)
+            insert()
@@ -1,12 +1,14 @@
 """
 Location class and methods
 """
-from math import sqrt
+from math import sqrt, floor
+from multiprocessing.pool import ThreadPool
 import requests
 import numpy as np
 from sklearn.cluster import DBSCAN
 from .point import Point
 from .utils import estimate_meters_to_deg
+from .place_cache import PlaceCache
 
 
 GOOGLE_PLACES_URL = 'https://maps.googleapis.com/maps/api/place/nearbysearch' \
@@ -17,21 +19,52 @@ FOURSQUARE_URL = 'https://api.foursquare.com/v2/venues/search?' \
         'client_id=%s&client_secret=%s&' \
         'll=%f,%f&radius=%f'
 
-GG_CACHE = {}
-FS_CACHE = {}
+# place provider queries issued at once, see infer_locations
+DEFAULT_CONCURRENCY = 8
+# seconds to wait for a place provider, see infer_locations
+DEFAULT_TIMEOUT = 10.
+
+GG_CACHE = PlaceCache()
+FS_CACHE = PlaceCache()
+
+def set_caches(google=None, foursquare=None):
+    """ Replaces the caches of place lookups
+
+    For instance, to share them between processes and restarts:
+        set_caches(
+            SQLitePlaceCache('places.db', 'google'),
+            SQLitePlaceCache('places.db', 'foursquare')
+        )
+
+    Args:
+        google (:obj:`BasePlaceCache`, optional): cache of `query_google`.
+            Defaults to None, to keep the current one
+        foursquare (:obj:`BasePlaceCache`, optional): cache of
+            `query_foursquare`. Defaults to None, to keep the current one
+    """
+    global GG_CACHE, FS_CACHE #pylint: disable=global-statement
+    if google is not None:
+        GG_CACHE = google
+    if foursquare is not None:
+        FS_CACHE = foursquare
 
 def from_cache(cache, point, threshold):
-    for entry in cache.keys():
-        if point.distance(entry) < threshold:
-            return cache[entry]
+    """ Finds a cached lookup near a point
+
+    Args:
+        cache (:obj:`BasePlaceCache`)
+        point (:obj:`Point`)
+        threshold (float): Radius of the lookup, in meters
+    Returns:
+        :obj:`list` of :obj:`dict`: cached locations, or None
+    """
+    return cache.get(point, threshold)
 
-def google_insert_cache(point, values):
-    global GG_CACHE
-    GG_CACHE[point] = values
+def google_insert_cache(point, radius, values):
+    GG_CACHE.put(point, radius, values)
 
-def foursquare_insert_cache(point, values):
-    global FS_CACHE
-    FS_CACHE[point] = values
+def foursquare_insert_cache(point, radius, values):
+    FS_CACHE.put(point, radius, values)
 
 
 def compute_centroid(points):
@@ -49,6 +82,9 @@ def compute_centroid(points):
 def update_location_centroid(point, cluster, max_distance, min_samples):
     """ Updates the centroid of a location cluster with another point
 
+    The whole cluster is clustered again, see `LocationCluster` to update
+    it incrementally
+
     Args:
         point (:obj:`Point`): Point to add to the cluster
         cluster (:obj:`list` of :obj:`Point`): Location cluster
@@ -91,7 +127,171 @@ def update_location_centroid(point, cluster, max_distance, min_samples):
 
     return biggest_centroid, cluster
 
-def query_foursquare(point, max_distance, client_id, client_secret):
+#pylint: disable=too-many-arguments
+class LocationCluster(object):
+    """ Location cluster, updated one point at a time
+
+    Gives the same centroid as `update_location_centroid`, the centroid of
+    the biggest DBSCAN cluster of the points, without clustering them
+    again for each new point. Points are indexed by a grid, so adding one
+    only looks at its neighbours. Clusters of core points are kept in a
+    disjoint set, with the sums of their coordinates. Border points go
+    to the neighbour cluster found first by DBSCAN, the one with the
+    lowest indexed core point, and are only assigned when the centroid
+    is asked for.
+
+    Attributes:
+        points (:obj:`list` of :obj:`Point`): points of the cluster
+        eps (float): max neighbour distance, in degrees
+        min_samples (int): minimum number of neighbours of a core point,
+            including itself
+    """
+    def __init__(self, max_distance, min_samples, points=None):
+        """ Constructor
+
+        Args:
+            max_distance (float): Max neighbour distance, in meters
+            min_samples (int): Minimum number of samples
+            points (:obj:`list` of :obj:`Point`, optional): initial points
+        """
+        self.points = []
+        self.eps = estimate_meters_to_deg(max_distance, precision=6)
+        self.min_samples = min_samples
+        self._coordinates = []
+        self._neighbours = []
+        self._grid = {}
+        self._core = []
+        self._parent = []
+        # for each cluster root: sum of longitudes, of latitudes, number of
+        # points and lowest index of its core points
+        self._sums = {}
+        self._borders = set()
+        self._total = [0., 0.]
+        self._centroid = None
+        for point in points or []:
+            self.add(point)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cell(self, lon, lat):
+        """ Grid cell of a position """
+        return int(floor(lon / self.eps)), int(floor(lat / self.eps))
+
+    def _find(self, index):
+        """ Root of the cluster of a core point """
+        root = index
+        while self._parent[root] != root:
+            root = self._parent[root]
+        while self._parent[index] != root:
+            self._parent[index], index = root, self._parent[index]
+        return root
+
+    def _union(self, index_a, index_b):
+        """ Merges the clusters of two core points """
+        root_a = self._find(index_a)
+        root_b = self._find(index_b)
+        if root_a == root_b:
+            return
+        sums_a = self._sums[root_a]
+        sums_b = self._sums[root_b]
+        if sums_a[2] < sums_b[2]:
+            root_a, root_b, sums_a, sums_b = root_b, root_a, sums_b, sums_a
+        self._parent[root_b] = root_a
+        sums_a[0] += sums_b[0]
+        sums_a[1] += sums_b[1]
+        sums_a[2] += sums_b[2]
+        sums_a[3] = min(sums_a[3], sums_b[3])
+        del self._sums[root_b]
+
+    def add(self, point):
+        """ Adds a point to the cluster
+
+        Args:
+            point (:obj:`Point`)
+        Returns:
+            :obj:`Point`: centroid of the cluster, see `centroid`
+        """
+        index = len(self.points)
+        lon, lat = point.lon, point.lat
+        cell_lon, cell_lat = self._cell(lon, lat)
+
+        neighbours = []
+        for i in range(cell_lon - 1, cell_lon + 2):
+            for j in range(cell_lat - 1, cell_lat + 2):
+                for other in self._grid.get((i, j), ()):
+                    other_lon, other_lat = self._coordinates[other]
+                    if sqrt((lon - other_lon) ** 2 + (lat - other_lat) ** 2) <= self.eps:
+                        neighbours.append(other)
+
+        self.points.append(point)
+        self._coordinates.append((lon, lat))
+        self._neighbours.append(neighbours)
+        self._grid.setdefault((cell_lon, cell_lat), []).append(index)
+        self._core.append(False)
+        self._parent.append(index)
+        self._total[0] += lon
+        self._total[1] += lat
+        for other in neighbours:
+            self._neighbours[other].append(index)
+
+        # adding points only turns points into core points
+        new_cores = [
+            other for other in [index] + neighbours
+            if not self._core[other] and len(self._neighbours[other]) + 1 >= self.min_samples
+        ]
+        for core in new_cores:
+            self._core[core] = True
+            self._borders.discard(core)
+            core_lon, core_lat = self._coordinates[core]
+            self._sums[core] = [core_lon, core_lat, 1, core]
+        for core in new_cores:
+            for other in self._neighbours[core]:
+                if self._core[other]:
+                    self._union(core, other)
+                else:
+                    self._borders.add(other)
+        if not self._core[index] and any(self._core[other] for other in neighbours):
+            self._borders.add(index)
+
+        self._centroid = None
+        return self.centroid()
+
+    def centroid(self):
+        """ Centroid of the biggest cluster
+
+        Returns:
+            :obj:`Point`: centroid of the biggest cluster, or of every point
+                if there are no clusters. None if there are no points
+        """
+        if self._centroid is not None or len(self.points) == 0:
+            return self._centroid
+
+        sums = dict((root, list(values)) for root, values in self._sums.items())
+        for border in self._borders:
+            cluster = None
+            for other in self._neighbours[border]:
+                if self._core[other]:
+                    root = self._find(other)
+                    if cluster is None or sums[root][3] < sums[cluster][3]:
+                        cluster = root
+            border_lon, border_lat = self._coordinates[border]
+            sums[cluster][0] += border_lon
+            sums[cluster][1] += border_lat
+            sums[cluster][2] += 1
+
+        if len(sums) == 0:
+            count = len(self.points)
+            self._centroid = Point(self._total[1] / count, self._total[0] / count, None)
+        else:
+            # ties go to the cluster found last
+            lon_sum, lat_sum, count, _ = max(
+                sums.values(), key=lambda values: (values[2], values[3])
+            )
+            self._centroid = Point(lat_sum / count, lon_sum / count, None)
+        return self._centroid
+
+def query_foursquare(point, max_distance, client_id, client_secret, session=None, timeout=None):
     """ Queries Squarespace API for a location
 
     Args:
@@ -99,6 +299,10 @@ def query_foursquare(point, max_distance, client_id, client_secret):
         max_distance (float): Search radius, in meters
         client_id (str): Valid Foursquare client id
         client_secret (str): Valid Foursquare client secret
+        session (:obj:`requests.Session`, optional): Session to issue the
+            request with, reusing its connections. Defaults to None
+        timeout (float, optional): Seconds to wait for the response.
+            Defaults to None, to wait forever
     Returns:
         :obj:`list` of :obj:`dict`: List of locations with the following format:
             {
@@ -113,11 +317,12 @@ def query_foursquare(point, max_distance, client_id, client_secret):
     if not client_secret:
         return []
 
-    if from_cache(FS_CACHE, point, max_distance):
-        return from_cache(FS_CACHE, point, max_distance)
+    cached = from_cache(FS_CACHE, point, max_distance)
+    if cached is not None:
+        return cached
 
     url = FOURSQUARE_URL % (client_id, client_secret, point.lat, point.lon, max_distance)
-    req = requests.get(url)
+    req = (session or requests).get(url, timeout=timeout)
 
     if req.status_code != 200:
         return []
@@ -138,17 +343,21 @@ def query_foursquare(point, max_distance, client_id, client_secret):
         })
 
     # final_results = sorted(result, key=lambda elm: elm['distance'])
-    foursquare_insert_cache(point, result)
+    foursquare_insert_cache(point, max_distance, result)
     return result
 
 
-def query_google(point, max_distance, key):
+def query_google(point, max_distance, key, session=None, timeout=None):
     """ Queries google maps API for a location
 
     Args:
         point (:obj:`Point`): Point location to query
         max_distance (float): Search radius, in meters
         key (str): Valid google maps api key
+        session (:obj:`requests.Session`, optional): Session to issue the
+            request with, reusing its connections. Defaults to None
+        timeout (float, optional): Seconds to wait for the response.
+            Defaults to None, to wait forever
     Returns:
         :obj:`list` of :obj:`dict`: List of locations with the following format:
             {
@@ -160,15 +369,16 @@ def query_google(point, max_distance, key):
     if not key:
         return []
 
-    if from_cache(GG_CACHE, point, max_distance):
-        return from_cache(GG_CACHE, point, max_distance)
+    cached = from_cache(GG_CACHE, point, max_distance)
+    if cached is not None:
+        return cached
 
-    req = requests.get(GOOGLE_PLACES_URL % (
+    req = (session or requests).get(GOOGLE_PLACES_URL % (
         point.lat,
         point.lon,
         max_distance,
         key
-    ))
+    ), timeout=timeout)
 
     if req.status_code != 200:
         return []
@@ -185,7 +395,7 @@ def query_google(point, max_distance, key):
             'suggestion_type': 'GOOGLE'
             })
 
-    google_insert_cache(point, final_results)
+    google_insert_cache(point, max_distance, final_results)
     return final_results
 
 def infer_location(
@@ -210,17 +420,7 @@ def infer_location(
     Returns:
         :obj:`Location`: with top match, and alternatives
     """
-    locations = []
-
-    if location_query is not None:
-        queried_locations = location_query(point, max_distance)
-        for (label, centroid, _) in queried_locations:
-            locations.append({
-                'label': unicode(label, 'utf-8'),
-                'distance': centroid.distance(point),
-                # 'centroid': centroid,
-                'suggestion_type': 'KB'
-                })
+    locations = query_knowledge_base(point, location_query, max_distance)
 
     api_locations = []
     if len(locations) <= limit:
@@ -236,6 +436,42 @@ def infer_location(
             )
             api_locations.extend(foursquare_locs)
 
+    return best_location(point, locations, api_locations, limit)
+
+def query_knowledge_base(point, location_query, max_distance):
+    """ Queries the locations known near a point
+
+    Args:
+        point (:obj:`Point`): Point location to query
+        location_query: Function with signature, (:obj:`Point`, int) -> (str, :obj:`Point`, ...).
+            Can be None
+        max_distance (float): Max distance to a position, in meters
+    Returns:
+        :obj:`list` of :obj:`dict`: locations
+    """
+    locations = []
+    if location_query is not None:
+        queried_locations = location_query(point, max_distance)
+        for (label, centroid, _) in queried_locations:
+            locations.append({
+                'label': unicode(label, 'utf-8'),
+                'distance': centroid.distance(point),
+                # 'centroid': centroid,
+                'suggestion_type': 'KB'
+                })
+    return locations
+
+def best_location(point, locations, api_locations, limit):
+    """ Creates a location from the closest known and api locations
+
+    Args:
+        point (:obj:`Point`): Point location inferred
+        locations (:obj:`list` of :obj:`dict`): Known locations
+        api_locations (:obj:`list` of :obj:`dict`): Locations of the place providers
+        limit (int): Results limit
+    Returns:
+        :obj:`Location`: with top match, and alternatives
+    """
     if len(locations) > 0 or len(api_locations) > 0:
         locations = sorted(locations, key=lambda d: d['distance'])
         api_locations = sorted(api_locations, key=lambda d: d['distance'])
@@ -244,6 +480,173 @@ def infer_location(
     else:
         return Location('#?', point, [])
 
+def group_points(points, max_distance):
+    """ Groups points with the first point before them within a distance
+
+    Points of a group share a place provider query, as they would share
+    a cached one if queried one after the other
+
+    Args:
+        points (:obj:`list` of :obj:`Point`)
+        max_distance (float): Max distance to the first point of a group, in meters
+    Returns:
+        (:obj:`list` of int, :obj:`list` of int): index of the first point of
+            each group, and index of the group of each point
+    """
+    firsts = []
+    groups = []
+    for i, point in enumerate(points):
+        for group, first in enumerate(firsts):
+            if point.distance(points[first]) < max_distance:
+                groups.append(group)
+                break
+        else:
+            groups.append(len(firsts))
+            firsts.append(i)
+    return firsts, groups
+
+class LookupStats(object):
+    """ Counters of location inferring, see `Track.infer_location`
+
+    Attributes:
+        points (int): number of points whose location was inferred
+        lookups (int): number of locations inferred, after clustering points
+        provider_queries (int): number of place provider queries issued,
+            including the ones answered by the cache
+    """
+    def __init__(self):
+        self.points = 0
+        self.lookups = 0
+        self.provider_queries = 0
+
+    @property
+    def saved(self):
+        """ int: number of lookups avoided by sharing locations """
+        return self.points - self.lookups
+
+    def to_json(self):
+        """ Converts to json
+
+        Returns:
+            :obj:`dict`
+        """
+        return {
+            'points': self.points,
+            'lookups': self.lookups,
+            'saved': self.saved,
+            'providerQueries': self.provider_queries
+        }
+
+def cluster_points(points, max_distance):
+    """ Clusters nearby points, such as the end of a segment and the start
+        of the next one
+
+    Points are grouped with the first point before them within half of
+    `max_distance`, see `group_points`, so every point of a cluster is
+    within `max_distance` of its centroid, however many points there are.
+
+    Args:
+        points (:obj:`list` of :obj:`Point`)
+        max_distance (float): Max distance between a point and the centroid
+            of its cluster, in meters
+    Returns:
+        (:obj:`list` of :obj:`Point`, :obj:`list` of int): centroid of each
+            cluster, and index of the cluster of each point
+    """
+    firsts, groups = group_points(points, max_distance / 2.)
+    clusters = [[] for _ in firsts]
+    for group, point in zip(groups, points):
+        clusters[group].append(point.gen2arr())
+    return [compute_centroid(cluster) for cluster in clusters], groups
+
+def infer_locations(
+        points,
+        location_query,
+        max_distance,
+        google_key,
+        foursquare_client_id,
+        foursquare_client_secret,
+        limit,
+        concurrency=DEFAULT_CONCURRENCY,
+        timeout=DEFAULT_TIMEOUT,
+        stats=None
+    ):
+    """ Infers the semantic locations of many points, querying the place
+        providers concurrently
+
+    Gives the same locations as `infer_location` over each point, but
+    points close to each other share the place provider queries, and the
+    remaining queries are issued at the same time, through a thread pool
+    and a pooled HTTP session. Queries that fail or time out give no
+    locations, and aren't cached.
+
+    Args:
+        points (:obj:`list` of :obj:`Point`): Point locations to infer
+        location_query: Function with signature, (:obj:`Point`, int) -> (str, :obj:`Point`, ...)
+        max_distance (float): Max distance to a position, in meters
+        google_key (str): Valid google maps api key
+        foursquare_client_id (str): Valid Foursquare client id
+        foursquare_client_secret (str): Valid Foursquare client secret
+        limit (int): Results limit
+        concurrency (int, optional): Max place provider queries at once.
+            Defaults to DEFAULT_CONCURRENCY
+        timeout (float, optional): Seconds to wait for each place provider
+            query. Defaults to DEFAULT_TIMEOUT
+        stats (:obj:`LookupStats`, optional): Counters to update. Defaults to None
+    Returns:
+        :obj:`list` of :obj:`Location`: location of each point
+    """
+    known = [query_knowledge_base(point, location_query, max_distance) for point in points]
+    queried = [i for i, locations in enumerate(known) if len(locations) <= limit]
+    firsts, groups = group_points([points[i] for i in queried], max_distance)
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    queries = []
+    for group, first in enumerate(firsts):
+        if google_key:
+            queries.append((group, points[queried[first]], 'google'))
+        if foursquare_client_id and foursquare_client_secret:
+            queries.append((group, points[queried[first]], 'foursquare'))
+
+    def query(args):
+        """ Queries a place provider """
+        _, point, provider = args
+        try:
+            if provider == 'google':
+                return query_google(point, max_distance, google_key, session, timeout)
+            return query_foursquare(
+                point, max_distance, foursquare_client_id, foursquare_client_secret,
+                session, timeout
+            )
+        except requests.RequestException:
+            return []
+
+    if stats is not None:
+        stats.provider_queries += len(queries)
+
+    results = [[] for _ in firsts]
+    if len(queries) > 0:
+        pool = ThreadPool(min(concurrency, len(queries)))
+        try:
+            for (group, _, _), result in zip(queries, pool.map(query, queries)):
+                results[group].extend(result)
+        finally:
+            pool.close()
+    session.close()
+
+    api_locations = [[] for _ in points]
+    for i, group in zip(queried, groups):
+        api_locations[i] = results[group]
+
+    return [
+        best_location(point, locations, api, limit)
+        for point, locations, api in zip(points, known, api_locations)
+    ]
+
 class Location(object):
     """ Location representation
 
@@ -283,7 +686,9 @@ class Location(object):
     def from_json(json):
         """ Converts from a json representation
 
+        Args:
+            json (:obj:`dict`): See `to_json`
         Returns:
             :obj:`Location`
         """
-        return Location(json['label'], json['position'], [])
+        return Location(json['label'], Point.from_json(json['position']), json.get('other', []))
@@ -0,0 +1,118 @@
+"""
+Vectorized point metrics
+
+Array counterparts of `point.distance` and `Point.compute_metrics`, that
+compute the metrics of a whole segment in a few NumPy operations.
+"""
+import numpy as np
+from .point import ONE_DEGREE, EARTH_RADIUS
+
+def to_rad(numbers):
+    """ Degrees to rads, see `point.to_rad` """
+    return numbers / 180. * np.pi
+
+def haversine_distances(lat_1, lon_1, lat_2, lon_2):
+    """ Haversine distances between arrays of points, expressed in meters
+
+    See `point.haversine_distance`
+
+    Args:
+        lat_1 (:obj:`numpy.ndarray`)
+        lon_1 (:obj:`numpy.ndarray`)
+        lat_2 (:obj:`numpy.ndarray`)
+        lon_2 (:obj:`numpy.ndarray`)
+    Returns:
+        :obj:`numpy.ndarray`
+    """
+    d_lat = to_rad(lat_1 - lat_2)
+    d_lon = to_rad(lon_1 - lon_2)
+    lat1 = to_rad(lat_1)
+    lat2 = to_rad(lat_2)
+
+    #pylint: disable=invalid-name
+    a = np.sin(d_lat/2) * np.sin(d_lat/2) + \
+        np.sin(d_lon/2) * np.sin(d_lon/2) * np.cos(lat1) * np.cos(lat2)
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+    return EARTH_RADIUS * c
+
+def distances(lat_1, lon_1, lat_2, lon_2):
+    """ Distances between arrays of points, expressed in meters
+
+    Uses the same flat earth approximation as `point.distance`, switching to
+    the haversine distance when points are more than .2 degrees apart.
+
+    Args:
+        lat_1 (:obj:`numpy.ndarray`)
+        lon_1 (:obj:`numpy.ndarray`)
+        lat_2 (:obj:`numpy.ndarray`)
+        lon_2 (:obj:`numpy.ndarray`)
+    Returns:
+        :obj:`numpy.ndarray`
+    """
+    lat_1 = np.asarray(lat_1, dtype=np.float64)
+    lon_1 = np.asarray(lon_1, dtype=np.float64)
+    lat_2 = np.asarray(lat_2, dtype=np.float64)
+    lon_2 = np.asarray(lon_2, dtype=np.float64)
+
+    #pylint: disable=invalid-name
+    x = lat_1 - lat_2
+    y = lon_1 - lon_2
+    far = (np.abs(x) > .2) | (np.abs(y) > .2)
+
+    coef = np.cos(lat_1 / 180. * np.pi)
+    y = y * coef
+    result = np.sqrt(x * x + y * y) * ONE_DEGREE
+
+    if far.any():
+        result = np.where(
+            far,
+            haversine_distances(lat_1, lon_1, lat_2, lon_2),
+            result
+        )
+    return result
+
+#pylint: disable=too-many-arguments,invalid-name
+def compute_metrics(lat, lon, timestamp, dt, dx, vel, acc, indexes=None):
+    """ In-place computation of the metrics of points
+
+    Array counterpart of `Point.compute_metrics`. The metrics of the ith
+    point are computed relative to the (i-1)th point, so the first point is
+    never computed. Points are computed in order, so the acceleration of a
+    point uses the updated velocity of the previous point when both are
+    computed.
+
+    Args:
+        lat (:obj:`numpy.ndarray`): latitudes
+        lon (:obj:`numpy.ndarray`): longitudes
+        timestamp (:obj:`numpy.ndarray`): seconds since epoch
+        dt (:obj:`numpy.ndarray`): time differences, to update
+        dx (:obj:`numpy.ndarray`): distances, to update
+        vel (:obj:`numpy.ndarray`): velocities, to update
+        acc (:obj:`numpy.ndarray`): accelerations, to update
+        indexes (:obj:`numpy.ndarray`, optional): Sorted indexes of the points to
+            compute. Defaults to every point but the first
+    Returns:
+        int: number of points computed
+    """
+    if indexes is None:
+        now = slice(1, len(lat))
+        prv = slice(0, max(len(lat) - 1, 0))
+        total = max(len(lat) - 1, 0)
+    else:
+        now = np.asarray(indexes, dtype=np.intp)
+        now = now[now > 0]
+        prv = now - 1
+        total = len(now)
+    if total == 0:
+        return 0
+
+    delta_t = np.abs(timestamp[now] - timestamp[prv])
+    delta_x = distances(lat[now], lon[now], lat[prv], lon[prv])
+    moving = delta_t != 0
+    safe_t = np.where(moving, delta_t, 1.)
+
+    dt[now] = delta_t
+    dx[now] = delta_x
+    vel[now] = np.where(moving, delta_x / safe_t, 0.)
+    acc[now] = np.where(moving, (vel[now] - vel[prv]) / safe_t, 0.)
+    return total
@@ -0,0 +1,617 @@
+"""
+Cache of place lookups
+
+Keeps the results of place queries, such as `location.query_google`, by
+the position and radius queried. Entries are indexed by a grid of square
+cells, so that a lookup only compares the position with the entries of
+the cells within the search radius. There are three backends:
+
+    - `PlaceCache`, in memory and bounded: entries expire after a time
+      to live, and the least recently used are evicted when it's full
+    - `SQLitePlaceCache`, a SQLite database that can be shared by many
+      processes, and kept across restarts
+    - `MappedPlaceCache`, an append only file, memory mapped when read,
+      that can also be shared by many processes
+
+Every backend can be dumped to, and warm started from, a JSON lines file,
+see `BasePlaceCache.dump` and `BasePlaceCache.load`.
+"""
+import os
+import json
+import math
+import time
+import mmap
+import fcntl
+import struct
+import sqlite3
+from threading import Lock, local
+from collections import OrderedDict
+
+from .point import Point, ONE_DEGREE
+
+# side of the grid cells, in meters
+DEFAULT_CELL_SIZE = 100.
+DEFAULT_MAX_SIZE = 10000
+# seconds an entry is kept, one week
+DEFAULT_TTL = 7 * 24 * 60 * 60.
+
+class CacheEntry(object):
+    """ Cached result of a lookup
+
+    Attributes:
+        point (:obj:`Point`): position queried
+        radius (float): radius queried, in meters
+        values (:obj:`list`): result of the lookup
+        created (float): time when the entry was added, in seconds since epoch
+        cell (int, int): grid cell of the point
+    """
+    __slots__ = ('point', 'radius', 'values', 'created', 'cell')
+
+    #pylint: disable=too-many-arguments
+    def __init__(self, point, radius, values, created, cell):
+        self.point = point
+        self.radius = radius
+        self.values = values
+        self.created = created
+        self.cell = cell
+
+    def to_json(self):
+        """ Converts to json, see `BasePlaceCache.dump`
+
+        Returns:
+            :obj:`dict`
+        """
+        return {
+            'lat': self.point.lat,
+            'lon': self.point.lon,
+            'radius': self.radius,
+            'created': self.created,
+            'values': self.values
+        }
+
+class BasePlaceCache(object):
+    """ Grid and counters shared by the cache backends
+
+    Backends implement `find`, `add` and `items`
+
+    Attributes:
+        cell_size (float): side of the grid cells, in meters
+        ttl (float): seconds an entry is kept. None to keep them forever
+        clock (function): current time, in seconds
+        hits (int): number of lookups that found an entry
+        misses (int): number of lookups that found no entry
+        evictions (int): number of entries removed to make room for others
+        expirations (int): number of entries removed after their ttl
+    """
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE, ttl=DEFAULT_TTL, clock=time.time):
+        self.cell_size = cell_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._cell_degrees = cell_size / ONE_DEGREE
+        self._counters_lock = Lock()
+
+    def cell(self, lat, lon):
+        """ Grid cell of a position
+
+        Args:
+            lat (float): latitude
+            lon (float): longitude
+        Returns:
+            (int, int)
+        """
+        return int(math.floor(lat / self._cell_degrees)), int(math.floor(lon / self._cell_degrees))
+
+    def cell_bounds(self, point, radius):
+        """ Range of grid cells that may have positions within a distance of
+            a point
+
+        Args:
+            point (:obj:`Point`)
+            radius (float): distance, in meters
+        Returns:
+            (int, int, int, int): minimum and maximum cell, in latitude and
+                longitude
+        """
+        lat_radius = radius / ONE_DEGREE
+        # a degree of longitude gets shorter away from the equator
+        coef = max(math.cos(math.radians(min(abs(point.lat) + lat_radius, 90.))), 1e-6)
+        lon_radius = lat_radius / coef
+        min_lat, min_lon = self.cell(point.lat - lat_radius, point.lon - lon_radius)
+        max_lat, max_lon = self.cell(point.lat + lat_radius, point.lon + lon_radius)
+        return min_lat, min_lon, max_lat, max_lon
+
+    def expired(self, created, now):
+        """ Checks if an entry expired
+
+        Args:
+            created (float): time when the entry was added
+            now (float): current time
+        Returns:
+            bool
+        """
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, point, radius):
+        """ Finds the result of a lookup near a point
+
+        Args:
+            point (:obj:`Point`): position to lookup
+            radius (float): radius of the lookup, in meters. Only entries of
+                lookups with the same, or a bigger, radius, whose position is
+                within it, are considered
+        Returns:
+            :obj:`list`: values of the closest entry, or None if there's none
+        """
+        values = self.find(point, radius, self.clock())
+        with self._counters_lock:
+            if values is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return values
+
+    def put(self, point, radius, values, created=None):
+        """ Adds the result of a lookup
+
+        Empty results aren't kept, as they may come from a failed lookup,
+        that should be tried again
+
+        Args:
+            point (:obj:`Point`): position queried
+            radius (float): radius queried, in meters
+            values (:obj:`list`): result of the lookup, JSON serializable
+            created (float, optional): time of the lookup, in seconds since
+                epoch. Defaults to now
+        """
+        if len(values) == 0:
+            return
+        self.add(point, radius, values, self.clock() if created is None else created)
+
+    def find(self, point, radius, now):
+        """ Finds the closest valid entry, see `get`
+
+        Args:
+            point (:obj:`Point`)
+            radius (float)
+            now (float): current time
+        Returns:
+            :obj:`list`: values of the closest entry, or None
+        """
+        raise NotImplementedError()
+
+    def add(self, point, radius, values, created):
+        """ Adds an entry, see `put` """
+        raise NotImplementedError()
+
+    def items(self):
+        """ Entries of the cache, including expired ones not yet removed
+
+        Returns:
+            :obj:`list` of :obj:`CacheEntry`
+        """
+        raise NotImplementedError()
+
+    def stats(self):
+        """ Counters of the cache
+
+        Returns:
+            :obj:`dict`: with the size, hits, misses, evictions and expirations
+        """
+        return {
+            'size': len(self.items()),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+    def dump(self, fileobj):
+        """ Writes the entries that didn't expire, one JSON object per line
+
+        Args:
+            fileobj (file): file-like object to write to
+        """
+        now = self.clock()
+        for entry in self.items():
+            if not self.expired(entry.created, now):
+                fileobj.write(json.dumps(entry.to_json()))
+                fileobj.write('\n')
+
+    def load(self, fileobj):
+        """ Adds the entries of a dump, see `dump`
+
+        Entries keep the time they were created, so they expire as they
+        would in the dumped cache
+
+        Args:
+            fileobj (file): file-like object to read from
+        Returns:
+            int: number of entries added
+        """
+        count = 0
+        for line in fileobj:
+            if line.strip():
+                entry = json.loads(line)
+                if len(entry['values']) > 0:
+                    point = Point(entry['lat'], entry['lon'], None)
+                    self.put(point, entry['radius'], entry['values'], entry['created'])
+                    count = count + 1
+        return count
+
+class PlaceCache(BasePlaceCache):
+    """ Bounded in memory cache of place lookups
+
+    Safe to use from multiple threads
+
+    Attributes:
+        max_size (int): maximum number of entries. None for no limit
+    """
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE, max_size=DEFAULT_MAX_SIZE,
+                 ttl=DEFAULT_TTL, clock=time.time):
+        """ Constructor
+
+        Args:
+            cell_size (float, optional): side of the grid cells, in meters.
+                Defaults to DEFAULT_CELL_SIZE
+            max_size (int, optional): maximum number of entries. None for no
+                limit. Defaults to DEFAULT_MAX_SIZE
+            ttl (float, optional): seconds an entry is kept. None to keep
+                them until they're evicted. Defaults to DEFAULT_TTL
+            clock (function, optional): current time, in seconds. Defaults to
+                `time.time`
+        """
+        super(PlaceCache, self).__init__(cell_size, ttl, clock)
+        self.max_size = max_size
+        # entries by id, from least to most recently used
+        self._entries = OrderedDict()
+        # ids of the entries of each cell
+        self._grid = {}
+        self._next_id = 0
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def cells_around(self, point, radius):
+        """ Grid cells, with entries, that may have positions within a
+            distance of a point
+
+        Args:
+            point (:obj:`Point`)
+            radius (float): distance, in meters
+        Returns:
+            :obj:`list` of (int, int)
+        """
+        min_lat, min_lon, max_lat, max_lon = self.cell_bounds(point, radius)
+        if (max_lat - min_lat + 1) * (max_lon - min_lon + 1) > len(self._grid):
+            return self._grid.keys()
+        return [
+            (cell_lat, cell_lon)
+            for cell_lat in range(min_lat, max_lat + 1)
+            for cell_lon in range(min_lon, max_lon + 1)
+        ]
+
+    def find(self, point, radius, now):
+        with self._lock:
+            closest = None
+            closest_distance = radius
+            expired = []
+            for cell in self.cells_around(point, radius):
+                for entry_id in self._grid.get(cell, ()):
+                    entry = self._entries[entry_id]
+                    if self.expired(entry.created, now):
+                        expired.append(entry_id)
+                        continue
+                    if entry.radius < radius:
+                        continue
+                    distance = point.distance(entry.point)
+                    if distance < closest_distance:
+                        closest = entry_id
+                        closest_distance = distance
+
+            for entry_id in expired:
+                self._remove(entry_id)
+            self.expirations += len(expired)
+
+            if closest is None:
+                return None
+            entry = self._entries.pop(closest)
+            self._entries[closest] = entry
+            return entry.values
+
+    def add(self, point, radius, values, created):
+        with self._lock:
+            cell = self.cell(point.lat, point.lon)
+            entry_id = self._next_id
+            self._next_id = self._next_id + 1
+            self._entries[entry_id] = CacheEntry(point, radius, values, created, cell)
+            self._grid.setdefault(cell, set()).add(entry_id)
+
+            while self.max_size is not None and len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def items(self):
+        with self._lock:
+            return self._entries.values()
+
+    def clear(self):
+        """ Removes every entry, keeping the counters """
+        with self._lock:
+            self._entries.clear()
+            self._grid.clear()
+
+    def _remove(self, entry_id):
+        """ Removes an entry, must hold the lock """
+        entry = self._entries.pop(entry_id)
+        ids = self._grid[entry.cell]
+        ids.discard(entry_id)
+        if len(ids) == 0:
+            del self._grid[entry.cell]
+
+def closest_row(point, radius, rows):
+    """ Closest position to a point, within a distance
+
+    Args:
+        point (:obj:`Point`)
+        radius (float): maximum distance, in meters
+        rows (:obj:`list` of tuple): each starting with a latitude and a
+            longitude
+    Returns:
+        tuple: the closest row, or None
+    """
+    closest = None
+    closest_distance = radius
+    for row in rows:
+        distance = point.distance(Point(row[0], row[1], None))
+        if distance < closest_distance:
+            closest = row
+            closest_distance = distance
+    return closest
+
+# puts between removals of expired entries
+SQLITE_PURGE_EVERY = 100
+
+class SQLitePlaceCache(BasePlaceCache):
+    """ Cache of place lookups stored in a SQLite database
+
+    The database is in write-ahead log mode, so that many processes, and
+    threads, can read and write it at the same time. Each thread of each
+    process uses its own connection. Several caches, such as one for each
+    place provider, can share a database with different namespaces.
+
+    Entries expire after their ttl. When there are more than max_size, the
+    oldest are evicted.
+
+    Attributes:
+        path (str): path of the database
+        namespace (str): name of the cache in the database
+        max_size (int): maximum number of entries. None for no limit
+        timeout (float): seconds to wait for other writers
+    """
+    #pylint: disable=too-many-arguments
+    def __init__(self, path, namespace='places', cell_size=DEFAULT_CELL_SIZE,
+                 max_size=None, ttl=DEFAULT_TTL, clock=time.time, timeout=30.):
+        """ Constructor
+
+        Args:
+            path (str): path of the database, created if it doesn't exist
+            namespace (str, optional): name of the cache in the database.
+                Defaults to 'places'
+            cell_size (float, optional): side of the grid cells, in meters.
+                Every cache of the database must use the same. Defaults to
+                DEFAULT_CELL_SIZE
+            max_size (int, optional): maximum number of entries. Defaults to
+                None, for no limit
+            ttl (float, optional): seconds an entry is kept. Defaults to
+                DEFAULT_TTL
+            clock (function, optional): current time, in seconds. Defaults to
+                `time.time`
+            timeout (float, optional): seconds to wait for other writers.
+                Defaults to 30
+        """
+        super(SQLitePlaceCache, self).__init__(cell_size, ttl, clock)
+        self.path = path
+        self.namespace = namespace
+        self.max_size = max_size
+        self.timeout = timeout
+        self._local = local()
+        self._puts = 0
+
+        conn = self.connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS places ('
+            'namespace TEXT, cell_lat INTEGER, cell_lon INTEGER, radius REAL, '
+            'lat REAL, lon REAL, created REAL, vals TEXT)'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS places_cell '
+            'ON places (namespace, radius, cell_lat, cell_lon)'
+        )
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        conn.execute(
+            'INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)',
+            ('cell_size', repr(cell_size))
+        )
+        stored = conn.execute('SELECT value FROM meta WHERE key = ?', ('cell_size',)).fetchone()
+        if float(stored[0]) != cell_size:
+            raise ValueError(
+                '%s uses cells of %s meters, not %s' % (path, stored[0], cell_size)
+            )
+
+    def connection(self):
+        """ Connection to the database of the current thread and process
+
+        Returns:
+            :obj:`sqlite3.Connection`
+        """
+        conn = getattr(self._local, 'connection', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def find(self, point, radius, now):
+        min_lat, min_lon, max_lat, max_lon = self.cell_bounds(point, radius)
+        oldest = -float('inf') if self.ttl is None else now - self.ttl
+        rows = self.connection().execute(
+            'SELECT lat, lon, vals FROM places WHERE namespace = ? AND radius >= ? '
+            'AND cell_lat BETWEEN ? AND ? AND cell_lon BETWEEN ? AND ? AND created >= ?',
+            (self.namespace, radius, min_lat, max_lat, min_lon, max_lon, oldest)
+        )
+        row = closest_row(point, radius, rows)
+        return None if row is None else json.loads(row[2])
+
+    def add(self, point, radius, values, created):
+        cell_lat, cell_lon = self.cell(point.lat, point.lon)
+        conn = self.connection()
+        conn.execute(
+            'INSERT INTO places VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (self.namespace, cell_lat, cell_lon, radius,
+             point.lat, point.lon, created, json.dumps(values))
+        )
+        self._puts = self._puts + 1
+        if self._puts % SQLITE_PURGE_EVERY == 0:
+            self.purge()
+
+    def purge(self):
+        """ Removes the expired entries, and the oldest if there are more
+            than max_size
+        """
+        conn = self.connection()
+        if self.ttl is not None:
+            removed = conn.execute(
+                'DELETE FROM places WHERE namespace = ? AND created < ?',
+                (self.namespace, self.clock() - self.ttl)
+            ).rowcount
+            self.expirations += removed
+        if self.max_size is not None:
+            removed = conn.execute(
+                'DELETE FROM places WHERE rowid IN (SELECT rowid FROM places '
+                'WHERE namespace = ? ORDER BY created DESC LIMIT -1 OFFSET ?)',
+                (self.namespace, self.max_size)
+            ).rowcount
+            self.evictions += removed
+
+    def items(self):
+        rows = self.connection().execute(
+            'SELECT lat, lon, radius, vals, created, cell_lat, cell_lon FROM places '
+            'WHERE namespace = ?', (self.namespace,)
+        )
+        return [
+            CacheEntry(Point(lat, lon, None), radius, json.loads(vals), created, cell)
+            for lat, lon, radius, vals, created, cell_lat, cell_lon in rows
+            for cell in [(cell_lat, cell_lon)]
+        ]
+
+MAPPED_MAGIC = b'TTPC'
+MAPPED_VERSION = 1
+# magic, version and cell size
+MAPPED_HEADER = struct.Struct('<4sId')
+# latitude, longitude, radius, time created and length of the values
+MAPPED_RECORD = struct.Struct('<ddddI')
+
+class MappedPlaceCache(BasePlaceCache):
+    """ Cache of place lookups stored in an append only file
+
+    Entries are appended to the file, as JSON, under an exclusive lock.
+    Before each lookup, the entries appended since the last one, by any
+    process, are read through a memory map, under a shared lock, into a
+    `PlaceCache` index. Entries expire after their ttl, but stay in the
+    file: to shrink it, dump the cache and load it into a new file.
+
+    Attributes:
+        path (str): path of the file
+    """
+    def __init__(self, path, cell_size=DEFAULT_CELL_SIZE, ttl=DEFAULT_TTL, clock=time.time):
+        """ Constructor
+
+        Args:
+            path (str): path of the file, created if it doesn't exist
+            cell_size (float, optional): side of the grid cells, in meters.
+                Must be the one the file was created with. Defaults to
+                DEFAULT_CELL_SIZE
+            ttl (float, optional): seconds an entry is kept. Defaults to
+                DEFAULT_TTL
+            clock (function, optional): current time, in seconds. Defaults to
+                `time.time`
+        """
+        super(MappedPlaceCache, self).__init__(cell_size, ttl, clock)
+        self.path = path
+        self._index = PlaceCache(cell_size, None, ttl, clock)
+        self._lock = Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                os.write(self._fd, MAPPED_HEADER.pack(MAPPED_MAGIC, MAPPED_VERSION, cell_size))
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            header = os.read(self._fd, MAPPED_HEADER.size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        magic, version, stored_cell_size = MAPPED_HEADER.unpack(header)
+        if magic != MAPPED_MAGIC or version > MAPPED_VERSION:
+            raise ValueError('%s is not a place cache' % path)
+        if stored_cell_size != cell_size:
+            raise ValueError(
+                '%s uses cells of %s meters, not %s' % (path, stored_cell_size, cell_size)
+            )
+        self._offset = MAPPED_HEADER.size
+
+    def refresh(self):
+        """ Indexes the entries appended to the file since the last refresh """
+        with self._lock:
+            size = os.fstat(self._fd).st_size
+            if size <= self._offset:
+                return
+            fcntl.flock(self._fd, fcntl.LOCK_SH)
+            try:
+                size = os.fstat(self._fd).st_size
+                data = mmap.mmap(self._fd, size, access=mmap.ACCESS_READ)
+                try:
+                    offset = self._offset
+                    while offset + MAPPED_RECORD.size <= size:
+                        lat, lon, radius, created, length = \
+                            MAPPED_RECORD.unpack_from(data, offset)
+                        start = offset + MAPPED_RECORD.size
+                        values = json.loads(data[start:start + length])
+                        self._index.put(Point(lat, lon, None), radius, values, created)
+                        offset = start + length
+                    self._offset = offset
+                finally:
+                    data.close()
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def find(self, point, radius, now):
+        self.refresh()
+        values = self._index.find(point, radius, now)
+        self.expirations = self._index.expirations
+        return values
+
+    def add(self, point, radius, values, created):
+        data = json.dumps(values)
+        record = MAPPED_RECORD.pack(point.lat, point.lon, radius, created, len(data)) + data
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                os.write(self._fd, record)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def items(self):
+        self.refresh()
+        return self._index.items()
+
+    def close(self):
+        """ Closes the file """
+        os.close(self._fd)
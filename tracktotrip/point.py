@@ -7,13 +7,47 @@ from .utils import isostr_to_datetime
 
 EPOCH = datetime.datetime.utcfromtimestamp(0)
 
+def to_timestamp(time):
+    """ Converts a time to seconds since epoch
+
+    Args:
+        time (:obj:`datetime.datetime` or float): Time to convert, or seconds
+            since epoch. Can be None
+    Returns:
+        float: seconds since epoch, or None if time is None
+    """
+    if time is None:
+        return None
+    if isinstance(time, datetime.datetime):
+        if time.tzinfo is not None:
+            time = time.replace(tzinfo=None) - time.utcoffset()
+        return (time - EPOCH).total_seconds()
+    return float(time)
+
+def from_timestamp(timestamp):
+    """ Converts seconds since epoch to a datetime
+
+    Args:
+        timestamp (float): seconds since epoch. Can be None or NaN
+    Returns:
+        :obj:`datetime.datetime`, in UTC, or None if timestamp is None or NaN
+    """
+    if timestamp is None or timestamp != timestamp:
+        return None
+    return EPOCH + datetime.timedelta(seconds=timestamp)
+
 class Point(object):
     """ Spaciotemporal point representation
 
+    Points are compact: attributes are kept in slots and time is stored as
+    seconds since epoch, the `datetime` being built only when `time` is read.
+
     Attributes:
         lat (float): latitude
         lon (float): longitude
-        time (:obj:`datetime.datetime`): time
+        timestamp (float): time, in seconds since epoch. None if unknown
+        time (:obj:`datetime.datetime`): time, in UTC. Setting it updates the
+            timestamp
         dt (float): time difference in seconds from the past point in the segment
             should be computed
         acc (float): accelaration in km^2/h, relative to the previous point in the segment
@@ -21,22 +55,48 @@ class Point(object):
         vel (float): velocity in km/h, relative to the previous point in the segment
             should be computed with compute_metrics method
     """
+    __slots__ = ('lat', 'lon', 'timestamp', 'dt', 'dx', 'acc', 'vel')
+
     def __init__(self, lat, lon, time):
+        """ Constructor
+
+        Args:
+            lat (float): latitude
+            lon (float): longitude
+            time (:obj:`datetime.datetime` or float): time, or seconds since
+                epoch. Can be None
+        """
         self.lon = lon
         self.lat = lat
-        self.time = time
+        self.timestamp = to_timestamp(time)
         self.dt = .0 #pylint: disable=invalid-name
         self.dx = .0 #pylint: disable=invalid-name
         self.acc = .0
         self.vel = .0
 
+    @property
+    def time(self):
+        """ :obj:`datetime.datetime`: time of the point, built from its timestamp """
+        return from_timestamp(self.timestamp)
+
+    @time.setter
+    def time(self, time):
+        self.timestamp = to_timestamp(time)
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in Point.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(Point.__slots__, state):
+            setattr(self, name, value)
+
     def get_timestamp(self):
         """ Gets the timestamp of this point's time, seconds since 1970
 
         Returns:
             float: time since epoch, in seconds
         """
-        return (self.time - EPOCH).total_seconds()
+        return self.timestamp
 
     def gen2arr(self):
         """ Generate a location array
@@ -72,7 +132,7 @@ class Point(object):
         Returns:
             Time difference in seconds
         """
-        return abs((self.time - previous.time).total_seconds())
+        return abs(self.timestamp - previous.timestamp)
 
     def compute_metrics(self, previous):
         """ Computes the metrics of this point
@@ -151,7 +211,7 @@ class Point(object):
         return Point(
             lat=json['lat'],
             lon=json['lon'],
-            time=isostr_to_datetime(json['time'])
+            time=isostr_to_datetime(json['time']) if json.get('time') is not None else None
         )
 
 
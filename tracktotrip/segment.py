@@ -8,12 +8,17 @@ import traceback
 import numpy as np
 
 from .point import Point
-from .utils import pairwise
+from .columnar import PointArray, PointView
+from .metrics import compute_metrics
+from .utils import pairwise, isostr_to_timestamps, timestamps_to_isostr
 from .smooth import with_no_strategy, with_extrapolation, with_inverse
 from .smooth import NO_STRATEGY, INVERSE_STRATEGY, EXTRAPOLATE_STRATEGY
 from .location import infer_location
-from .similarity import sort_segment_points, closest_point
-from .compression import spt, drp
+from .similarity import sort_segment_points, closest_point, EdgeIndex
+from .compression import drp_indexes, spt_indexes, td_sp_indexes, td_tr_indexes
+from .compression import coordinates_and_times
+from .compression import DRP_STRATEGY, SPT_STRATEGY, TD_SP_STRATEGY, TD_TR_STRATEGY
+from .compression import SPT_MAX_WINDOW
 from .transportation_mode import speed_clustering
 from .spatiotemporal_segmentation import spatiotemporal_segmentation
 
@@ -23,26 +28,71 @@ def remove_liers(points):
     Checks time consistency, removing points that appear out of order
 
     Args:
-        points (:obj:`list` of :obj:`Point`)
+        points (:obj:`list` of :obj:`Point` or :obj:`PointArray`)
     Returns:
-        :obj:`list` of :obj:`Point`
+        :obj:`list` of :obj:`Point` or :obj:`PointArray`
     """
+    if isinstance(points, PointArray):
+        return points.take(non_liers(points.timestamp))
+
     result = [points[0]]
     for i in range(1, len(points) - 2):
         prv = points[i-1]
         crr = points[i]
         nxt = points[i+1]
-        if prv.time <= crr.time and crr.time <= nxt.time:
+        if prv.timestamp <= crr.timestamp and crr.timestamp <= nxt.timestamp:
             result.append(crr)
     result.append(points[-1])
 
     return result
 
+def non_liers(timestamps):
+    """ Indexes of the points kept by `remove_liers`
+
+    Args:
+        timestamps (:obj:`numpy.ndarray`): seconds since epoch of each point
+    Returns:
+        :obj:`numpy.ndarray` of int
+    """
+    if len(timestamps) == 1:
+        return np.array([0, 0])
+    keep = np.ones(len(timestamps), dtype=bool)
+    keep[1:-1] = False
+    keep[1:-2] = (timestamps[:-3] <= timestamps[1:-2]) & (timestamps[1:-2] <= timestamps[2:-1])
+    return np.flatnonzero(keep)
+
+def kept_indexes(old_points, new_points):
+    """ Finds the index of each new point in the old points
+
+    Args:
+        old_points (:obj:`list` of :obj:`Point` or :obj:`PointArray`)
+        new_points (:obj:`list` of :obj:`Point`)
+    Returns:
+        :obj:`numpy.ndarray` of int, or None if some of the new points
+            aren't in the old points
+    """
+    indexes = []
+    if isinstance(old_points, PointArray):
+        for point in new_points:
+            if not isinstance(point, PointView) or point.array is not old_points:
+                return None
+            indexes.append(point.index)
+    else:
+        positions = dict((id(point), i) for i, point in enumerate(old_points))
+        for point in new_points:
+            index = positions.get(id(point))
+            if index is None:
+                return None
+            indexes.append(index)
+    return np.array(indexes, dtype=np.intp)
+
 class Segment(object):
     """Holds the points and semantic information about them
 
     Attributes:
-        points (:obj:`list` of :obj:`Point`): points of the segment
+        points (:obj:`list` of :obj:`Point` or :obj:`PointArray`): points of the
+            segment. Once the segment is columnar, see `to_columnar`, lists
+            assigned to it are converted to a `PointArray`
         #TODO
         transportation_modes: array of transportation modes of the segment
             Each transportation mode represents a span of points
@@ -54,14 +104,197 @@ class Segment(object):
             the start of the segment
         locationTo: TrackToTrip.Location or None, the semantic location of
             the end of the segment
+        metrics_recomputed (int): number of points whose metrics were computed
+            by `compute_metrics`, over the life of the segment
+        metrics_pending (bool): True if the metrics are computed only when
+            first needed, see `defer_metrics`
     """
 
     def __init__(self, points):
-        self.points = points
+        self._points = points
+        self._dirty = None
+        self.metrics_recomputed = 0
+        self.metrics_pending = False
+        self._edge_index = None
         self.transportation_modes = []
         self.location_from = None
         self.location_to = None
 
+    @property
+    def points(self):
+        """ :obj:`list` of :obj:`Point` or :obj:`PointArray`: points of the segment """
+        return self._points
+
+    @points.setter
+    def points(self, points):
+        self.update_points(points)
+
+    def update_points(self, points, kept=None):
+        """ Replaces the points of the segment, keeping track of the metrics
+            that are still valid
+
+        Args:
+            points (:obj:`list` of :obj:`Point` or :obj:`PointArray`): new points
+            kept (:obj:`list` of int, optional): For each new point, its index in
+                the current points. If None, every metric is invalidated
+        Returns:
+            :obj:`Segment`: self
+        """
+        old_points = self._points
+        if self.is_columnar() and not isinstance(points, PointArray):
+            if kept is not None:
+                points = old_points.take(kept)
+            else:
+                points = PointArray.from_points(points)
+
+        if kept is None or self.outdated_metrics() is None:
+            self._dirty = None
+        else:
+            kept = np.asarray(kept, dtype=np.intp)
+            dirty = self._dirty[kept]
+            dirty[1:] |= np.diff(kept) != 1
+            self._dirty = dirty
+
+        if kept is None or len(kept) != len(old_points) or \
+                np.any(np.asarray(kept) != np.arange(len(kept))):
+            self._edge_index = None
+
+        self._points = points
+        return self
+
+    def invalidate_metrics(self, start=0, end=None):
+        """ Marks the metrics of a range of points as outdated
+
+        Should be called after changing points in place, so that the next
+        `compute_metrics` recomputes them.
+
+        Args:
+            start (int, optional): First point changed. Defaults to 0
+            end (int, optional): Index after the last point changed. Defaults to
+                the end of the segment
+        Returns:
+            :obj:`Segment`: self
+        """
+        self._edge_index = None
+        if self.outdated_metrics() is not None:
+            # the point after the range is computed relative to a changed point
+            if end is None:
+                end = len(self._dirty)
+            self._dirty[start:end + 1] = True
+        return self
+
+    def outdated_metrics(self):
+        """ Points whose metrics are outdated
+
+        Points added or removed without `update_points`, such as points
+        appended to the list, leave every metric outdated
+
+        Returns:
+            :obj:`numpy.ndarray` of bool: True for each outdated point. None
+                if every metric is outdated
+        """
+        if self._dirty is not None and len(self._dirty) != len(self._points):
+            self._dirty = np.ones(len(self._points), dtype=bool)
+        return self._dirty
+
+    def validate_metrics(self):
+        """ Marks the metrics of every point as up to date
+
+        Should be called when the points already hold their metrics, such
+        as points loaded from a file, so that `compute_metrics` skips them.
+
+        Returns:
+            :obj:`Segment`: self
+        """
+        self._dirty = np.zeros(len(self._points), dtype=bool)
+        return self
+
+    def edge_index(self):
+        """ Index of the edges of the segment, used by `segment_similarity`
+
+        It's built when first needed and kept until the points change, through
+        `update_points` (as `merge_and_fit` and `simplify` do) or
+        `invalidate_metrics`, so that segments compared many times, such as
+        canonical trips, don't build it again for every comparison
+
+        Returns:
+            :obj:`similarity.EdgeIndex`
+        """
+        if self._edge_index is None or len(self._edge_index.lats) != len(self._points):
+            self._edge_index = EdgeIndex.from_points(self._points)
+        return self._edge_index
+
+    def defer_metrics(self):
+        """ Postpones the computation of metrics until they're first needed
+
+        Stages that use the metrics, such as `smooth`, `segment` and
+        `infer_transportation_mode`, compute them first. Until then, or
+        until `compute_metrics` is called, the metrics of the points
+        aren't valid.
+
+        Returns:
+            :obj:`Segment`: self
+        """
+        self.metrics_pending = True
+        return self
+
+    def pending_metrics(self):
+        """ Computes the metrics, if they were deferred
+
+        See `defer_metrics`
+
+        Returns:
+            :obj:`Segment`: self
+        """
+        if self.metrics_pending:
+            self.compute_metrics()
+        return self
+
+    def subsegment(self, points):
+        """ Creates a segment with some of the points of this one
+
+        Metrics still valid for those points are kept
+
+        Args:
+            points (:obj:`list` of :obj:`Point`): points of this segment
+        Returns:
+            :obj:`Segment`
+        """
+        kept = kept_indexes(self._points, points)
+        segment = Segment(self._points)
+        segment._dirty = self.outdated_metrics() #pylint: disable=protected-access
+        segment.metrics_pending = self.metrics_pending
+        return segment.update_points(points, kept)
+
+    def is_columnar(self):
+        """ Checks if the points are stored in columnar arrays
+
+        Returns:
+            bool
+        """
+        return isinstance(self._points, PointArray)
+
+    def to_columnar(self):
+        """ In-place conversion of the points to columnar storage
+
+        See `PointArray`
+
+        Returns:
+            :obj:`Segment`: self
+        """
+        self._points = PointArray.from_points(self._points)
+        return self
+
+    def to_points(self):
+        """ In-place conversion of the points back to a list of `Point`
+
+        Returns:
+            :obj:`Segment`: self
+        """
+        if self.is_columnar():
+            self._points = self._points.to_points()
+        return self
+
     def bounds(self, thr=0, lower_index=0, upper_index=-1):
         """ Computes the bounds of the segment, or part of it
 
@@ -74,6 +307,16 @@ class Segment(object):
         """
         points = self.points[lower_index:upper_index]
 
+        if isinstance(points, PointArray):
+            if len(points) == 0:
+                return (float("inf"), float("inf"), -float("inf"), -float("inf"))
+            return (
+                points.lat.min() - thr,
+                points.lon.min() - thr,
+                points.lat.max() + thr,
+                points.lon.max() + thr
+            )
+
         min_lat = float("inf")
         min_lon = float("inf")
         max_lat = -float("inf")
@@ -95,8 +338,13 @@ class Segment(object):
         Returns:
             :obj:`Segment`
         """
-        self.points = remove_liers(self.points)
-        return self
+        points = self.points
+        if isinstance(points, PointArray):
+            kept = non_liers(points.timestamp)
+            return self.update_points(points.take(kept), kept)
+
+        result = remove_liers(points)
+        return self.update_points(result, kept_indexes(points, result))
 
     def smooth(self, noise, strategy=INVERSE_STRATEGY):
         """ In-place smoothing
@@ -110,11 +358,12 @@ class Segment(object):
         Returns:
             :obj:`Segment`
         """
-        if strategy is INVERSE_STRATEGY:
+        self.pending_metrics()
+        if strategy == INVERSE_STRATEGY:
             self.points = with_inverse(self.points, noise)
-        elif strategy is EXTRAPOLATE_STRATEGY:
+        elif strategy == EXTRAPOLATE_STRATEGY:
             self.points = with_extrapolation(self.points, noise, 30)
-        elif strategy is NO_STRATEGY:
+        elif strategy == NO_STRATEGY:
             self.points = with_no_strategy(self.points, noise)
         return self
 
@@ -129,9 +378,24 @@ class Segment(object):
         Returns:
             :obj:`list` of :obj:`Point`
         """
+        self.pending_metrics()
         return spatiotemporal_segmentation(self.points, eps, min_time)
 
-    def simplify(self, eps, max_dist_error, max_speed_error, topology_only=False):
+    def split(self, eps, min_time):
+        """ Spatio-temporal segmentation into segments
+
+        See `segment` and `subsegment`
+
+        Args:
+            eps (float): Maximum distance between two samples
+            min_time (float): Minimum time between to segment
+        Returns:
+            :obj:`list` of :obj:`Segment`
+        """
+        return [self.subsegment(points) for points in self.segment(eps, min_time)]
+
+    def simplify(self, eps, max_dist_error, max_speed_error, topology_only=False,
+                 strategy=None, max_window=SPT_MAX_WINDOW):
         """ In-place segment simplification
 
         See `drp` and `compression` modules
@@ -142,23 +406,103 @@ class Segment(object):
             max_speed_error (float): Max speed error, in km/h
             topology_only (bool, optional): True to only keep topology, not considering
                 times when simplifying. Defaults to False.
+            strategy (str, optional): Compression algorithm to use. Either
+                compression.DRP_STRATEGY, compression.SPT_STRATEGY,
+                compression.TD_SP_STRATEGY or compression.TD_TR_STRATEGY.
+                Defaults to drp if `topology_only`, spt otherwise
+            max_window (int, optional): Max number of points spanned by two
+                consecutive kept points, with the spt strategy, which bounds
+                its running time, see `compression.spt`. A point is kept at
+                least every `max_window` points, even on stretches without
+                errors, so the output differs from an unlimited spt on long
+                segments. None for no limit, which takes quadratic time.
+                Defaults to SPT_MAX_WINDOW
         Returns:
             :obj:`Segment`
         """
-        if topology_only:
-            self.points = drp(self.points, eps)
+        if strategy is None:
+            strategy = DRP_STRATEGY if topology_only else SPT_STRATEGY
+        if len(self.points) <= 2:
+            return self
+
+        lats, lons, timestamps = coordinates_and_times(self.points)
+        if strategy == DRP_STRATEGY:
+            kept = drp_indexes(lats, lons, eps)
+        elif strategy == SPT_STRATEGY:
+            kept = spt_indexes(
+                lats, lons, timestamps, max_dist_error, max_speed_error, max_window
+            )
+        elif strategy == TD_SP_STRATEGY:
+            kept = td_sp_indexes(lats, lons, timestamps, max_speed_error)
+        elif strategy == TD_TR_STRATEGY:
+            kept = td_tr_indexes(lats, lons, timestamps, max_dist_error)
         else:
-            self.points = spt(self.points, max_dist_error, max_speed_error)
-        return self
+            raise ValueError('Unknown simplification strategy: %s' % strategy)
+
+        if self.is_columnar():
+            return self.update_points(self.points.take(kept), kept)
+        return self.update_points([self.points[i] for i in kept], kept)
 
     def compute_metrics(self):
         """ Computes metrics for each point
 
+        Only the points changed since the last call are computed, see
+        `update_points` and `invalidate_metrics`, and all of them are computed
+        at once, over arrays. See `metrics.compute_metrics` and
+        `Point.compute_metrics`. Points changed in place, such as with
+        `points[i].lat = ...`, aren't noticed, `invalidate_metrics` must be
+        called for them
+
         Returns:
             :obj:`Segment`: self
         """
-        for prev, point in pairwise(self.points):
-            point.compute_metrics(prev)
+        self.metrics_pending = False
+        points = self.points
+        dirty = self.outdated_metrics()
+        if dirty is None:
+            indexes = None
+        else:
+            # the acceleration depends on the velocity of the previous point
+            outdated = dirty.copy()
+            outdated[1:] |= dirty[:-1]
+            indexes = np.flatnonzero(outdated)
+            if len(indexes) == 0 or (len(indexes) == 1 and indexes[0] == 0):
+                return self
+
+        if isinstance(points, PointArray):
+            self.metrics_recomputed += compute_metrics(
+                points.lat, points.lon, points.timestamp,
+                points.dt, points.dx, points.vel, points.acc,
+                indexes
+            )
+        elif len(points) > 1:
+            if indexes is None:
+                selected = np.arange(len(points))
+            else:
+                selected = np.union1d(indexes, indexes[indexes > 0] - 1)
+
+            columns = PointArray(
+                [points[i].lat for i in selected],
+                [points[i].lon for i in selected],
+                [points[i].get_timestamp() for i in selected],
+                vel=[points[i].vel for i in selected]
+            )
+            positions = None if indexes is None else np.searchsorted(selected, indexes)
+            self.metrics_recomputed += compute_metrics(
+                columns.lat, columns.lon, columns.timestamp,
+                columns.dt, columns.dx, columns.vel, columns.acc,
+                positions
+            )
+            if positions is None:
+                positions = selected
+            for position in positions[positions > 0]:
+                point = points[selected[position]]
+                point.dt = float(columns.dt[position])
+                point.dx = float(columns.dx[position])
+                point.vel = float(columns.vel[position])
+                point.acc = float(columns.acc[position])
+
+        self._dirty = np.zeros(len(points), dtype=bool)
         return self
 
     def infer_location(
@@ -209,6 +553,7 @@ class Segment(object):
         Returns:
             :obj:`Segment`: self
         """
+        self.pending_metrics()
         self.transportation_modes = speed_clustering(clf, self.points, min_time)
         return self
 
@@ -273,9 +618,14 @@ class Segment(object):
             reverse = True
 
         seg = self.copy()
-        seg.points = seg.points[start:end+1]
+        kept = np.arange(len(seg.points))[start:end+1]
         if reverse:
-            seg.points = list(reversed(seg.points))
+            kept = kept[::-1]
+        points = seg.points
+        if isinstance(points, PointArray):
+            seg.update_points(points.take(kept), kept)
+        else:
+            seg.update_points([points[i] for i in kept], kept)
 
         return seg
 
@@ -287,13 +637,35 @@ class Segment(object):
         """
         return deepcopy(self)
 
-    def to_json(self):
+    def to_json(self, arrays=False):
         """ Converts segment to a JSON serializable format
 
+        Args:
+            arrays (bool, optional): True to write the points as arrays, such
+                as {"lat": [...], "lon": [...], "time": [...]}, instead of a
+                list of points, see `Point.to_json`. Arrays are smaller and
+                faster to read. Defaults to False
         Returns:
             :obj:`dict`
         """
-        points = [point.to_json() for point in self.points]
+        points = self.points
+        if isinstance(points, PointArray):
+            lats, lons, timestamps = points.lat.tolist(), points.lon.tolist(), points.timestamp
+        else:
+            lats = [point.lat for point in points]
+            lons = [point.lon for point in points]
+            timestamps = [
+                np.nan if point.timestamp is None else point.timestamp for point in points
+            ]
+        times = timestamps_to_isostr(timestamps)
+
+        if arrays:
+            points = {'lat': lats, 'lon': lons, 'time': times}
+        else:
+            points = [
+                {'lat': lat, 'lon': lon, 'time': time}
+                for lat, lon, time in zip(lats, lons, times)
+            ]
         return {
             'points': points,
             'transportationModes': self.transportation_modes,
@@ -318,17 +690,46 @@ class Segment(object):
         return Segment(points)
 
     @staticmethod
-    def from_json(json):
+    def from_json(json, columnar=False):
         """ Creates a segment from a JSON file.
 
-        No preprocessing is done.
+        No preprocessing is done. Points can be either a list or arrays, see
+        to_json. Times are parsed all at once, see `isostr_to_timestamps`
 
         Arguments:
             json (:obj:`dict`): JSON representation. See to_json.
+            columnar (bool, optional): True to store the points in columnar
+                arrays, see `to_columnar`. Defaults to False
         Return:
             :obj:`Segment`
         """
-        points = []
-        for point in json['points']:
-            points.append(Point.from_json(point))
-        return Segment(points)
+        points = json['points']
+        if isinstance(points, dict):
+            lats, lons, times = points['lat'], points['lon'], points['time']
+        else:
+            lats = [point['lat'] for point in points]
+            lons = [point['lon'] for point in points]
+            times = [point.get('time') for point in points]
+        timestamps = isostr_to_timestamps(times)
+
+        if columnar:
+            return Segment(PointArray(lats, lons, timestamps))
+        return Segment([
+            Point(lat, lon, None if timestamp != timestamp else timestamp)
+            for lat, lon, timestamp in zip(lats, lons, timestamps.tolist())
+        ])
+
+    @staticmethod
+    def from_arrays(lats, lons, timestamps):
+        """ Creates a columnar segment from arrays.
+
+        No preprocessing is done.
+
+        Arguments:
+            lats (:obj:`list` of float): latitudes
+            lons (:obj:`list` of float): longitudes
+            timestamps (:obj:`list` of float): seconds since epoch
+        Return:
+            :obj:`Segment`
+        """
+        return Segment(PointArray(lats, lons, timestamps))
@@ -4,6 +4,7 @@ Similarity functions
 import math
 import numpy as np
 from rtree import index
+from .compression import coordinates
 
 #pylint: disable=invalid-name
 
@@ -214,50 +215,366 @@ def bounding_box_from(points, i, i1, thr):
 
     return min_lat-thr, min_lon-thr, max_lat+thr, max_lon+thr
 
+def distance_similarities(a, b, p, T=CLOSE_DISTANCE_THRESHOLD):
+    """Computes the distance similarity between many line segments
+    and points, see distance_similarity
+
+    Args:
+        a (:obj:`numpy.ndarray`): Nx2 x and y coordinates. Lines start
+        b (:obj:`numpy.ndarray`): Nx2 x and y coordinates. Lines end
+        p (:obj:`numpy.ndarray`): Nx2 x and y coordinates. Points to compute the distance
+    Returns:
+        :obj:`numpy.ndarray`: between 0 and 1, for each line and point
+    """
+    ap = p - a
+    ab = b - a
+    mag = np.einsum('ij,ij->i', ab, ab)
+    proj = np.einsum('ij,ij->i', ap, ab)
+    dist = np.divide(proj, mag, out=np.zeros_like(proj), where=mag != 0)
+    dist = np.clip(dist, 0, 1)
+    closest = a + ab * dist[:, np.newaxis]
+    d = np.sqrt(np.sum((p - closest) ** 2, axis=1))
+    r = (-1/float(T)) * d + 1
+    return np.maximum(r, 0)
+
+def normalized_lines(p1, p2):
+    """Normalized coefficients of many lines, see line and normalize
+
+    Args:
+        p1 (:obj:`numpy.ndarray`): Nx2 x and y coordinates
+        p2 (:obj:`numpy.ndarray`): Nx2 x and y coordinates
+    Returns:
+        :obj:`numpy.ndarray`: Nx2
+    """
+    coefs = np.column_stack((p1[:, 1] - p2[:, 1], p2[:, 0] - p1[:, 0]))
+    l = np.sqrt(np.sum(coefs ** 2, axis=1))
+    return np.divide(coefs, l[:, np.newaxis], out=np.zeros_like(coefs), where=l[:, np.newaxis] != 0)
+
+def line_similarities(p1a, p1b, p2a, p2b, T=CLOSE_DISTANCE_THRESHOLD):
+    """Similarity between many pairs of lines, see line_similarity
+
+    Args:
+        p1a (:obj:`numpy.ndarray`): Nx2 x and y coordinates. Lines A start
+        p1b (:obj:`numpy.ndarray`): Nx2 x and y coordinates. Lines A end
+        p2a (:obj:`numpy.ndarray`): Nx2 x and y coordinates. Lines B start
+        p2b (:obj:`numpy.ndarray`): Nx2 x and y coordinates. Lines B end
+    Returns:
+        :obj:`numpy.ndarray`: between 0 and 1, for each pair of lines
+    """
+    d1 = distance_similarities(p1a, p1b, p2a, T=T)
+    d2 = distance_similarities(p1a, p1b, p2b, T=T)
+    d = np.abs(d1 + d2) * 0.5
+    a = np.abs(np.sum(normalized_lines(p1a, p1b) * normalized_lines(p2a, p2b), axis=1))
+    return d * a
+
+# above this number of pairs of edges, candidate pairs are found with an
+# R-tree instead of comparing every bounding box
+BROADCAST_LIMIT = 1 << 18
+
+def edge_boxes(lats, lons, thr):
+    """Bounding boxes of the edges of a segment, see bounding_box_from
+
+    Args:
+        lats (:obj:`numpy.ndarray`): latitudes of the points
+        lons (:obj:`numpy.ndarray`): longitudes of the points
+        thr (float): Margin of the boxes
+    Returns:
+        :obj:`numpy.ndarray`: Nx4 boxes, with min lat, min lon, max lat and
+            max lon of each edge
+    """
+    return np.column_stack((
+        np.minimum(lats[:-1], lats[1:]) - thr,
+        np.minimum(lons[:-1], lons[1:]) - thr,
+        np.maximum(lats[:-1], lats[1:]) + thr,
+        np.maximum(lons[:-1], lons[1:]) + thr
+    ))
+
+def box_intersections(a_boxes, b_boxes):
+    """Pairs of boxes that intersect, comparing all against all
+
+    Args:
+        a_boxes (:obj:`numpy.ndarray`): Nx4 boxes
+        b_boxes (:obj:`numpy.ndarray`): Mx4 boxes
+    Returns:
+        (:obj:`numpy.ndarray`, :obj:`numpy.ndarray`): index of the box of B
+            and of the box of A of each pair
+    """
+    return np.nonzero(
+        (b_boxes[:, np.newaxis, 0] <= a_boxes[np.newaxis, :, 2]) &
+        (b_boxes[:, np.newaxis, 2] >= a_boxes[np.newaxis, :, 0]) &
+        (b_boxes[:, np.newaxis, 1] <= a_boxes[np.newaxis, :, 3]) &
+        (b_boxes[:, np.newaxis, 3] >= a_boxes[np.newaxis, :, 1])
+    )
+
+def box_tree(boxes):
+    """R-tree of boxes, bulk loaded
+
+    Args:
+        boxes (:obj:`numpy.ndarray`): Nx4 boxes
+    Returns:
+        :obj:`rtree.index.Index`: with the index of each box as id
+    """
+    return index.Index((i, tuple(box), None) for i, box in enumerate(boxes.tolist()))
+
+def tree_intersections(tree, boxes):
+    """Pairs of boxes that intersect, querying an R-tree
+
+    Args:
+        tree (:obj:`rtree.index.Index`): R-tree of boxes, see box_tree
+        boxes (:obj:`numpy.ndarray`): Mx4 boxes
+    Returns:
+        (:obj:`numpy.ndarray`, :obj:`numpy.ndarray`): index of the box in
+            boxes and of the box in the tree of each pair
+    """
+    hits = [list(tree.intersection(tuple(box))) for box in boxes.tolist()]
+    counts = [len(hit) for hit in hits]
+    query_index = np.repeat(np.arange(len(boxes)), counts)
+    tree_index = np.fromiter(
+        (i for hit in hits for i in hit), dtype=np.intp, count=sum(counts)
+    )
+    return query_index, tree_index
+
+def candidate_edges(a_boxes, b_boxes):
+    """Pairs of edges whose bounding boxes intersect
+
+    Small sets of edges are compared all against all, bigger ones through
+    an R-tree, bulk loaded with the edges of A
+
+    Args:
+        a_boxes (:obj:`numpy.ndarray`): Nx4 boxes of the edges of A
+        b_boxes (:obj:`numpy.ndarray`): Mx4 boxes of the edges of B
+    Returns:
+        (:obj:`numpy.ndarray`, :obj:`numpy.ndarray`): index of the edge of B
+            and of the edge of A of each pair
+    """
+    if len(a_boxes) == 0 or len(b_boxes) == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+
+    if len(a_boxes) * len(b_boxes) <= BROADCAST_LIMIT:
+        return box_intersections(a_boxes, b_boxes)
+    return tree_intersections(box_tree(a_boxes), b_boxes)
+
+class EdgeIndex(object):
+    """Edges of a segment, ready to be compared by segment_similarity
+
+    The coordinates are taken once, and the bounding boxes and R-trees of
+    the edges are built when first needed, for each threshold, and kept.
+    Segments that are compared many times, such as canonical trips, hold
+    one, see `Segment.edge_index`
+
+    R-trees aren't copied nor pickled, they're built again when needed
+
+    Attributes:
+        lats (:obj:`numpy.ndarray`): latitudes of the points
+        lons (:obj:`numpy.ndarray`): longitudes of the points
+        xy (:obj:`numpy.ndarray`): Nx2 x and y coordinates of the points, as in gen2arr
+    """
+    def __init__(self, lats, lons):
+        self.lats = lats
+        self.lons = lons
+        self.xy = np.column_stack((lons, lats))
+        self._boxes = {}
+        self._trees = {}
+
+    @staticmethod
+    def from_points(points):
+        """Creates the index of the edges between points
+
+        Args:
+            points (:obj:`list` of :obj:`Point` or :obj:`PointArray`)
+        Returns:
+            :obj:`EdgeIndex`
+        """
+        lats, lons = coordinates(points)
+        return EdgeIndex(lats, lons)
+
+    def __len__(self):
+        return max(len(self.lats) - 1, 0)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_trees'] = {}
+        return state
+
+    def boxes(self, thr):
+        """Bounding boxes of the edges, see edge_boxes
+
+        Args:
+            thr (float): Margin of the boxes
+        Returns:
+            :obj:`numpy.ndarray`: Nx4 boxes
+        """
+        if thr not in self._boxes:
+            self._boxes[thr] = edge_boxes(self.lats, self.lons, thr)
+        return self._boxes[thr]
+
+    def tree(self, thr):
+        """R-tree of the bounding boxes of the edges, see box_tree
+
+        Args:
+            thr (float): Margin of the boxes
+        Returns:
+            :obj:`rtree.index.Index`
+        """
+        if thr not in self._trees:
+            self._trees[thr] = box_tree(self.boxes(thr))
+        return self._trees[thr]
+
+    def has_tree(self, thr):
+        """Checks if the R-tree of a threshold is already built
+
+        Args:
+            thr (float): Margin of the boxes
+        Returns:
+            bool
+        """
+        return thr in self._trees
+
+    def candidates(self, other, thr):
+        """Pairs of edges, of this and of another index, whose bounding boxes
+        intersect, see candidate_edges
+
+        Big sets of edges are queried against the R-tree of this index, or
+        against the one of the other, if only that one is built
+
+        Args:
+            other (:obj:`EdgeIndex`)
+            thr (float): Margin of the boxes
+        Returns:
+            (:obj:`numpy.ndarray`, :obj:`numpy.ndarray`): index of the edge
+                of other and of the edge of this index of each pair
+        """
+        if len(self) == 0 or len(other) == 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+
+        if len(self) * len(other) <= BROADCAST_LIMIT:
+            return box_intersections(self.boxes(thr), other.boxes(thr))
+        if other.has_tree(thr) and not self.has_tree(thr):
+            own_index, other_index = tree_intersections(other.tree(thr), self.boxes(thr))
+            order = np.argsort(other_index, kind='mergesort')
+            return other_index[order], own_index[order]
+        return tree_intersections(self.tree(thr), other.boxes(thr))
+
+def edge_index_of(segment):
+    """Index of the edges of a segment, reusing the one the segment keeps
+
+    Args:
+        segment (:obj:`Segment` or :obj:`EdgeIndex`)
+    Returns:
+        :obj:`EdgeIndex`
+    """
+    if isinstance(segment, EdgeIndex):
+        return segment
+    if hasattr(segment, 'edge_index'):
+        return segment.edge_index()
+    return EdgeIndex.from_points(segment.points)
+
+def edge_pair_similarities(a_edges, b_edges, b_index, a_index, T=CLOSE_DISTANCE_THRESHOLD):
+    """Similarity between pairs of edges of two segments, see line_similarities
+
+    Args:
+        a_edges (:obj:`EdgeIndex`)
+        b_edges (:obj:`EdgeIndex`)
+        b_index (:obj:`numpy.ndarray`): index of the edge of B of each pair
+        a_index (:obj:`numpy.ndarray`): index of the edge of A of each pair
+    Returns:
+        :obj:`numpy.ndarray`: between 0 and 1, for each pair of edges
+    """
+    a_xy = a_edges.xy
+    b_xy = b_edges.xy
+    return line_similarities(
+        b_xy[b_index], b_xy[b_index + 1], a_xy[a_index], a_xy[a_index + 1], T
+    )
+
 def segment_similarity(A, B, T=CLOSE_DISTANCE_THRESHOLD):
     """Computes the similarity between two segments
 
+    Each edge of B is compared with the edges of A close to it, and scored
+    with the mean of their line_similarity. All pairs of edges are scored
+    at once. The edge indexes the segments keep are reused, see EdgeIndex
+
     Args:
-        A (:obj:`Segment`)
-        B (:obj:`Segment`)
+        A (:obj:`Segment` or :obj:`EdgeIndex`)
+        B (:obj:`Segment` or :obj:`EdgeIndex`)
     Returns:
         float: between 0 and 1. Where 1 is very similar and 0 is completely different
+        :obj:`list` of float: similarity of each edge of B
     """
-    l_a = len(A.points)
-    l_b = len(B.points)
-
-    idx = index.Index()
-    dex = 0
-    for i in range(l_a-1):
-        idx.insert(dex, bounding_box_from(A.points, i, i+1, T), obj=[A.points[i], A.points[i+1]])
-        dex = dex + 1
-
-    prox_acc = []
-
-    for i in range(l_b-1):
-        ti = B.points[i].gen2arr()
-        ti1 = B.points[i+1].gen2arr()
-        bb = bounding_box_from(B.points, i, i+1, T)
-        intersects = idx.intersection(bb, objects=True)
-        n_prox = []
-        i_prox = 0
-        a = 0
-        for x in intersects:
-            a = a + 1
-            pi = x.object[0].gen2arr()
-            pi1 = x.object[1].gen2arr()
-            prox = line_similarity(ti, ti1, pi, pi1, T)
-            i_prox = i_prox + prox
-            n_prox.append(prox)
-
-        if a != 0:
-            prox_acc.append(i_prox / a)
-            # prox_acc.append(max(n_prox))
-        else:
-            prox_acc.append(0)
+    a_edges = edge_index_of(A)
+    b_edges = edge_index_of(B)
+    n_edges = len(b_edges)
+
+    b_index, a_index = a_edges.candidates(b_edges, T)
+    prox = edge_pair_similarities(a_edges, b_edges, b_index, a_index, T)
+
+    counts = np.bincount(b_index, minlength=n_edges)
+    sums = np.bincount(b_index, weights=prox, minlength=n_edges)
+    prox_acc = np.divide(sums, counts, out=np.zeros(n_edges), where=counts != 0).tolist()
 
     return np.mean(prox_acc), prox_acc
 
+# number of edges of B scored at a time by thresholded_segment_similarity
+THRESHOLD_CHUNK_SIZE = 32
+
+def thresholded_segment_similarity(A, B, threshold, T=CLOSE_DISTANCE_THRESHOLD,
+                                   chunk_size=THRESHOLD_CHUNK_SIZE, accept_early=True):
+    """Decides if the similarity between two segments reaches a threshold,
+    see segment_similarity
+
+    The edges of B are scored a few at a time, and the scoring stops as
+    soon as the similarity can't reach the threshold, even if every edge
+    left scores 1, or, if `accept_early`, reaches it, even if every edge
+    left scores 0. Edges without edges of A close to them score 0, so
+    they're never scored
+
+    Args:
+        A (:obj:`Segment` or :obj:`EdgeIndex`)
+        B (:obj:`Segment` or :obj:`EdgeIndex`)
+        threshold (float): Similarity to reach
+        chunk_size (int, optional): Number of edges of B scored at a time.
+            Defaults to THRESHOLD_CHUNK_SIZE
+        accept_early (bool, optional): False to keep scoring once the
+            threshold is reached, so that the bounds are the similarity
+            of segments that reach it. Defaults to True
+    Returns:
+        bool: True if the similarity is greater or equal to the threshold
+        (float, float): lower and upper bounds of the similarity. They're
+            the same if every edge was scored
+    """
+    a_edges = edge_index_of(A)
+    b_edges = edge_index_of(B)
+    n_edges = len(b_edges)
+    if n_edges == 0:
+        return False, (0., 0.)
+
+    b_index, a_index = a_edges.candidates(b_edges, T)
+    # candidate pairs are sorted by edge of B
+    order = np.argsort(b_index, kind='mergesort')
+    b_index = b_index[order]
+    a_index = a_index[order]
+    scored = np.unique(b_index)
+
+    total = 0.
+    left = len(scored)
+    for start in range(0, len(scored), chunk_size):
+        lower = total / n_edges
+        upper = (total + left) / n_edges
+        if upper < threshold or (accept_early and lower >= threshold):
+            return lower >= threshold, (lower, upper)
+
+        edges = scored[start:start + chunk_size]
+        first, last = np.searchsorted(b_index, [edges[0], edges[-1] + 1])
+        prox = edge_pair_similarities(
+            a_edges, b_edges, b_index[first:last], a_index[first:last], T
+        )
+        counts = np.bincount(b_index[first:last] - edges[0])
+        sums = np.bincount(b_index[first:last] - edges[0], weights=prox)
+        total += np.sum(sums[counts != 0] / counts[counts != 0])
+        left -= len(edges)
+
+    similarity = total / n_edges
+    return similarity >= threshold, (similarity, similarity)
+
 def sort_segment_points(Aps, Bps):
     """Takes two line segments and sorts all their points,
     so that they form a continuous path
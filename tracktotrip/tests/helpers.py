@@ -0,0 +1,68 @@
+"""
+Tracks and comparisons shared by the unit tests
+"""
+from datetime import datetime, timedelta
+from tracktotrip import Point, Segment, Track
+
+START = datetime(2016, 7, 15, 8, 0, 0)
+
+def north_east_segment(n_points, lat=38.7, start=START, gap_at=None):
+    """ Creates a segment going north east, with some noise, and a point
+        per second
+
+    Args:
+        n_points (int): Number of points
+        lat (float, optional): Latitude of the first point. Defaults to 38.7
+        start (:obj:`datetime`, optional): Time of the first point
+        gap_at (int, optional): Index of the point after which there's a gap
+            of an hour, that is split when segmenting. Defaults to None
+    Returns:
+        :obj:`Segment`
+    """
+    points = []
+    for i in range(n_points):
+        seconds = i if gap_at is None or i < gap_at else i + 3600
+        points.append(Point(
+            lat + i * 0.00005 + (i % 3) * 0.00001,
+            -9.1 + i * 0.00003,
+            start + timedelta(seconds=seconds)
+        ))
+    return Segment(points)
+
+def north_east_track(name, sizes, gap_at=None):
+    """ Creates a track going north east, with a segment for each size.
+        Each segment starts an hour, and 0.01 degrees, after the previous
+
+    Args:
+        name (str): Name of the track
+        sizes (:obj:`list` of int): Number of points of each segment
+        gap_at (int, optional): See `north_east_segment`
+    Returns:
+        :obj:`Track`
+    """
+    return Track(name, [
+        north_east_segment(size, 38.7 + j * 0.01, START + timedelta(hours=j), gap_at)
+        for j, size in enumerate(sizes)
+    ])
+
+def segment_positions(segments):
+    """ Positions and times of every point of each segment """
+    return [[(p.lat, p.lon, p.time) for p in segment.points] for segment in segments]
+
+def positions(track):
+    """ Positions and times of every point of a track """
+    return segment_positions(track.segments)
+
+def points_of(track):
+    """ Positions, times and metrics of the points of each segment,
+    with NaN metrics as None, so that they can be compared
+    """
+    return [
+        [
+            tuple(None if value != value else value for value in [
+                point.lat, point.lon, point.time, point.dt, point.dx, point.vel, point.acc
+            ])
+            for point in segment.points
+        ]
+        for segment in track.segments
+    ]
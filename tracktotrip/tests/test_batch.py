@@ -0,0 +1,77 @@
+"""
+Unit tests for batch module
+"""
+import unittest
+from tracktotrip import Point
+from tracktotrip.location import Location
+from tracktotrip.smooth import INVERSE_STRATEGY
+from tracktotrip.batch import to_trip_batch, pack_track, unpack_track
+from tracktotrip.tests.helpers import north_east_track, positions, points_of
+
+PARAMS = {
+    'smooth': True,
+    'smooth_strategy': INVERSE_STRATEGY,
+    'smooth_noise': 1000,
+    'seg': True,
+    'seg_eps': 0.15,
+    'seg_min_time': 80,
+    'simplify': True,
+    'simplify_max_dist_error': 2,
+    'simplify_max_speed_error': 1
+}
+
+class TestBatch(unittest.TestCase):
+    """
+    Tests parallel processing of tracks
+    """
+    def test_pack(self):
+        """ Tests that packing keeps points, metrics and meta
+        """
+        track = north_east_track('a', [50]).compute_metrics()
+        track.segments[0].points[3].time = None
+        track.segments[0].invalidate_metrics(3, 4)
+        track.meta = [{'source': 'test'}]
+        segment = track.segments[0]
+        segment.transportation_modes = [{'label': 'walk', 'from': 0, 'to': 49}]
+        segment.location_from = Location('Home', Point(38.7, -9.1, None), [{'label': 'Work'}])
+        result = unpack_track(pack_track(track))
+        self.assertEqual(points_of(result), points_of(track))
+        self.assertEqual(result.meta, track.meta)
+        self.assertEqual(result.segments[0].transportation_modes, segment.transportation_modes)
+        self.assertEqual(result.segments[0].location_from.to_json(), segment.location_from.to_json())
+        self.assertIsNone(result.segments[0].location_to)
+
+        result.compute_metrics()
+        self.assertEqual(result.segments[0].metrics_recomputed, 0)
+        self.assertEqual(points_of(result), points_of(track))
+
+    def test_to_trip_batch(self):
+        """ Tests that results match to_trip, and that failures are isolated
+        """
+        sources = [
+            north_east_track('a', [300]), '/non/existing/file.gpx', north_east_track('b', [500])
+        ]
+        sources[0].meta = [{'size': 300}]
+        sources[2].meta = [{'size': 500}]
+        results = sorted(to_trip_batch(sources, PARAMS, processes=2), key=lambda r: r.index)
+
+        self.assertEqual([result.index for result in results], [0, 1, 2])
+        self.assertEqual([result.ok for result in results], [True, False, True])
+        self.assertEqual(results[1].source, '/non/existing/file.gpx')
+        self.assertTrue('IOError' in results[1].error)
+
+        for result, size in [(results[0], 300), (results[2], 500)]:
+            expected = north_east_track(result.source, [size])
+            expected.meta = [{'size': size}]
+            expected.to_trip(**PARAMS)
+            self.assertEqual(len(result.tracks), 1)
+            self.assertEqual(points_of(result.tracks[0]), points_of(expected))
+            self.assertEqual(result.tracks[0].meta, expected.meta)
+            result.tracks[0].compute_metrics()
+            self.assertEqual(
+                [segment.metrics_recomputed for segment in result.tracks[0].segments],
+                [0] * len(expected.segments)
+            )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Unit tests for binary module
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+import numpy as np
+from tracktotrip import Point, Segment, Track
+from tracktotrip.location import Location
+from tracktotrip.binary import read_header, read_segments
+from tracktotrip.tests.helpers import points_of
+
+def build_track():
+    """ Track with two segments, metrics, modes and locations """
+    start = datetime(2016, 7, 15, 8, 0, 0)
+    first = Segment([
+        Point(38.7 + i * 0.0001, -9.1 - i * 0.0001, start + timedelta(seconds=i * 5))
+        for i in range(20)
+    ])
+    second = Segment([
+        Point(40.1, -8.1, start + timedelta(hours=1)),
+        Point(40.1001, -8.1001, None),
+        Point(40.1002, -8.1002, start + timedelta(hours=1, seconds=10))
+    ])
+    first.transportation_modes = [{'label': 'walk', 'from': 0, 'to': 19}]
+    first.location_from = Location('Home', Point(38.7, -9.1, start), [{'label': 'Work'}])
+    first.location_to = Location('Work', Point(38.702, -9.102, start), [])
+
+    track = Track('track.gpx', [first, second])
+    track.meta = [{'source': 'test'}]
+    return track.compute_metrics()
+
+class TestBinary(unittest.TestCase):
+    """ Tests the binary track format """
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'track.ttb')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_round_trip(self):
+        """ Points, metrics, modes and locations are kept, in both storages """
+        track = build_track()
+        track.to_binary(self.path)
+
+        for columnar in [True, False]:
+            loaded = Track.from_binary(self.path, columnar=columnar)
+            self.assertEqual(loaded.name, track.name)
+            self.assertEqual(loaded.meta, track.meta)
+            self.assertEqual(points_of(loaded), points_of(track))
+            self.assertEqual(
+                [segment.is_columnar() for segment in loaded.segments],
+                [columnar, columnar]
+            )
+
+            first = loaded.segments[0]
+            self.assertEqual(first.transportation_modes, track.segments[0].transportation_modes)
+            self.assertEqual(
+                first.location_from.to_json(), track.segments[0].location_from.to_json()
+            )
+            self.assertEqual(first.location_to.label, 'Work')
+            self.assertIsNone(loaded.segments[1].location_from)
+
+    def test_metrics(self):
+        """ Stored metrics aren't computed again, but positions only need them """
+        track = build_track()
+        track.to_binary(self.path)
+        loaded = Track.from_binary(self.path)
+        loaded.compute_metrics()
+        self.assertEqual([s.metrics_recomputed for s in loaded.segments], [0, 0])
+
+        track.to_binary(self.path, metrics=False)
+        self.assertEqual(read_header(self.path)[0]['columns'], ['lat', 'lon', 'timestamp'])
+        loaded = Track.from_binary(self.path)
+        loaded.compute_metrics()
+        self.assertEqual(points_of(loaded), points_of(track))
+
+    def test_json_round_trip(self):
+        """ Tracks read from JSON are written and read back the same """
+        track = Track.from_json(build_track().to_json())
+        track.to_binary(self.path)
+        loaded = Track.from_binary(self.path, columnar=False)
+        self.assertEqual(loaded.to_json(), track.to_json())
+
+    def test_memory_mapped(self):
+        """ Columns are views of the file, and changes don't reach it """
+        build_track().to_binary(self.path)
+        _, _, segments = read_segments(self.path)
+        points = segments[0].points
+        self.assertIsInstance(points.lat.base, np.memmap)
+
+        points.lat[0] = 0.
+        _, _, segments = read_segments(self.path)
+        self.assertEqual(segments[0].points.lat[0], 38.7)
+
+    def test_invalid_file(self):
+        """ Files that aren't binary tracks are rejected """
+        with open(self.path, 'wb') as output:
+            output.write(b'<?xml version="1.0"?><gpx></gpx>')
+        self.assertRaises(ValueError, read_header, self.path)
+
+if __name__ == '__main__':
+    unittest.main()
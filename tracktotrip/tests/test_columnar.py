@@ -0,0 +1,93 @@
+"""
+Unit tests for columnar module
+"""
+import unittest
+from datetime import datetime, timedelta
+from tracktotrip import Segment, Point
+from tracktotrip.columnar import PointArray, PointView
+from tracktotrip.segment import remove_liers
+
+def make_points(n_points):
+    """ Creates a list of points, one per second, along a line
+
+    Args:
+        n_points (int)
+    Returns:
+        :obj:`list` of :obj:`Point`
+    """
+    start = datetime(2016, 7, 15, 15, 27, 53)
+    return [
+        Point(38.7 + i * 0.0001, -9.1 - i * 0.0002, start + timedelta(seconds=i))
+        for i in range(n_points)
+    ]
+
+class TestColumnar(unittest.TestCase):
+    """
+    Tests the columnar storage of points
+    """
+    def test_views(self):
+        """ Tests that rows are exposed as points
+        """
+        points = make_points(5)
+        array = PointArray.from_points(points)
+
+        self.assertEqual(len(array), 5)
+        self.assertTrue(isinstance(array[2], PointView))
+        self.assertTrue(isinstance(array[2], Point))
+        self.assertEqual(array[-1].lat, points[-1].lat)
+        self.assertEqual(array[3].time, points[3].time)
+        self.assertEqual(array[1].distance(array[0]), points[1].distance(points[0]))
+        self.assertEqual(array[1], array[1])
+        self.assertRaises(IndexError, lambda: array[5])
+
+        array[2].lat = 10.0
+        self.assertEqual(array.lat[2], 10.0)
+
+        array[0] = points[4]
+        self.assertEqual(array[0].lon, points[4].lon)
+        self.assertEqual(array[0].time, points[4].time)
+
+    def test_slices(self):
+        """ Tests slicing and conversion back to points
+        """
+        points = make_points(6)
+        array = PointArray.from_points(points)
+
+        part = array[1:4]
+        self.assertTrue(isinstance(part, PointArray))
+        self.assertEqual([p.lat for p in part], [p.lat for p in points[1:4]])
+        self.assertEqual([p.lat for p in array[::-1]], [p.lat for p in reversed(points)])
+
+        part.lat[0] = 0.0
+        self.assertNotEqual(array.lat[1], 0.0)
+
+        copied = array.to_points()
+        self.assertEqual([p.time for p in copied], [p.time for p in points])
+
+    def test_remove_liers(self):
+        """ Tests that noise removal gives the same result for both storages
+        """
+        points = make_points(8)
+        points[3].time = points[3].time + timedelta(seconds=10)
+        expected = remove_liers(points)
+        result = remove_liers(PointArray.from_points(points))
+        self.assertEqual([p.time for p in result], [p.time for p in expected])
+
+    def test_segment(self):
+        """ Tests columnar segments
+        """
+        segment = Segment(make_points(5)).to_columnar()
+        self.assertTrue(segment.is_columnar())
+
+        segment.points = list(reversed(segment.points))
+        self.assertTrue(segment.is_columnar())
+
+        reverse = segment.slice(3, 1)
+        self.assertEqual([p.lat for p in reverse.points], [segment.points[i].lat for i in [3, 2, 1]])
+
+        columnar = Segment(make_points(5)).to_columnar()
+        self.assertEqual(Segment(make_points(5)).bounds(), columnar.bounds())
+        self.assertFalse(segment.to_points().is_columnar())
+
+if __name__ == '__main__':
+    unittest.main()
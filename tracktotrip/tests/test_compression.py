@@ -0,0 +1,279 @@
+"""
+Unit tests for compression module
+"""
+import random
+import unittest
+from datetime import datetime, timedelta
+from tracktotrip import Point
+from tracktotrip.columnar import PointArray
+from tracktotrip import Segment, Track
+from tracktotrip.compression import drp, spt, td_sp, td_tr, point_line_distance, OnlineSPT
+from tracktotrip.compression import TD_SP_STRATEGY, TD_TR_STRATEGY, SPT_MAX_WINDOW
+from tracktotrip.compression import time_dist, loc_dist, I_3600
+
+def recursive_drp(points, epsilon):
+    """ Former, recursive, implementation of `drp`, used as reference
+    """
+    dmax = 0.0
+    index = 0
+
+    for i in range(1, len(points)-1):
+        dist = point_line_distance(points[i], points[0], points[-1])
+        if dist > dmax:
+            index = i
+            dmax = dist
+
+    if dmax > epsilon:
+        return recursive_drp(points[:index+1], epsilon)[:-1] + recursive_drp(points[index:], epsilon)
+    else:
+        return [points[0], points[-1]]
+
+def recursive_spt(points, max_dist_error, max_speed_error):
+    """ Former, recursive and quadratic, implementation of `spt`, used as reference
+    """
+    #pylint: disable=invalid-name
+    if len(points) <= 2:
+        return points
+    else:
+        is_error = False
+        e = 1
+        while e < len(points) and not is_error:
+            i = 1
+            while i < e and not is_error:
+                delta_e = time_dist(points[e], points[0]) * I_3600
+                delta_i = time_dist(points[i], points[0]) * I_3600
+
+                di_de = 0
+                if delta_e != 0:
+                    di_de = delta_i / delta_e
+                d_lat = points[e].lat - points[0].lat
+                d_lon = points[e].lon - points[0].lon
+                point = Point(
+                    points[0].lat + d_lat * di_de,
+                    points[0].lon + d_lon * di_de,
+                    None
+                )
+
+                dt1 = time_dist(points[i], points[i-1])
+                if dt1 == 0:
+                    dt1 = 0.000000001
+                dt2 = time_dist(points[i+1], points[i])
+                if dt2 == 0:
+                    dt2 = 0.000000001
+
+                v_i_1 = loc_dist(points[i], points[i-1]) / dt1
+                v_i = loc_dist(points[i+1], points[i]) / dt2
+
+                if loc_dist(points[i], point) > max_dist_error or \
+                        abs(v_i - v_i_1) > max_speed_error:
+                    is_error = True
+                else:
+                    i = i + 1
+            if is_error:
+                return [points[0]] + recursive_spt(points[i:], max_dist_error, max_speed_error)
+            e = e + 1
+        if not is_error:
+            return [points[0], points[len(points)-1]]
+
+def recursive_td_sp(points, speed_threshold):
+    """ Former, recursive, implementation of `td_sp`, used as reference
+    """
+    if len(points) <= 2:
+        return points
+    else:
+        max_speed_threshold = 0
+        found_index = 0
+        for i in range(1, len(points)-1):
+            dt1 = time_dist(points[i], points[i-1])
+            if dt1 == 0:
+                dt1 = 0.000000001
+            vim = loc_dist(points[i], points[i-1]) / dt1
+            dt2 = time_dist(points[i+1], points[i])
+            if dt2 == 0:
+                dt2 = 0.000000001
+            vi_ = loc_dist(points[i+1], points[i]) / dt2
+            if abs(vi_ - vim) > max_speed_threshold:
+                max_speed_threshold = abs(vi_ - vim)
+                found_index = i
+        if max_speed_threshold > speed_threshold:
+            one = recursive_td_sp(points[:found_index], speed_threshold)
+            two = recursive_td_sp(points[found_index:], speed_threshold)
+            one.extend(two)
+            return one
+        else:
+            return [points[0], points[-1]]
+
+def recursive_td_tr(points, dist_threshold):
+    """ Former, recursive, implementation of `td_tr`, used as reference
+    """
+    if len(points) <= 2:
+        return points
+    else:
+        max_dist_threshold = 0
+        found_index = 0
+        delta_e = time_dist(points[-1], points[0]) * I_3600
+        d_lat = points[-1].lat - points[0].lat
+        d_lon = points[-1].lon - points[0].lon
+
+        for i in range(1, len(points)-1):
+            delta_i = time_dist(points[i], points[0]) * I_3600
+
+            di_de = delta_i / delta_e
+            point = Point(
+                points[0].lat + d_lat * di_de,
+                points[0].lon + d_lon * di_de,
+                None
+            )
+
+            dist = loc_dist(points[i], point)
+            if dist > max_dist_threshold:
+                max_dist_threshold = dist
+                found_index = i
+
+        if max_dist_threshold > dist_threshold:
+            one = recursive_td_tr(points[:found_index], dist_threshold)
+            two = recursive_td_tr(points[found_index:], dist_threshold)
+            one.extend(two)
+            return one
+        else:
+            return [points[0], points[-1]]
+
+def random_walk(n_points, seed=0):
+    """ Creates a random walk, with one point per second
+
+    Args:
+        n_points (int)
+        seed (int, optional)
+    Returns:
+        :obj:`list` of :obj:`Point`
+    """
+    rand = random.Random(seed)
+    start = datetime(2016, 7, 15, 8, 0, 0)
+    lat = 38.7
+    lon = -9.1
+    points = []
+    for i in range(n_points):
+        lat = lat + rand.gauss(0.00005, 0.00005)
+        lon = lon + rand.gauss(0.00003, 0.00005)
+        points.append(Point(lat, lon, start + timedelta(seconds=i)))
+    return points
+
+class TestCompression(unittest.TestCase):
+    """
+    Tests the compression algorithms
+    """
+    def assert_same_points(self, result, expected):
+        """ Checks if two lists of points hold the same positions
+        """
+        self.assertEqual(
+            [(p.lat, p.lon) for p in result],
+            [(p.lat, p.lon) for p in expected]
+        )
+
+    def test_drp(self):
+        """ Tests drp against the recursive implementation
+        """
+        for seed in range(3):
+            points = random_walk(500, seed)
+            for epsilon in [0, 0.00001, 0.0001, 0.001, 1]:
+                expected = recursive_drp(points, epsilon)
+                self.assertEqual(drp(points, epsilon), expected)
+                self.assert_same_points(drp(PointArray.from_points(points), epsilon), expected)
+
+        points = random_walk(2)
+        self.assertEqual(drp(points, 0), points)
+        self.assertEqual(drp(points[:1], 0), [points[0], points[0]])
+
+        points = [Point(0, 0, None), Point(1, 1, None), Point(0, 0, None)]
+        self.assertEqual(drp(points, 0.1), recursive_drp(points, 0.1))
+
+    def test_spt(self):
+        """ Tests spt against the recursive implementation
+        """
+        for seed in range(3):
+            points = random_walk(200, seed)
+            points[40].time = points[39].time
+            for max_dist_error, max_speed_error in [(0.5, 0.5), (2, 1), (5, 3), (50, 100)]:
+                expected = recursive_spt(points, max_dist_error, max_speed_error)
+                self.assertEqual(spt(points, max_dist_error, max_speed_error), expected)
+                self.assertEqual(
+                    spt(points, max_dist_error, max_speed_error, max_window=None), expected
+                )
+                self.assert_same_points(
+                    spt(PointArray.from_points(points), max_dist_error, max_speed_error),
+                    expected
+                )
+
+        points = random_walk(2)
+        self.assertEqual(spt(points, 1, 1), points)
+
+    def test_spt_window(self):
+        """ Tests that windows are limited, and still within the errors
+        """
+        start = datetime(2016, 7, 15, 8, 0, 0)
+        points = [
+            Point(38.7 + i * 0.00001, -9.1, start + timedelta(seconds=i))
+            for i in range(100)
+        ]
+        self.assertEqual(spt(points, 1, 1), [points[0], points[-1]])
+        self.assertEqual(spt(points, 1, 1, max_window=10), points[::9])
+
+        # spt, segments and tracks limit windows the same way, by default
+        points = [
+            Point(38.7 + i * 0.00001, -9.1, start + timedelta(seconds=i))
+            for i in range(1200)
+        ]
+        expected = spt(points, 1, 1)
+        self.assertEqual(expected, points[::SPT_MAX_WINDOW - 1] + [points[-1]])
+        self.assertEqual(Segment(list(points)).simplify(0, 1, 1).points, expected)
+        track = Track('track', [Segment(list(points))]).simplify(0, 1, 1)
+        self.assertEqual(track.segments[0].points, expected)
+
+        track = Track('track', [Segment(list(points))]).simplify(0, 1, 1, max_window=None)
+        self.assertEqual(track.segments[0].points, [points[0], points[-1]])
+        self.assertEqual(spt(points, 1, 1, max_window=None), [points[0], points[-1]])
+
+    def test_top_down(self):
+        """ Tests td_sp and td_tr against the recursive implementations
+        """
+        for seed in range(3):
+            points = random_walk(300, seed)
+            points[40].time = points[39].time
+            for threshold in [0, 0.5, 2, 5, 1000]:
+                self.assertEqual(td_sp(points, threshold), recursive_td_sp(points, threshold))
+                self.assertEqual(td_tr(points, threshold), recursive_td_tr(points, threshold))
+
+            segment = Segment(list(points)).to_columnar()
+            segment.simplify(0, 2, 2, strategy=TD_TR_STRATEGY)
+            self.assert_same_points(segment.points, recursive_td_tr(points, 2))
+            segment = Segment(list(points)).simplify(0, 2, 2, strategy=TD_SP_STRATEGY)
+            self.assertEqual(segment.points, recursive_td_sp(points, 2))
+
+        points = random_walk(2)
+        self.assertEqual(td_sp(points, 1), points)
+        self.assertEqual(td_tr(points, 1), points)
+
+    def test_online_spt(self):
+        """ Tests that the online compressor matches spt on a finished stream
+        """
+        for seed in range(3):
+            points = random_walk(300, seed)
+            points[40].time = points[39].time
+            for max_dist_error, max_speed_error in [(0.5, 0.5), (5, 3), (50, 100)]:
+                for max_window in [10, None]:
+                    compressor = OnlineSPT(max_dist_error, max_speed_error, max_window)
+                    result = []
+                    for point in points:
+                        result.extend(compressor.push(point))
+                        self.assertTrue(max_window is None or len(compressor) <= max_window)
+                    result.extend(compressor.flush())
+                    self.assertEqual(
+                        result, spt(points, max_dist_error, max_speed_error, max_window)
+                    )
+
+        compressor = OnlineSPT(1, 1)
+        self.assertEqual(compressor.push(points[0]), [points[0]])
+        self.assertEqual(compressor.flush(), [])
+
+if __name__ == '__main__':
+    unittest.main()
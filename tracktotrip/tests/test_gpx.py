@@ -0,0 +1,130 @@
+"""
+Unit tests for gpx module
+"""
+import unittest
+from StringIO import StringIO
+from datetime import datetime, timedelta
+import gpxpy
+from tracktotrip import Point, Segment, Track
+from tracktotrip.gpx import iter_segments, read_segments, parse_time, write_gpx
+from tracktotrip.point import to_timestamp
+from tracktotrip.tests.helpers import segment_positions
+
+GPX = '''<?xml version="1.0" encoding="UTF-8"?>
+<gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1" creator="test">
+  <metadata><time>2016-01-01T00:00:00Z</time></metadata>
+  <trk>
+    <name>first</name>
+    <trkseg>
+      <trkpt lat="38.7" lon="-9.1"><ele>10</ele><time>2016-07-15T08:00:00Z</time></trkpt>
+      <trkpt lat="38.7001" lon="-9.1001"><time>2016-07-15T08:00:01.500Z</time></trkpt>
+      <trkpt lat="38.7002" lon="-9.1002"></trkpt>
+    </trkseg>
+    <trkseg>
+      <trkpt lat="38.8" lon="-9.2">
+        <time>2016-07-15T23:59:59Z</time>
+        <extensions><speed>1</speed></extensions>
+      </trkpt>
+      <trkpt lat="38.8001" lon="-9.2001"><time>2016-07-16T00:00:01Z</time></trkpt>
+    </trkseg>
+  </trk>
+  <trk>
+    <trkseg>
+      <trkpt lat="40.1" lon="-8.1"><time>2016-07-17T10:00:00</time></trkpt>
+    </trkseg>
+  </trk>
+</gpx>
+'''
+
+def gpxpy_segments():
+    """ Segments of each track, read with gpxpy """
+    gpx = gpxpy.parse(StringIO(GPX))
+    return [
+        [Segment.from_gpx(segment) for segment in track.segments]
+        for track in gpx.tracks
+    ]
+
+def points_of(tracks):
+    """ Positions and times of the points of each segment of each track """
+    return [segment_positions(segments) for segments in tracks]
+
+def legacy_to_gpx(track):
+    """ Former implementation of `Track.to_gpx`, used as reference
+    """
+    gpx_segments = []
+    for segment in track.segments:
+        gpx_points = []
+        for point in segment.points:
+            time = ''
+            if point.time:
+                iso_time = point.time.isoformat().split('.')[0]
+                time = '<time>%s</time>' % iso_time
+            gpx_points.append(
+                u'<trkpt lat="%f" lon="%f">%s</trkpt>' % (point.lat, point.lon, time)
+            )
+        points = u'\n\t\t\t'.join(gpx_points)
+        gpx_segments.append(u'\t\t<trkseg>\n\t\t\t%s\n\t\t</trkseg>' % points)
+    segments = u'\t\n'.join(gpx_segments)
+    content = [
+        u'<?xml version="1.0" encoding="UTF-8"?>',
+        u'<gpx xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns="http://www.topografix.com/GPX/1/0" xsi:schemaLocation="http://www.topografix.com/GPX/1/0 http://www.topografix.com/GPX/1/0/gpx.xsd" version="1.0" creator="GatherMySteps">',
+        u'\t<trk>',
+        segments,
+        u'\t</trk>',
+        u'</gpx>'
+    ]
+    return u'\n'.join(content)
+
+class TestGpx(unittest.TestCase):
+    """
+    Tests the streaming GPX reader
+    """
+    def test_read(self):
+        """ Tests that the reader matches gpxpy
+        """
+        expected = points_of(gpxpy_segments())
+        self.assertEqual(points_of(read_segments(StringIO(GPX))), expected)
+        self.assertEqual(points_of(read_segments(StringIO(GPX), columnar=True)), expected)
+
+        segments = list(iter_segments(StringIO(GPX), columnar=True))
+        self.assertEqual([track for track, _ in segments], [0, 0, 1])
+        self.assertTrue(all(segment.is_columnar() for _, segment in segments))
+
+    def test_parse_time(self):
+        """ Tests parsing of ISO 8601 times
+        """
+        time = datetime(2016, 7, 15, 8, 0, 1)
+        self.assertEqual(parse_time('2016-07-15T08:00:01Z'), to_timestamp(time))
+        self.assertEqual(parse_time('2016-07-15T08:00:01'), to_timestamp(time))
+        self.assertEqual(parse_time(' 2016-07-15T08:00:01.25Z'), to_timestamp(time) + 0.25)
+        self.assertEqual(parse_time('2016-07-15T09:30:01+01:30'), to_timestamp(time))
+        self.assertEqual(parse_time('2016-07-15T07:00:01-0100'), to_timestamp(time))
+        self.assertRaises(ValueError, parse_time, '15/07/2016')
+
+    def test_write(self):
+        """ Tests that the writer matches the former to_gpx
+        """
+        start = datetime(2016, 7, 15, 23, 59, 50, 999999)
+        points = [
+            Point(38.7 + i * 0.0001, -9.1 - i * 0.0001, start + timedelta(seconds=i * 1.5))
+            for i in range(20)
+        ]
+        points[3].time = None
+        track = Track('track.gpx', [
+            Segment(points[:12]),
+            Segment(points[12:]).to_columnar()
+        ])
+        expected = legacy_to_gpx(track)
+        self.assertEqual(track.to_gpx(), expected)
+
+        output = StringIO()
+        write_gpx(output, track.segments, chunk_size=5)
+        self.assertEqual(output.getvalue(), expected)
+        self.assertEqual(Track('empty', []).to_gpx(), legacy_to_gpx(Track('empty', [])))
+
+        tracks = read_segments(StringIO(expected))
+        self.assertEqual(len(tracks), 1)
+        self.assertEqual(len(tracks[0]), 2)
+
+if __name__ == '__main__':
+    unittest.main()
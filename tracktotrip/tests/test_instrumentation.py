@@ -0,0 +1,58 @@
+"""
+Unit tests for instrumentation module
+"""
+import unittest
+from tracktotrip.smooth import INVERSE_STRATEGY
+from tracktotrip.instrumentation import StageRecorder
+from tracktotrip.tests.helpers import north_east_track, positions
+
+def make_track():
+    """ Creates a track with a time gap, that is split when segmenting """
+    return north_east_track('track.gpx', [400], gap_at=200)
+
+def to_trip(track, instrumentation=None):
+    """ Runs the whole pipeline over a track """
+    return track.to_trip(
+        True, INVERSE_STRATEGY, 1000, True, 0.15, 80, True, 2, 1,
+        instrumentation=instrumentation
+    )
+
+class TestInstrumentation(unittest.TestCase):
+    """
+    Tests the measures of Track.to_trip stages
+    """
+    def test_to_trip(self):
+        """ Tests that every stage is measured, for segments and tracks
+        """
+        recorder = StageRecorder()
+        track = to_trip(make_track(), recorder)
+        expected = to_trip(make_track())
+
+        self.assertEqual(positions(track), positions(expected))
+        self.assertEqual(
+            [measure.stage for measure in recorder.tracks],
+            [
+                'compute_metrics', 'remove_noise', 'compute_metrics', 'smooth',
+                'compute_metrics', 'segment', 'compute_metrics', 'simplify',
+                'compute_metrics'
+            ]
+        )
+        self.assertEqual(recorder.totals()['compute_metrics']['runs'], 5)
+
+        segment_stage = [m for m in recorder.tracks if m.stage == 'segment'][0]
+        self.assertEqual(segment_stage.segments_in, 1)
+        self.assertEqual(segment_stage.segments_out, 2)
+        simplify = [m for m in recorder.segments if m.stage == 'simplify']
+        self.assertEqual([m.segment for m in simplify], [0, 1])
+        self.assertEqual(
+            sum(m.points_out for m in simplify),
+            sum(len(segment.points) for segment in track.segments)
+        )
+
+        for measure in recorder.tracks + recorder.segments:
+            self.assertEqual(measure.track, 'track.gpx')
+            self.assertTrue(measure.wall >= 0 and measure.cpu >= 0)
+            self.assertTrue(measure.points_out <= measure.points_in)
+
+if __name__ == '__main__':
+    unittest.main()
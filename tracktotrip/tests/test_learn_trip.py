@@ -1,5 +1,7 @@
 from tracktotrip import learn_trip, Track, Segment, Point
+from tracktotrip.learn_trip import CanonicalIndex
 from datetime import datetime, timedelta
+import random
 import unittest
 
 class TestLearnTrip(unittest.TestCase):
@@ -44,6 +46,123 @@ class TestLearnTrip(unittest.TestCase):
 
         learn_trip.learn_trip(self.tripA, [self.tripB], self.fail, expected)
 
+def straight_trip(start, end, size=20):
+    """ Trip in a straight line between two (lat, lon) """
+    return Segment([
+        Point(
+            start[0] + (end[0] - start[0]) * i / float(size - 1),
+            start[1] + (end[1] - start[1]) * i / float(size - 1),
+            None
+        )
+        for i in range(size)
+    ])
+
+# least prune ratios of the random canonical trips
+PRUNE_RATIO = 0.9
+ENDPOINTS_PRUNE_RATIO = 0.95
+
+class TestCanonicalIndex(unittest.TestCase):
+    """ Tests the index of canonical trips """
+    def setUp(self):
+        rand = random.Random(3)
+        self.trips = []
+        for i in range(200):
+            start = (38.7 + rand.uniform(0, 0.5), -9.1 + rand.uniform(0, 0.5))
+            end = (start[0] + rand.uniform(-0.05, 0.05), start[1] + rand.uniform(-0.05, 0.05))
+            trip = straight_trip(start, end).simplify(0.0001, 0, 0, topology_only=True)
+            self.trips.append((i, trip))
+        self.index = CanonicalIndex(slack=0.002)
+        for trip_id, trip in self.trips:
+            self.index.insert(trip_id, trip)
+
+    def test_candidates(self):
+        """ Same trips, in both directions, are candidates, and most others aren't """
+        endpoints = CanonicalIndex(slack=0.002, cell_size=0.01, endpoints=True)
+        for trip_id, trip in self.trips:
+            endpoints.insert(trip_id, trip)
+
+        for trip_id, trip in self.trips[:20]:
+            points = trip.points
+            shifted = straight_trip(
+                (points[0].lat + 0.0005, points[0].lon), (points[-1].lat, points[-1].lon - 0.0005)
+            )
+            reverse = Segment(list(reversed(points)))
+            for current in [shifted, reverse]:
+                for index in [self.index, endpoints]:
+                    candidates = index.candidates(current)
+                    self.assertIn(trip_id, [elm[0] for elm in candidates])
+                self.assertLess(len(endpoints.candidates(current)), 5)
+
+        for index, prune_ratio in [(self.index, PRUNE_RATIO), (endpoints, ENDPOINTS_PRUNE_RATIO)]:
+            stats = index.stats()
+            self.assertEqual(stats['queries'], 40 * (2 if index is endpoints else 1))
+            self.assertEqual(stats['considered'], stats['queries'] * 200)
+            self.assertGreater(stats['pruneRatio'], prune_ratio)
+
+    def test_contained_trip(self):
+        """ Trips along a canonical trip are only dropped with the endpoint filter """
+        long_trip = straight_trip((39.5, -8.0), (39.7, -8.2)).simplify(
+            0.0001, 0, 0, topology_only=True
+        )
+        part = straight_trip((39.55, -8.05), (39.65, -8.15))
+        endpoints = CanonicalIndex(slack=0.002, endpoints=True)
+        for index in [self.index, endpoints]:
+            index.insert('long', long_trip)
+        self.assertEqual(self.index.candidates(part), [('long', long_trip)])
+        self.assertEqual(endpoints.candidates(part), [])
+
+        inserted = []
+        updated = []
+        learn_trip.learn_trip(
+            part, 1, self.index,
+            lambda trip, trip_id: inserted.append(trip_id),
+            lambda trip_id, trip, current_id: updated.append(trip_id),
+            0.0001, 0.001
+        )
+        self.assertEqual(inserted, [])
+        self.assertEqual(updated, ['long'])
+
+    def test_distance_threshold(self):
+        """ Bounds are widened to the distance threshold, when it's bigger than the slack """
+        index = CanonicalIndex(slack=0.001)
+        trip = straight_trip((39.5, -8.0), (39.6, -8.0))
+        index.insert('trip', trip)
+        near = straight_trip((39.5, -8.005), (39.6, -8.005))
+        self.assertEqual(index.candidates(near), [])
+        self.assertEqual(index.candidates(near, distance_thr=0.003), [('trip', trip)])
+
+    def test_update(self):
+        """ Removed and moved trips are found where they are """
+        trip_id, trip = self.trips[0]
+        moved = straight_trip((40.1, -8.1), (40.15, -8.12))
+        self.index.update(trip_id, moved)
+        self.assertNotIn(trip_id, [elm[0] for elm in self.index.candidates(trip)])
+        self.assertEqual(self.index.candidates(moved), [(trip_id, moved)])
+
+        self.index.remove(trip_id)
+        self.assertEqual(len(self.index), 199)
+        self.assertEqual(self.index.candidates(moved), [])
+
+    def test_learn_trip(self):
+        """ learn_trip only compares candidates, and keeps the index up to date """
+        updated = []
+        inserted = []
+        def insert_canonical(trip, trip_id):
+            inserted.append(trip_id)
+        def update_canonical(trip_id, trip, current_id):
+            updated.append((trip_id, current_id))
+
+        trip_id, trip = self.trips[7]
+        current = straight_trip(
+            (trip.points[0].lat, trip.points[0].lon), (trip.points[-1].lat, trip.points[-1].lon)
+        )
+        learn_trip.learn_trip(current, 1000, self.index, insert_canonical, update_canonical, 0.0001, 0.001)
+        self.assertEqual(updated, [(trip_id, 1000)])
+
+        current = straight_trip((40.1, -8.1), (40.15, -8.12))
+        learn_trip.learn_trip(current, 1001, self.index, insert_canonical, update_canonical, 0.0001, 0.001)
+        self.assertEqual(inserted, [1001])
+        self.assertEqual(self.index.candidates(current), [(1001, current)])
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,70 @@
 """
 Location module unit tests
 """
+import json
+import time
+import random
 import unittest
-from tracktotrip import Point
-from tracktotrip.location import update_location_centroid, compute_centroid
+from threading import Thread, Lock
+from urlparse import urlparse, parse_qs
+from SocketServer import ThreadingMixIn
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from datetime import datetime, timedelta
+from tracktotrip import Point, Segment, Track
+from tracktotrip import location
+from tracktotrip.location import update_location_centroid, compute_centroid, LocationCluster
+from tracktotrip.place_cache import PlaceCache
+
+class StubPlacesServer(ThreadingMixIn, HTTPServer):
+    """ Local server answering as Google Places and Foursquare, counting
+        requests and how many are answered at once
+    """
+    daemon_threads = True
+
+    def __init__(self, delay):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubPlacesHandler)
+        self.delay = delay
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = Lock()
+
+class StubPlacesHandler(BaseHTTPRequestHandler):
+    """ Answers with a place at the position queried """
+    def do_GET(self): #pylint: disable=invalid-name
+        """ Answers a query """
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        time.sleep(server.delay)
+        with server.lock:
+            server.active -= 1
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/google':
+            lat, lon = query['location'][0].split(',')
+            body = {'results': [{
+                'name': 'Cafe %s' % lat,
+                'geometry': {'location': {'lat': float(lat), 'lng': float(lon)}},
+                'types': ['cafe']
+            }]}
+        else:
+            body = {'response': {'venues': [{
+                'name': 'Gym %s' % query['ll'][0],
+                'location': {'distance': 5},
+                'categories': [{'shortName': 'Gym'}]
+            }]}}
+        body = json.dumps(body)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args): #pylint: disable=arguments-differ
+        pass
 
 class TestLocation(unittest.TestCase):
     """
@@ -92,5 +153,133 @@ class TestLocation(unittest.TestCase):
         self.assert_point(centroid, Point(8.0335721637393, 2.4895146785343, None))
         self.assert_points(new_cluster, [p_1, p_2, p_3, point])
 
+    def test_location_cluster(self):
+        """ Tests that LocationCluster gives the same centroids as
+            update_location_centroid, as points are added
+        """
+        rand = random.Random(3)
+        for min_samples in [1, 2, 3, 5]:
+            centers = [
+                (38.7 + rand.uniform(0, 0.003), -9.1 + rand.uniform(0, 0.003)) for _ in range(3)
+            ]
+            incremental = LocationCluster(20, min_samples)
+            cluster = []
+            for _ in range(80):
+                lat, lon = rand.choice(centers)
+                point = Point(lat + rand.gauss(0, 0.0003), lon + rand.gauss(0, 0.0003), None)
+                centroid = incremental.add(point)
+                expected, cluster = update_location_centroid(point, cluster, 20, min_samples)
+                self.assertAlmostEqual(centroid.lat, expected.lat, places=9)
+                self.assertAlmostEqual(centroid.lon, expected.lon, places=9)
+            self.assertEqual(incremental.points, cluster)
+
+    def test_cluster_points_chain(self):
+        """ Tests that a chain of close points isn't one cluster, and that
+            every point is close to the centroid of its cluster
+        """
+        points = [Point(38.7 + i * 0.00015, -9.1, None) for i in range(20)]
+        centroids, clusters = location.cluster_points(points, 20)
+        self.assertGreater(len(centroids), 5)
+        for point, cluster in zip(points, clusters):
+            self.assertLess(point.distance(centroids[cluster]), 20)
+
+        centroids, clusters = location.cluster_points(points[:1] + points[:1], 20)
+        self.assertEqual(clusters, [0, 0])
+        self.assertEqual(location.cluster_points([], 20), ([], []))
+
+class TestInferLocations(unittest.TestCase):
+    """
+    Tests concurrent location inferring, against a stub server
+    """
+    def start_server(self, delay):
+        """ Starts a stub server and points the place provider urls at it """
+        server = StubPlacesServer(delay)
+        thread = Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.shutdown)
+
+        base = 'http://127.0.0.1:%d' % server.server_address[1]
+        self.addCleanup(setattr, location, 'GOOGLE_PLACES_URL', location.GOOGLE_PLACES_URL)
+        self.addCleanup(setattr, location, 'FOURSQUARE_URL', location.FOURSQUARE_URL)
+        location.GOOGLE_PLACES_URL = base + '/google?location=%s,%s&radius=%s&key=%s'
+        location.FOURSQUARE_URL = base + '/foursquare?client_id=%s&client_secret=%s' \
+            '&ll=%f,%f&radius=%f'
+        return server
+
+    def setUp(self):
+        self.addCleanup(location.set_caches, location.GG_CACHE, location.FS_CACHE)
+        location.set_caches(PlaceCache(), PlaceCache())
+
+    @staticmethod
+    def make_track():
+        """ Track with three segments, each starting where the last ended """
+        start = datetime(2016, 7, 15, 8, 0, 0)
+        stays = [(38.7, -9.1), (38.71, -9.1), (38.72, -9.11), (38.73, -9.12)]
+        segments = []
+        for i in range(3):
+            points = [
+                Point(stays[i][0], stays[i][1] + 0.00002, start + timedelta(hours=i)),
+                Point(
+                    stays[i + 1][0] - 0.00002, stays[i + 1][1],
+                    start + timedelta(hours=i, minutes=30)
+                )
+            ]
+            segments.append(Segment(points))
+        return Track('track.gpx', segments)
+
+    def test_infer_locations(self):
+        """ Tests that locations are the same as inferred one at a time,
+            with less queries, issued concurrently
+        """
+        server = self.start_server(0.1)
+        points = []
+        for segment in self.make_track().segments:
+            points.extend(segment.points)
+        locations = location.infer_locations(
+            points, None, 20, 'key', 'id', 'secret', 5, concurrency=4
+        )
+        # a query for each stay, for each provider
+        self.assertEqual(server.requests, 8)
+        self.assertGreater(server.max_active, 1)
+
+        location.set_caches(PlaceCache(), PlaceCache())
+        expected = [
+            location.infer_location(point, None, 20, 'key', 'id', 'secret', 5)
+            for point in points
+        ]
+        self.assertEqual(server.requests, 16)
+        self.assertEqual([loc.to_json() for loc in locations], [loc.to_json() for loc in expected])
+        self.assertEqual(locations[2].label, 'Cafe 38.70998')
+
+    def test_shared_endpoints(self):
+        """ Tests that consecutive segments share the location of their stay
+        """
+        server = self.start_server(0.)
+        track = self.make_track()
+        stats = location.LookupStats()
+        track.infer_location(None, 20, 'key', 'id', 'secret', 5, stats=stats)
+
+        self.assertEqual(server.requests, 8)
+        self.assertEqual(stats.to_json(), {
+            'points': 6, 'lookups': 4, 'saved': 2, 'providerQueries': 8
+        })
+        segments = track.segments
+        self.assertIs(segments[0].location_to, segments[1].location_from)
+        self.assertIs(segments[1].location_to, segments[2].location_from)
+        self.assertIsNot(segments[0].location_from, segments[0].location_to)
+        self.assertTrue(segments[0].location_to.label.startswith('Cafe 38.7099'))
+
+    def test_timeout(self):
+        """ Tests that queries that time out give no locations, and aren't cached
+        """
+        self.start_server(1.)
+        track = self.make_track()
+        track.infer_location(None, 20, 'key', 'id', 'secret', 5, timeout=0.1)
+        self.assertEqual(
+            [s.location_from.label for s in track.segments], ['#?', '#?', '#?']
+        )
+        self.assertEqual(len(location.GG_CACHE), 0)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,133 @@
+"""
+Unit tests for metrics module
+"""
+import unittest
+from copy import deepcopy
+from datetime import datetime, timedelta
+import numpy as np
+from tracktotrip import Segment, Point
+from tracktotrip.metrics import distances
+from tracktotrip.point import distance
+
+def make_points():
+    """ Creates points with close, far apart and simultaneous samples
+
+    Returns:
+        :obj:`list` of :obj:`Point`
+    """
+    start = datetime(2016, 7, 15, 15, 27, 53)
+    coords = [
+        (38.7, -9.1, 0), (38.7001, -9.1002, 1), (38.7003, -9.1001, 3),
+        (38.7003, -9.1001, 3), (39.2, -9.0, 600), (39.2, -8.7, 900),
+        (39.2001, -8.7, 901.5), (39.2001, -8.7, 950)
+    ]
+    points = [Point(lat, lon, start + timedelta(seconds=sec)) for lat, lon, sec in coords]
+    points[0].vel = 3.0
+    return points
+
+class TestMetrics(unittest.TestCase):
+    """
+    Tests the vectorized metrics against the scalar ones
+    """
+    def assert_close(self, one, two):
+        """ Checks if two floats are close
+        """
+        self.assertTrue(np.isclose(one, two, rtol=1e-9, atol=1e-9), '%r != %r' % (one, two))
+
+    def test_distances(self):
+        """ Tests distances against point.distance
+        """
+        points = make_points()
+        lats = np.array([p.lat for p in points])
+        lons = np.array([p.lon for p in points])
+        result = distances(lats[1:], lons[1:], lats[:-1], lons[:-1])
+        for i, dist in enumerate(result):
+            now = points[i + 1]
+            prv = points[i]
+            self.assert_close(dist, distance(now.lat, now.lon, None, prv.lat, prv.lon, None))
+
+    def test_compute_metrics_parity(self):
+        """ Tests Segment.compute_metrics against Point.compute_metrics
+        """
+        expected = make_points()
+        for i in range(1, len(expected)):
+            expected[i].compute_metrics(expected[i - 1])
+
+        points = make_points()
+        Segment(points).compute_metrics()
+        columnar = Segment(deepcopy(make_points())).to_columnar().compute_metrics()
+
+        for result in [points, columnar.points]:
+            for point, exp in zip(result, expected):
+                self.assert_close(point.dt, exp.dt)
+                self.assert_close(point.dx, exp.dx)
+                self.assert_close(point.vel, exp.vel)
+                self.assert_close(point.acc, exp.acc)
+
+    def test_outdated_metrics(self):
+        """ Tests that only changed points are recomputed
+        """
+        start = datetime(2016, 7, 15, 15, 27, 53)
+        points = [
+            Point(38.7 + i * 0.0001, -9.1 + (i % 7) * 0.0001, start + timedelta(seconds=i))
+            for i in range(50)
+        ]
+        points[20].time = start + timedelta(seconds=100)
+
+        for columnar in [False, True]:
+            segment = Segment(deepcopy(points))
+            if columnar:
+                segment.to_columnar()
+            segment.compute_metrics()
+            self.assertEqual(segment.metrics_recomputed, 49)
+            segment.compute_metrics()
+            self.assertEqual(segment.metrics_recomputed, 49)
+
+            segment.remove_noise()
+            segment.compute_metrics()
+            self.assertTrue(segment.metrics_recomputed - 49 <= 4)
+
+            expected = Segment(deepcopy(segment.points)).compute_metrics()
+            for point, exp in zip(segment.points, expected.points):
+                self.assert_close(point.vel, exp.vel)
+                self.assert_close(point.acc, exp.acc)
+
+            segment.points[10].lat = 38.8
+            segment.invalidate_metrics(10, 11)
+            segment.compute_metrics()
+            expected = Segment(deepcopy(segment.points)).compute_metrics()
+            for point, exp in zip(segment.points, expected.points):
+                self.assert_close(point.dx, exp.dx)
+                self.assert_close(point.acc, exp.acc)
+
+            parts = segment.subsegment(list(segment.points)[5:30])
+            recomputed = parts.metrics_recomputed
+            parts.compute_metrics()
+            self.assertEqual(parts.metrics_recomputed, recomputed)
+
+    def test_appended_points(self):
+        """ Tests that points added after computing the metrics are computed
+        """
+        start = datetime(2016, 7, 15, 15, 27, 53)
+        points = [
+            Point(38.7 + i * 0.0001, -9.1 + (i % 7) * 0.0001, start + timedelta(seconds=i))
+            for i in range(10)
+        ]
+        segment = Segment(deepcopy(points[:9])).compute_metrics()
+        segment.points.append(deepcopy(points[9]))
+        segment.compute_metrics()
+        self.assertEqual(segment.metrics_recomputed, 8 + 9)
+
+        expected = Segment(deepcopy(points)).compute_metrics()
+        for point, exp in zip(segment.points, expected.points):
+            self.assert_close(point.dt, exp.dt)
+            self.assert_close(point.vel, exp.vel)
+            self.assert_close(point.acc, exp.acc)
+
+        segment.points.append(Point(38.8, -9.1, start + timedelta(seconds=10)))
+        segment.remove_noise()
+        segment.compute_metrics()
+        self.assertGreater(segment.points[-1].vel, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+"""
+Unit tests for place_cache module
+"""
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+from multiprocessing import Pool
+from tracktotrip import Point
+from tracktotrip.place_cache import PlaceCache, SQLitePlaceCache, MappedPlaceCache
+
+class Clock(object):
+    """ Clock that only moves when told to """
+    def __init__(self):
+        self.now = 1000.
+
+    def __call__(self):
+        return self.now
+
+def fill_cache(args):
+    """ Adds entries to a persistent cache, from another process """
+    backend, path, start = args
+    cache = backend(path)
+    for i in range(start, start + 20):
+        cache.put(Point(38.7 + i * 0.01, -9.1, None), 50., ['place %d' % i])
+    return start
+
+class TestPlaceCache(unittest.TestCase):
+    """ Tests the place lookup cache """
+    def test_radius_lookup(self):
+        """ Lookups find the closest entry within radius, as a linear scan would """
+        rand = random.Random(7)
+        cache = PlaceCache(cell_size=50., ttl=None)
+        entries = []
+        for i in range(300):
+            point = Point(38.7 + rand.uniform(0, 0.05), -9.1 + rand.uniform(0, 0.05), None)
+            cache.put(point, 100., [i])
+            entries.append((point, [i]))
+
+        for _ in range(300):
+            query = Point(38.7 + rand.uniform(0, 0.05), -9.1 + rand.uniform(0, 0.05), None)
+            near = [(query.distance(point), values) for point, values in entries]
+            near = [elm for elm in near if elm[0] < 100.]
+            expected = min(near)[1] if near else None
+            self.assertEqual(cache.get(query, 100.), expected)
+        self.assertEqual(cache.get(entries[0][0], 50.), entries[0][1])
+        self.assertEqual(cache.get(entries[0][0], 150.), None)
+
+    def test_lru(self):
+        """ Least recently used entries are evicted """
+        cache = PlaceCache(max_size=2, ttl=None)
+        first, second, third = [Point(38.7 + i * 0.1, -9.1, None) for i in range(3)]
+        cache.put(first, 10, ['first'])
+        cache.put(second, 10, ['second'])
+        self.assertEqual(cache.get(first, 10), ['first'])
+        cache.put(third, 10, ['third'])
+
+        self.assertEqual(cache.get(second, 10), None)
+        self.assertEqual(cache.get(first, 10), ['first'])
+        self.assertEqual(cache.get(third, 10), ['third'])
+        self.assertEqual(cache.stats(), {
+            'size': 2, 'hits': 3, 'misses': 1, 'evictions': 1, 'expirations': 0
+        })
+
+    def test_empty_values(self):
+        """ Empty results aren't kept, so that failed lookups are tried again """
+        cache = PlaceCache(ttl=None)
+        point = Point(38.7, -9.1, None)
+        cache.put(point, 10, [])
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get(point, 10), None)
+
+        dump = StringIO('{"lat": 38.7, "lon": -9.1, "radius": 10, "created": 0, "values": []}\n')
+        self.assertEqual(cache.load(dump), 0)
+        self.assertEqual(len(cache), 0)
+
+    def test_ttl(self):
+        """ Entries expire """
+        clock = Clock()
+        cache = PlaceCache(ttl=60, clock=clock)
+        point = Point(38.7, -9.1, None)
+        cache.put(point, 10, ['place'])
+        clock.now += 30
+        self.assertEqual(cache.get(point, 10), ['place'])
+        clock.now += 31
+        self.assertEqual(cache.get(point, 10), None)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.expirations, 1)
+
+class TestPersistentPlaceCache(unittest.TestCase):
+    """ Tests the place lookup caches stored in files """
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_shared(self):
+        """ Entries written by many processes are seen by all, and kept """
+        for backend in [SQLitePlaceCache, MappedPlaceCache]:
+            path = os.path.join(self.folder, backend.__name__)
+            reader = backend(path)
+            self.assertEqual(reader.get(Point(38.7, -9.1, None), 50.), None)
+
+            pool = Pool(3)
+            try:
+                pool.map(fill_cache, [(backend, path, start) for start in [0, 20, 40]])
+            finally:
+                pool.close()
+
+            for cache in [reader, backend(path)]:
+                for i in range(60):
+                    point = Point(38.7 + i * 0.01, -9.1 + 0.0001, None)
+                    self.assertEqual(cache.get(point, 50.), ['place %d' % i])
+                    self.assertEqual(cache.get(point, 100.), None)
+                    self.assertEqual(cache.get(point, 25.), ['place %d' % i])
+            self.assertEqual(reader.stats()['size'], 60)
+            self.assertEqual(reader.hits, 120)
+            self.assertEqual(reader.misses, 61)
+
+    def test_warm_start(self):
+        """ Dumps are loaded by every backend, keeping expiration times """
+        clock = Clock()
+        source = PlaceCache(ttl=60, clock=clock)
+        source.put(Point(38.7, -9.1, None), 10, [{'label': 'Home'}])
+        clock.now += 30
+        source.put(Point(38.8, -9.1, None), 10, [{'label': 'Work'}])
+        dump = StringIO()
+        source.dump(dump)
+
+        for cache in [
+                PlaceCache(ttl=60, clock=clock),
+                SQLitePlaceCache(os.path.join(self.folder, 'db'), ttl=60, clock=clock),
+                MappedPlaceCache(os.path.join(self.folder, 'map'), ttl=60, clock=clock)
+            ]:
+            dump.seek(0)
+            self.assertEqual(cache.load(dump), 2)
+            self.assertEqual(cache.get(Point(38.7, -9.1, None), 10), [{'label': 'Home'}])
+            clock.now += 31
+            self.assertEqual(cache.get(Point(38.7, -9.1, None), 10), None)
+            self.assertEqual(cache.get(Point(38.8, -9.1, None), 10), [{'label': 'Work'}])
+            clock.now -= 31
+
+    def test_cell_size(self):
+        """ Files can't be opened with other cell sizes """
+        for backend in [SQLitePlaceCache, MappedPlaceCache]:
+            path = os.path.join(self.folder, backend.__name__)
+            backend(path, cell_size=100.)
+            self.assertRaises(ValueError, backend, path, cell_size=50.)
+
+if __name__ == '__main__':
+    unittest.main()
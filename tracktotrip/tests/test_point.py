@@ -0,0 +1,56 @@
+"""
+Unit tests for point module
+"""
+import pickle
+import unittest
+from datetime import datetime, timedelta, tzinfo
+from tracktotrip import Point
+
+class FixedOffset(tzinfo):
+    """ Timezone with a fixed offset, in hours """
+    def __init__(self, hours):
+        super(FixedOffset, self).__init__()
+        self.offset = timedelta(hours=hours)
+
+    def utcoffset(self, dt):
+        return self.offset
+
+    def dst(self, dt):
+        return timedelta(0)
+
+class TestPoint(unittest.TestCase):
+    """
+    Tests the point module
+    """
+    def test_time(self):
+        """ Tests that time is kept as a timestamp
+        """
+        time = datetime(2016, 7, 15, 15, 27, 53, 574110)
+        point = Point(9.3470298, 3.79274, time)
+        self.assertEqual(point.time, time)
+        self.assertEqual(point.timestamp, 1468596473.57411)
+        self.assertEqual(point.get_timestamp(), point.timestamp)
+
+        point.time = time + timedelta(seconds=10)
+        self.assertEqual(point.time_difference(Point(0, 0, time)), 10)
+        self.assertEqual(Point(0, 0, point.timestamp).time, point.time)
+
+        aware = datetime(2016, 7, 15, 16, 27, 53, 574110, FixedOffset(1))
+        self.assertEqual(Point(0, 0, aware).time, time)
+
+        self.assertEqual(Point(0, 0, None).time, None)
+        self.assertFalse(hasattr(point, '__dict__'))
+
+    def test_pickle(self):
+        """ Tests that points can be pickled with every protocol
+        """
+        point = Point(9.3470298, 3.79274, datetime(2016, 7, 15, 15, 27, 53))
+        point.vel = 1.5
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copy = pickle.loads(pickle.dumps(point, protocol))
+            self.assertEqual(copy.lat, point.lat)
+            self.assertEqual(copy.time, point.time)
+            self.assertEqual(copy.vel, point.vel)
+
+if __name__ == '__main__':
+    unittest.main()
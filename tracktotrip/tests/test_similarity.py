@@ -2,8 +2,13 @@
 Unit tests for similarity module
 """
 import math
+import random
 import unittest
-from tracktotrip.similarity import segment_similarity
+import numpy as np
+from rtree import index
+from tracktotrip import similarity
+from tracktotrip.similarity import segment_similarity, bounding_box_from
+from tracktotrip.similarity import thresholded_segment_similarity
 from tracktotrip.similarity import normalize, line_distance_similarity, line_similarity
 from tracktotrip.similarity import line, angle_similarity, distance_to_line, distance_similarity
 from tracktotrip import Segment, Point
@@ -104,6 +109,140 @@ class TestSimilarity(unittest.TestCase):
         self.assertTrue(parts[3] > parts[4])
         self.assertTrue(parts[4] < parts[5])
 
+    def test_segment_similarity_reference(self):
+        """ Tests that segment_similarity scores edges as the former
+            implementation, finding candidates both ways
+        """
+        rand = random.Random(5)
+        pairs = []
+        for size_a, size_b in [(2, 2), (1, 5), (5, 1), (30, 40), (120, 90)]:
+            a_seg = random_segment(rand, size_a)
+            b_seg = random_segment(rand, size_b)
+            pairs.append((a_seg, b_seg))
+        pairs.append((pairs[-1][0], pairs[-1][0]))
+
+        limit = similarity.BROADCAST_LIMIT
+        try:
+            for broadcast_limit in [limit, 0]:
+                similarity.BROADCAST_LIMIT = broadcast_limit
+                for a_seg, b_seg in pairs:
+                    for thr in [0.0001, 0.001]:
+                        mean, parts = segment_similarity(a_seg, b_seg, T=thr)
+                        expected_mean, expected_parts = reference_segment_similarity(
+                            a_seg, b_seg, T=thr
+                        )
+                        self.assertEqual(len(parts), len(expected_parts))
+                        for part, expected in zip(parts, expected_parts):
+                            self.assertTrue(isclose(part, expected))
+                        if len(parts) > 0:
+                            self.assertTrue(isclose(mean, expected_mean))
+        finally:
+            similarity.BROADCAST_LIMIT = limit
+
+    def test_edge_index_reuse(self):
+        """ Tests that the edge index of a segment is reused, both ways,
+            until merge_and_fit or simplify change its points
+        """
+        rand = random.Random(11)
+        trip = random_segment(rand, 80)
+        current = random_segment(rand, 60)
+        expected = [
+            reference_segment_similarity(trip, current, T=0.001),
+            reference_segment_similarity(current, trip, T=0.001)
+        ]
+
+        limit = similarity.BROADCAST_LIMIT
+        try:
+            similarity.BROADCAST_LIMIT = 0
+            edges = trip.edge_index()
+            for _ in range(2):
+                results = [
+                    segment_similarity(trip, current, T=0.001),
+                    segment_similarity(current.copy(), trip, T=0.001)
+                ]
+                for (mean, parts), (expected_mean, expected_parts) in zip(results, expected):
+                    self.assertTrue(isclose(mean, expected_mean))
+                    for part, expected_part in zip(parts, expected_parts):
+                        self.assertTrue(isclose(part, expected_part))
+                self.assertIs(trip.edge_index(), edges)
+                self.assertTrue(edges.has_tree(0.001))
+        finally:
+            similarity.BROADCAST_LIMIT = limit
+
+        trip.simplify(0, 0, 0, topology_only=True)
+        self.assertIs(trip.edge_index(), edges)
+        trip.simplify(0.001, 0, 0, topology_only=True)
+        self.assertIsNot(trip.edge_index(), edges)
+        self.assertEqual(len(trip.edge_index()), len(trip.points) - 1)
+
+        edges = trip.edge_index()
+        trip.merge_and_fit(current)
+        self.assertIsNot(trip.edge_index(), edges)
+        self.assertEqual(len(trip.edge_index()), len(trip.points) - 1)
+
+    def test_thresholded_segment_similarity(self):
+        """ Tests that thresholded_segment_similarity decides as
+            segment_similarity, and that its bounds hold the similarity
+        """
+        rand = random.Random(13)
+        early = 0
+        for size_a, size_b in [(1, 5), (5, 1), (30, 40), (120, 90), (200, 200)]:
+            a_seg = random_segment(rand, size_a)
+            b_seg = random_segment(rand, size_b)
+            mean, _ = segment_similarity(a_seg, b_seg, T=0.001)
+            if size_b < 2:
+                mean = 0.
+            for threshold in [0.05, 0.2, 0.5, 0.7, 0.95]:
+                for chunk_size in [1, 7, 1000]:
+                    reaches, (lower, upper) = thresholded_segment_similarity(
+                        a_seg, b_seg, threshold, T=0.001, chunk_size=chunk_size
+                    )
+                    self.assertEqual(reaches, mean >= threshold)
+                    self.assertTrue(lower - 1e-09 <= mean <= upper + 1e-09)
+
+                    reaches, (lower, upper) = thresholded_segment_similarity(
+                        a_seg, b_seg, threshold, T=0.001, chunk_size=chunk_size,
+                        accept_early=False
+                    )
+                    if reaches:
+                        self.assertTrue(isclose(lower, mean) and isclose(upper, mean))
+                    if upper - lower > 1e-09:
+                        early += 1
+        self.assertGreater(early, 0)
+
+        a_seg = random_segment(rand, 50)
+        reaches, (lower, upper) = thresholded_segment_similarity(a_seg, a_seg, 0.3, chunk_size=1)
+        self.assertTrue(reaches)
+        self.assertTrue(lower >= 0.3 and upper > lower)
+
+def random_segment(rand, size):
+    """ Random walk segment """
+    lat, lon = 38.7, -9.1
+    points = []
+    for _ in range(size):
+        lat = lat + rand.gauss(0, 0.0005)
+        lon = lon + rand.gauss(0, 0.0005)
+        points.append(Point(lat, lon, None))
+    return Segment(points)
+
+def reference_segment_similarity(A, B, T):
+    """ Former implementation of segment_similarity, used as reference
+    """
+    idx = index.Index()
+    for i in range(len(A.points) - 1):
+        idx.insert(i, bounding_box_from(A.points, i, i+1, T), obj=[A.points[i], A.points[i+1]])
+
+    prox_acc = []
+    for i in range(len(B.points) - 1):
+        ti = B.points[i].gen2arr()
+        ti1 = B.points[i+1].gen2arr()
+        proxs = [
+            line_similarity(ti, ti1, x.object[0].gen2arr(), x.object[1].gen2arr(), T)
+            for x in idx.intersection(bounding_box_from(B.points, i, i+1, T), objects=True)
+        ]
+        prox_acc.append(sum(proxs) / len(proxs) if proxs else 0)
+    return np.mean(prox_acc), prox_acc
+
 def isclose(one, two, err=1e-09):
     """ Check if two number are close enought
 
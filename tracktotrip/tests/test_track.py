@@ -0,0 +1,71 @@
+"""
+Unit tests for track module
+"""
+import unittest
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from datetime import datetime
+from tracktotrip import Track
+from tracktotrip.smooth import INVERSE_STRATEGY
+from tracktotrip.tests.helpers import north_east_track, positions, points_of
+
+def make_track(n_segments):
+    """ Creates a track with a few segments, going north east """
+    return north_east_track('track.gpx', [100 + 50 * j for j in range(n_segments)])
+
+class TestTrack(unittest.TestCase):
+    """
+    Tests tracks
+    """
+    def test_executor(self):
+        """ Tests that segments processed concurrently keep their order,
+            points and metrics
+        """
+        params = (True, INVERSE_STRATEGY, 1000, True, 0.15, 80, True, 2, 1)
+        expected = points_of(make_track(4).to_trip(*params))
+
+        threads = ThreadPool(2)
+        processes = Pool(2)
+        try:
+            for executor in [threads, processes]:
+                track = make_track(4).to_trip(*params, executor=executor)
+                self.assertEqual(points_of(track), expected)
+        finally:
+            threads.close()
+            processes.close()
+
+    def test_json(self):
+        """ Tests both JSON schemas, with lazy metrics
+        """
+        track = make_track(2)
+        track.segments[1].points[3].time = None
+        track.segments[1].points[4].time = datetime(2016, 7, 15, 9, 0, 4, 250000)
+        expected = positions(track)
+
+        rows = track.to_json()
+        arrays = track.to_json(arrays=True)
+        self.assertEqual(rows['segments'][1]['points'][4]['time'], '2016-07-15T09:00:04.250000')
+        self.assertEqual(
+            arrays['segments'][1]['points']['time'][:5],
+            [point['time'] for point in rows['segments'][1]['points'][:5]]
+        )
+        self.assertEqual(
+            rows['segments'][0]['points'][:5],
+            [point.to_json() for point in track.segments[0].points[:5]]
+        )
+
+        for json in [rows, arrays]:
+            for columnar in [False, True]:
+                loaded = Track.from_json(json, columnar=columnar, metrics=False)
+                self.assertEqual(positions(loaded), expected)
+                segment = loaded.segments[0]
+                self.assertEqual(segment.is_columnar(), columnar)
+                self.assertTrue(segment.metrics_pending)
+                self.assertEqual(segment.metrics_recomputed, 0)
+
+                segment.segment(20, 60)
+                self.assertFalse(segment.metrics_pending)
+                self.assertGreater(segment.metrics_recomputed, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,17 +3,41 @@ Track class
 """
 from copy import deepcopy
 from os.path import basename
+from cStringIO import StringIO
 from datetime import timedelta
 
-import gpxpy
 import numpy as np
 from rtree import index
 
 from .segment import Segment
+from .gpx import read_segments, write_gpx
+from .binary import write_segments as write_binary, read_segments as read_binary
+from .instrumentation import map_segments
+from .location import infer_locations, cluster_points, DEFAULT_CONCURRENCY, DEFAULT_TIMEOUT
 from .similarity import segment_similarity
+from .compression import SPT_MAX_WINDOW
 
 DEFAULT_FILE_NAME_FORMAT = "%Y-%m-%d"
 
+class SegmentCall(object):
+    """ Call of a `Segment` method, with fixed arguments
+
+    Unlike lambdas or bound methods, it can be pickled, so that segments
+    can be processed by a pool of processes
+
+    Attributes:
+        method (str): name of the method
+        args (tuple): positional arguments
+        kwargs (:obj:`dict`): keyword arguments
+    """
+    def __init__(self, method, *args, **kwargs):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self, segment):
+        return getattr(segment, self.method)(*self.args, **self.kwargs)
+
 class Track(object):
     """Collection of segments
 
@@ -58,45 +82,76 @@ class Track(object):
         else:
             return "EmptyTrack"
 
-    def remove_noise(self):
-        """ In-place removal of noise points
+    def _map_segments(self, stage, function, instrumentation, executor):
+        """ In-place application of a stage to each segment
+
+        See `instrumentation.map_segments`
 
+        Args:
+            stage (str): stage name
+            function (:obj:`SegmentCall`): receives a segment and returns the
+                resulting segment, or list of segments
+            instrumentation (:obj:`Instrumentation`): None to measure nothing
+            executor: None to process one segment at a time
         Returns:
             :obj:`Track`: self
         """
-        for segment in self.segments:
-            segment.remove_noise()
+        self.segments = map_segments(
+            stage, self.name, self.segments, function, instrumentation, executor
+        )
         return self
 
-    def smooth(self, strategy, noise):
+    def remove_noise(self, instrumentation=None, executor=None):
+        """ In-place removal of noise points
+
+        Args:
+            instrumentation (:obj:`Instrumentation`, optional): receives the
+                measures of the stage. Defaults to None
+            executor (optional): Processes segments concurrently, see
+                `instrumentation.map_segments`. Defaults to None
+        Returns:
+            :obj:`Track`: self
+        """
+        return self._map_segments(
+            'remove_noise', SegmentCall('remove_noise'), instrumentation, executor
+        )
+
+    def smooth(self, strategy, noise, instrumentation=None, executor=None):
         """ In-place smoothing of segments
 
+        Args:
+            instrumentation (:obj:`Instrumentation`, optional): receives the
+                measures of the stage. Defaults to None
+            executor (optional): Processes segments concurrently, see
+                `instrumentation.map_segments`. Defaults to None
         Returns:
             :obj:`Track`: self
         """
-        print noise
-        for segment in self.segments:
-            segment.smooth(noise, strategy)
-        return self
+        return self._map_segments(
+            'smooth', SegmentCall('smooth', noise, strategy), instrumentation, executor
+        )
 
-    def segment(self, eps, min_time):
+    def segment(self, eps, min_time, instrumentation=None, executor=None):
         """In-place segmentation of segments
 
         Spatio-temporal segmentation of each segment
         The number of segments may increse after this step
 
+        Args:
+            instrumentation (:obj:`Instrumentation`, optional): receives the
+                measures of the stage. Defaults to None
+            executor (optional): Processes segments concurrently, see
+                `instrumentation.map_segments`. Defaults to None
         Returns:
             This track
         """
-        new_segments = []
-        for segment in self.segments:
-            segmented = segment.segment(eps, min_time)
-            for seg in segmented:
-                new_segments.append(Segment(seg))
-        self.segments = new_segments
-        return self
+        return self._map_segments(
+            'segment', SegmentCall('split', eps, min_time), instrumentation, executor
+        )
 
-    def simplify(self, eps, max_dist_error, max_speed_error, topology_only=False):
+    def simplify(self, eps, max_dist_error, max_speed_error, topology_only=False,
+                 strategy=None, instrumentation=None, executor=None,
+                 max_window=SPT_MAX_WINDOW):
         """ In-place simplification of segments
 
         Args:
@@ -107,22 +162,44 @@ class Track(object):
                 accuracy (use common Douglas-Ramen-Peucker).
                 False (default) to simplify segments keeping
                 the velocity between points.
+            strategy (str, optional): Compression algorithm to use, see
+                `Segment.simplify`
+            instrumentation (:obj:`Instrumentation`, optional): receives the
+                measures of the stage. Defaults to None
+            executor (optional): Processes segments concurrently, see
+                `instrumentation.map_segments`. Defaults to None
+            max_window (int, optional): Max number of points spanned by two
+                consecutive kept points, see `Segment.simplify`. It changes
+                the output on long segments. None for no limit. Defaults to
+                SPT_MAX_WINDOW
         Returns:
             This track
         """
-        for segment in self.segments:
-            segment.simplify(eps, max_dist_error, max_speed_error, topology_only)
-        return self
-
-    def infer_transportation_mode(self, clf, min_time):
+        return self._map_segments(
+            'simplify',
+            SegmentCall(
+                'simplify', eps, max_dist_error, max_speed_error, topology_only, strategy,
+                max_window
+            ),
+            instrumentation,
+            executor
+        )
+
+    def infer_transportation_mode(self, clf, min_time, executor=None):
         """In-place transportation mode inferring of segments
 
+        Args:
+            executor (optional): Processes segments concurrently, see
+                `instrumentation.map_segments`. Defaults to None
         Returns:
             This track
         """
-        for segment in self.segments:
-            segment.infer_transportation_mode(clf, min_time)
-        return self
+        return self._map_segments(
+            'infer_transportation_mode',
+            SegmentCall('infer_transportation_mode', clf, min_time),
+            None,
+            executor
+        )
 
     def copy(self):
         """Creates a deep copy of itself
@@ -144,7 +221,9 @@ class Track(object):
             seg_min_time,
             simplify,
             simplify_max_dist_error,
-            simplify_max_speed_error
+            simplify_max_speed_error,
+            instrumentation=None,
+            executor=None
         ):
         """In-place, transformation of a track into a trip
 
@@ -164,27 +243,35 @@ class Track(object):
         Args:
             name: An optional string with the name of the trip. If
                 none is given, one will be generated by generateName
+            instrumentation (:obj:`Instrumentation`, optional): receives the
+                measures of each stage, for every segment and for the whole
+                track. Defaults to None, to measure nothing
+            executor (optional): Processes the segments of each stage
+                concurrently, see `instrumentation.map_segments`. Defaults
+                to None
         Returns:
             This Track instance
         """
 
-        self.compute_metrics()
-        self.remove_noise()
+        self.compute_metrics(instrumentation, executor)
+        self.remove_noise(instrumentation, executor)
 
-        print (smooth, seg, simplify)
         if smooth:
-            self.compute_metrics()
-            self.smooth(smooth_strategy, smooth_noise)
+            self.compute_metrics(instrumentation, executor)
+            self.smooth(smooth_strategy, smooth_noise, instrumentation, executor)
 
         if seg:
-            self.compute_metrics()
-            self.segment(seg_eps, seg_min_time)
+            self.compute_metrics(instrumentation, executor)
+            self.segment(seg_eps, seg_min_time, instrumentation, executor)
 
         if simplify:
-            self.compute_metrics()
-            self.simplify(0, simplify_max_dist_error, simplify_max_speed_error)
+            self.compute_metrics(instrumentation, executor)
+            self.simplify(
+                0, simplify_max_dist_error, simplify_max_speed_error,
+                instrumentation=instrumentation, executor=executor
+            )
 
-        self.compute_metrics()
+        self.compute_metrics(instrumentation, executor)
 
         return self
 
@@ -200,7 +287,6 @@ class Track(object):
             ]
         return self
 
-    # TODO
     def infer_location(
             self,
             location_query,
@@ -208,35 +294,68 @@ class Track(object):
             google_key,
             foursquare_client_id,
             foursquare_client_secret,
-            limit
+            limit,
+            concurrency=DEFAULT_CONCURRENCY,
+            timeout=DEFAULT_TIMEOUT,
+            stats=None
         ):
         """In-place location inferring of segments
 
+        The starts and ends of the segments are clustered, as the end of a
+        segment is usually where the next one starts. The location of each
+        cluster is inferred once, at its centroid, which is within
+        max_distance of every endpoint of the cluster, and shared by its
+        endpoints. Locations are
+        inferred at once, see `location.infer_locations`
+
+        Args:
+            concurrency (int, optional): Max place provider queries at once.
+                Defaults to DEFAULT_CONCURRENCY
+            timeout (float, optional): Seconds to wait for each place
+                provider query. Defaults to DEFAULT_TIMEOUT
+            stats (:obj:`location.LookupStats`, optional): Counters to
+                update, such as the number of lookups saved. Defaults to None
         Returns:
             This track
         """
-        self.segments = [
-            segment.infer_location(
-                location_query,
-                max_distance,
-                google_key,
-                foursquare_client_id,
-                foursquare_client_secret,
-                limit
-            )
-            for segment in self.segments
-            ]
+        endpoints = []
+        for segment in self.segments:
+            endpoints.extend([segment.points[0], segment.points[-1]])
+        centroids, clusters = cluster_points(endpoints, max_distance)
+
+        locations = infer_locations(
+            centroids,
+            location_query,
+            max_distance,
+            google_key,
+            foursquare_client_id,
+            foursquare_client_secret,
+            limit,
+            concurrency,
+            timeout,
+            stats
+        )
+        if stats is not None:
+            stats.points += len(endpoints)
+            stats.lookups += len(centroids)
+
+        for i, segment in enumerate(self.segments):
+            segment.location_from = locations[clusters[2 * i]]
+            segment.location_to = locations[clusters[2 * i + 1]]
         return self
 
-    def to_json(self):
+    def to_json(self, arrays=False):
         """Converts track to a JSON serializable format
 
+        Args:
+            arrays (bool, optional): True to write the points of each segment
+                as arrays, see `Segment.to_json`. Defaults to False
         Returns:
             Map with the name, and segments of the track.
         """
         return {
             'name': self.name,
-            'segments': [segment.to_json() for segment in self.segments],
+            'segments': [segment.to_json(arrays) for segment in self.segments],
             'meta': self.meta
             }
 
@@ -352,50 +471,48 @@ class Track(object):
 
         return np.mean(final_siml), final_diff
 
-    def compute_metrics(self):
+    def compute_metrics(self, instrumentation=None, executor=None):
         """ Computes metrics for every segment's point
 
         See Segment.compute_metrics
 
+        Args:
+            instrumentation (:obj:`Instrumentation`, optional): receives the
+                measures of the stage. Defaults to None
+            executor (optional): Processes segments concurrently, see
+                `instrumentation.map_segments`. Defaults to None
         Returns:
             :obj:`Track`: Self
         """
-        for segment in self.segments:
-            segment.compute_metrics()
-        return self
+        return self._map_segments(
+            'compute_metrics', SegmentCall('compute_metrics'), instrumentation, executor
+        )
 
     def to_gpx(self):
         """Converts track to a GPX format
 
-        Uses GPXPY library as an intermediate format
+        See `write_gpx`
 
         Returns:
             A string with the GPX/XML track
         """
-        gpx_segments = []
-        for segment in self.segments:
-            gpx_points = []
-            for point in segment.points:
-                time = ''
-                if point.time:
-                    iso_time = point.time.isoformat().split('.')[0]
-                    time = '<time>%s</time>' % iso_time
-                gpx_points.append(
-                    u'<trkpt lat="%f" lon="%f">%s</trkpt>' % (point.lat, point.lon, time)
-                )
-            points = u'\n\t\t\t'.join(gpx_points)
-            gpx_segments.append(u'\t\t<trkseg>\n\t\t\t%s\n\t\t</trkseg>' % points)
-        segments = u'\t\n'.join(gpx_segments)
-        content = [
-            u'<?xml version="1.0" encoding="UTF-8"?>',
-            u'<gpx xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns="http://www.topografix.com/GPX/1/0" xsi:schemaLocation="http://www.topografix.com/GPX/1/0 http://www.topografix.com/GPX/1/0/gpx.xsd" version="1.0" creator="GatherMySteps">',
-            u'\t<trk>',
-            segments,
-            u'\t</trk>',
-            u'</gpx>'
-        ]
-
-        return u'\n'.join(content)
+        output = StringIO()
+        self.write_gpx(output)
+        return output.getvalue().decode('utf-8')
+
+    def write_gpx(self, fileobj):
+        """ Writes the track in GPX format to a file
+
+        Points are written as they are formated, in chunks, see
+        `gpx.write_gpx`
+
+        Args:
+            fileobj (file): file-like object to write to
+        Returns:
+            :obj:`Track`: self
+        """
+        write_gpx(fileobj, self.segments)
+        return self
 
     def timezone(self, timezone=0):
         """ Sets the timezone of the entire track
@@ -502,26 +619,25 @@ class Track(object):
         return buff
 
     @staticmethod
-    def from_gpx(file_path):
+    def from_gpx(file_path, columnar=False):
         """ Creates a Track from a GPX file.
 
-        No preprocessing is done.
+        No preprocessing is done. The file is read as a stream, see
+        `gpx.read_segments`
 
         Arguments:
             file_path (str): file path and name to the GPX file
+            columnar (bool, optional): True to store the points of the
+                segments in columnar arrays. Defaults to False
         Return:
             :obj:`list` of :obj:`Track`
         """
-        gpx = gpxpy.parse(open(file_path, 'r'))
+        gpx_tracks = read_segments(file_path, columnar)
         file_name = basename(file_path)
 
         tracks = []
-        for i, track in enumerate(gpx.tracks):
-            segments = []
-            for segment in track.segments:
-                segments.append(Segment.from_gpx(segment))
-
-            if len(gpx.tracks) > 1:
+        for i, segments in enumerate(gpx_tracks):
+            if len(gpx_tracks) > 1:
                 name = file_name + "_" + str(i)
             else:
                 name = file_name
@@ -529,16 +645,60 @@ class Track(object):
 
         return tracks
 
+    def to_binary(self, file_path, metrics=True):
+        """ Writes the track in binary format
+
+        See `binary` module
+
+        Args:
+            file_path (str): path of the file to write
+            metrics (bool, optional): True to also store the metrics of the
+                points. Defaults to True
+        Returns:
+            :obj:`Track`: self
+        """
+        write_binary(file_path, self.name, self.meta, self.segments, metrics)
+        return self
+
+    @staticmethod
+    def from_binary(file_path, columnar=True):
+        """ Creates a Track from a binary file
+
+        No preprocessing is done. The points are memory mapped, see
+        `binary.read_segments`
+
+        Arguments:
+            file_path (str): path of the binary file
+            columnar (bool, optional): True to keep the points in columnar,
+                memory mapped, arrays. Defaults to True
+        Return:
+            :obj:`Track`
+        """
+        name, meta, segments = read_binary(file_path, columnar)
+        track = Track(name, segments)
+        track.meta = meta
+        return track
+
     @staticmethod
-    def from_json(json):
+    def from_json(json, columnar=False, metrics=True):
         """Creates a Track from a JSON file.
 
         No preprocessing is done.
 
         Arguments:
             json: map with the keys: name (optional) and segments.
+            columnar (bool, optional): True to store the points in columnar
+                arrays, see `Segment.to_columnar`. Defaults to False
+            metrics (bool, optional): True to compute the metrics right away.
+                False to compute them only when first needed, see
+                `Segment.defer_metrics`. Defaults to True
         Return:
             A track instance
         """
-        segments = [Segment.from_json(s) for s in json['segments']]
-        return Track(json['name'], segments).compute_metrics()
+        segments = [Segment.from_json(s, columnar) for s in json['segments']]
+        track = Track(json['name'], segments)
+        if metrics:
+            return track.compute_metrics()
+        for segment in segments:
+            segment.defer_metrics()
+        return track